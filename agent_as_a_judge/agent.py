@@ -2,7 +2,6 @@ import io
 import os
 import time
 import json
-import pickle
 import logging
 from pathlib import Path
 from dataclasses import dataclass
@@ -17,8 +16,12 @@ from rich.panel import Panel
 from rich.emoji import Emoji
 
 from agent_as_a_judge.module.code_search import DevCodeSearch
+from agent_as_a_judge.module.embedding_service import get_embedding_service
 from agent_as_a_judge.module.read import DevRead
 from agent_as_a_judge.module.graph import DevGraph
+from agent_as_a_judge.module.index import DevIndexer, TRAJECTORY_ARTIFACTS
+from agent_as_a_judge.module.repo_map import RepoMap
+from agent_as_a_judge.module.scanner import display_structure
 from agent_as_a_judge.module.ask import DevAsk
 from agent_as_a_judge.module.locate import DevLocate
 from agent_as_a_judge.module.text_retrieve import DevTextRetrieve
@@ -67,16 +70,12 @@ class JudgeAgent:
             judge_dir, os.path.basename(os.path.normpath(self.workspace))
         )
         self.judge_workspace.mkdir(parents=True, exist_ok=True)
-        self.graph_file = self.judge_workspace / "graph.pkl"
-        self.tags_file = self.judge_workspace / "tags.json"
+        self.graph_file = self.aaaj_indexer.graph_file
+        self.tags_file = self.aaaj_indexer.tags_file
         self.structure_file = self.judge_workspace / "tree_structure.json"
 
-        if (
-            not self.graph_file.exists()
-            or not self.tags_file.exists()
-            or not self.structure_file.exists()
-        ):
-            self.construct_graph()
+        # Build the codebase graph, or reuse it from the artifact store
+        self.aaaj_indexer.ensure_graph()
 
         self.structure = self.aaaj_search.load_structure()
         self.judge_stats = []
@@ -86,14 +85,6 @@ class JudgeAgent:
         # instance_data = self._load_instance_data()
         # self.aaaj_memory = Memory(self.judge_dir / f"{instance_data['name']}.json")
 
-        # Construct the codebase graph if not already saved
-        if (
-            not self.graph_file.exists()
-            or not self.tags_file.exists()
-            or not self.structure_file.exists()
-        ):
-            self.construct_graph()
-
     @property
     def aaaj_graph(self):
         if not hasattr(self, "_aaaj_graph"):
@@ -102,17 +93,50 @@ class JudgeAgent:
                 include_dirs=self.config.include_dirs,
                 exclude_dirs=self.config.exclude_dirs,
                 exclude_files=self.config.exclude_files,
+                manifest=self.aaaj_indexer.manifest,
+                respect_gitignore=self.config.respect_gitignore,
+                max_file_size=self.config.max_file_size,
             )
         return self._aaaj_graph
 
+    @property
+    def aaaj_indexer(self):
+        if not hasattr(self, "_aaaj_indexer"):
+            self._aaaj_indexer = DevIndexer(
+                self.workspace, self.judge_dir, self.config, self.trajectory_file
+            )
+        return self._aaaj_indexer
+
     @property
     def aaaj_search(self):
         if not hasattr(self, "_aaaj_search"):
+            store = self.aaaj_indexer.store
             self._aaaj_search = DevCodeSearch(
-                str(self.judge_workspace), self.config.setting
+                str(self.judge_workspace),
+                self.config.setting,
+                artifact_store=store,
+                artifact_key=self.aaaj_indexer.search_key if store else None,
+                shard_cache_mb=self.config.shard_cache_mb,
+                embedding_model_name=self.config.embedding_model,
+                embedding_backend=self.config.embedding_backend,
+                vector_index=self.config.vector_index,
+                vector_dtype=self.config.vector_dtype,
             )
         return self._aaaj_search
 
+    @property
+    def aaaj_repo_map(self):
+        # A sharded search swaps its tags whenever it focuses on other packages
+        if getattr(self, "_aaaj_repo_map_tags", None) is not self.aaaj_search.tags:
+            self._aaaj_repo_map_tags = self.aaaj_search.tags
+            self._aaaj_repo_map = RepoMap.from_tag_store(
+                self.aaaj_graph,
+                self.aaaj_search.tags,
+                files=self._listed_files(),
+                model=self.llm.model_name,
+            )
+        return self._aaaj_repo_map
+
     @property
     def aaaj_read(self):
         if not hasattr(self, "_aaaj_read"):
@@ -146,7 +170,13 @@ class JudgeAgent:
     @property
     def aaaj_retrieve(self):
         if not hasattr(self, "_aaaj_retrieve"):
-            self._aaaj_retrieve = DevTextRetrieve(str(self.trajectory_file))
+            self.aaaj_indexer.fetch("trajectory", TRAJECTORY_ARTIFACTS)
+            self._aaaj_retrieve = DevTextRetrieve(
+                str(self.trajectory_file),
+                index_dir=str(self.judge_workspace),
+                embedding_model_name=self.config.embedding_model,
+                embedding_backend=self.config.embedding_backend,
+            )
         return self._aaaj_retrieve
 
     @staticmethod
@@ -177,6 +207,7 @@ class JudgeAgent:
                     "workspace",
                     "locate",
                     "read",
+                    "graph",
                     "search",
                     "history",
                     "trajectory",
@@ -189,6 +220,7 @@ class JudgeAgent:
 
             if self.config.setting == "black_box" and "trajectory" in workflow:
                 workflow.remove("trajectory")
+            self._warm_up_embeddings(workflow)
 
             llm_stats, total_time = self.check_requirement(
                 criteria, workflow, user_query=user_query
@@ -219,6 +251,7 @@ class JudgeAgent:
     def ask_anything(self, question: str):
 
         workflow = ["workspace", "locate", "read", "search"]
+        self._warm_up_embeddings(workflow)
         llm_stats, start_time = self.check_requirement(
             criteria=question, workflow=workflow, user_query=question
         )
@@ -229,6 +262,14 @@ class JudgeAgent:
         total_time = time.time() - start_time
         return answer
 
+    def _warm_up_embeddings(self, workflow: list):
+        """Load the embedding model while the steps before the search run."""
+
+        if "search" in workflow:
+            get_embedding_service(
+                self.config.embedding_model, backend=self.config.embedding_backend
+            ).warm_up()
+
     def check_requirement(self, criteria: str, workflow: list, user_query: str):
 
         start_time = time.time()
@@ -240,6 +281,7 @@ class JudgeAgent:
         }
         combined_evidence = ""
         related_files = []
+        self.aaaj_search.focus(criteria)
 
         workspace_info = truncate_string(
             self.display_tree(), model=self.llm.model_name, max_tokens=2000
@@ -258,12 +300,20 @@ class JudgeAgent:
                 combined_evidence += (
                     f">>> [Key Evidence] Workspace Structure:\n\n{workspace_info}\n\n"
                 )
+                # The files and definitions most relevant to the criteria, which
+                # the tree may have cut
+                repo_map = self.aaaj_repo_map.get_map(criteria, max_tokens=2000)
+                if repo_map:
+                    combined_evidence += (
+                        f">>> [Key Evidence] Relevant Code:\n\n{repo_map}\n\n"
+                    )
                 # logging.info(f">>> [Key Evidence] Workspace Structure:\n\n{workspace_info}\n\n")
 
             elif info_type == "locate":
                 locate_result = self.locate_file(criteria, workspace_info)
                 related_files = locate_result["file_paths"]
                 total_llm_stats.update(locate_result["llm_stats"])
+                self.aaaj_search.focus(criteria, related_files)
                 logging.info(
                     f">>> [Reference] Located Files:\n\n{locate_result['file_paths']}\n\n"
                 )
@@ -278,6 +328,16 @@ class JudgeAgent:
                     if llm_stats:
                         total_llm_stats.update(llm_stats)
 
+            elif info_type == "graph" and related_files:
+                graph_evidence = self.aaaj_search.graph_evidence(
+                    related_files, model=self.llm.model_name
+                )
+                if graph_evidence:
+                    combined_evidence += f">>> [Key Evidence] Code Reachable from Located Files:\n\n{graph_evidence}\n\n"
+                    logging.info(
+                        f">>> [Key Evidence] Code Reachable from Located Files:\n\n{graph_evidence}\n\n"
+                    )
+
             elif info_type == "search":
                 search_list = self.aaaj_search.search(criteria, search_type="embedding")
                 for search_context in search_list:
@@ -324,10 +384,7 @@ class JudgeAgent:
 
     def construct_graph(self):
 
-        filepaths = self.aaaj_graph.list_py_files([str(self.workspace)])
-        tags, graph = self.aaaj_graph.build(filepaths) if filepaths else (None, None)
-        self._save_graph_and_tags(graph, tags)
-        self._save_file_structure()
+        self.aaaj_indexer.index_graph()
 
     def display_tree(self, max_depth: int = None) -> str:
 
@@ -347,7 +404,7 @@ class JudgeAgent:
                     tree.add(file_label)
 
         tree = Tree("[bold blue]Project Structure[/bold blue]")
-        add_branch(tree, self.structure["tree_structure"], current_depth=0)
+        add_branch(tree, display_structure(self.structure), current_depth=0)
 
         metadata = Text.from_markup(
             f"[bold cyan]Workspace Path:[/bold cyan] [bold white]{self.workspace}[/bold white]\n"
@@ -373,64 +430,85 @@ class JudgeAgent:
             console.print(combined_panel, soft_wrap=True)
             return console.export_text()
 
-    def _save_graph_and_tags(self, graph, tags):
-
-        logging.info("Saving the graph and tags...")
-        with open(self.graph_file, "wb") as f:
-            pickle.dump(graph, f)
-        with open(self.tags_file, "w") as f:
-            json.dump(
-                (
-                    [
-                        {
-                            "fname": tag.fname,
-                            "rel_fname": tag.rel_fname,
-                            "line_number": tag.line,
-                            "name": tag.name,
-                            "identifier": tag.identifier,
-                            "category": tag.category,
-                            "details": tag.details,
-                        }
-                        for tag in tags
-                    ]
-                    if tags
-                    else {}
-                ),
-                f,
-                indent=4,
-            )
+    def _listed_files(self) -> list:
+        """The files the tree structure lists, the samples of summarised ones too."""
 
-    def _save_file_structure(self):
+        return [
+            name if directory == "." else f"{directory}/{name}"
+            for directory, names in self.structure.get("tree_structure", {}).items()
+            for name in names
+        ]
 
-        def build_tree_structure(current_path):
-            tree = {}
-            for root, dirs, files in os.walk(current_path):
-                dirs[:] = [
-                    d
-                    for d in dirs
-                    if not any(excluded in d for excluded in self.config.exclude_dirs)
-                ]
-                relative_root = os.path.relpath(root, self.workspace)
-                tree[relative_root] = {
-                    file: None
-                    for file in files
-                    if not file.startswith(".")
-                    and file not in self.config.exclude_files
-                }
-            return tree
-
-        tree_structure = build_tree_structure(self.workspace)
-        self.workspace_info = {
-            "workspace": str(self.workspace),
-            "tree_structure": tree_structure,
+    def locate_file(self, criteria: str, workspace_info: str) -> dict:
+
+        result = self.aaaj_locate.locate_file(criteria, workspace_info)
+        expansion = self._expand_collapsed(result["file_paths"], criteria)
+        if not expansion:
+            return result
+
+        # The located paths lie in summarised directories: locate again with
+        # their files listed
+        logging.info("Expanding the summarised directories of the located paths")
+        expanded = self.aaaj_locate.locate_file(
+            criteria,
+            f"{workspace_info}\n\nFiles of summarised directories:\n\n{expansion}",
+        )
+        llm_stats = dict(expanded["llm_stats"])
+        for key in ("cost", "inference_time", "input_tokens", "output_tokens"):
+            llm_stats[key] += result["llm_stats"][key]
+        return {
+            "file_paths": expanded["file_paths"] or result["file_paths"],
+            "llm_stats": llm_stats,
         }
-        save_path = self.judge_workspace / "tree_structure.json"
-        with open(save_path, "w", encoding="utf-8") as f:
-            json.dump(self.workspace_info, f, indent=4)
 
-    def locate_file(self, criteria: str, workspace_info: str) -> dict:
+    def _expand_collapsed(self, file_paths: list, criteria: str) -> str:
+        """The files of the summarised directories the paths point into."""
+
+        collapsed = self.structure.get("collapsed") or {}
+        directories = []
+        for file_path in file_paths:
+            directory = self._collapsed_directory(file_path, collapsed)
+            if directory is not None and directory not in directories:
+                directories.append(directory)
+
+        sections = []
+        for directory in directories:
+            files = self.aaaj_indexer.manifest.expand(directory, criteria)
+            sections.append(
+                "\n".join(
+                    [f"{os.path.join(self.workspace, directory)}:"]
+                    + [os.path.join(self.workspace, file) for file in files]
+                )
+            )
+        return truncate_string(
+            "\n\n".join(sections), model=self.llm.model_name, max_tokens=2000
+        )
 
-        return self.aaaj_locate.locate_file(criteria, workspace_info)
+    def _collapsed_directory(self, file_path: str, collapsed: dict):
+        """The summarised directory hiding a path, or the path if it is one."""
+
+        relative = os.path.normpath(
+            os.path.relpath(file_path, self.workspace)
+            if os.path.isabs(file_path)
+            else file_path
+        ).replace(os.sep, "/")
+        if relative in collapsed:
+            return relative
+        if relative.startswith(".."):
+            return None
+        parts = relative.split("/")
+        for depth in range(len(parts) - 1, -1, -1):
+            ancestor = "/".join(parts[:depth]) or "."
+            summary = collapsed.get(ancestor)
+            if summary is None:
+                continue
+            # A file of the directory not among its samples, or anything
+            # beneath a directory summarised with its subdirectories
+            if depth == len(parts) - 1 and parts[-1] not in summary["samples"]:
+                return ancestor
+            if summary.get("folded"):
+                return ancestor
+        return None
 
     def display_judgment(
         self, criteria: str, satisfied: bool, reason: str, logger: logging.Logger
@@ -14,6 +14,32 @@ class AgentConfig:
     workspace_dir: Optional[Path] = None
     instance_dir: Optional[Path] = None
     trajectory_file: Optional[Path] = None
+    artifact_store: Optional[Path] = None
+    # Also write the tags as indented JSON, for debugging
+    export_tags_json: bool = False
+    # Skip the paths matched by the workspace's .gitignore files. Off by default:
+    # agents often ignore their own outputs, which the judge must see
+    respect_gitignore: bool = False
+    # Files above this many bytes are listed but not parsed (None for the default)
+    max_file_size: Optional[int] = None
+    # Directories with more entries are summarised in the tree structure (0 for
+    # no limit)
+    max_dir_entries: int = 100
+    # Sentence embedding model, a hub name or local path (None for the
+    # AAAJ_EMBEDDING_MODEL environment variable, else all-MiniLM-L6-v2)
+    embedding_model: Optional[str] = None
+    # "torch", or "onnx" for int8 inference with onnxruntime on CPU (None for the
+    # AAAJ_EMBEDDING_BACKEND environment variable, else torch)
+    embedding_backend: Optional[str] = None
+    # Vector index of semantic code search: "exact", "ivf" (approximate) or
+    # "auto" (exact), over "float32", "float16" or "int8" vectors ("auto" for
+    # float32 in an exact index and float16 in an IVF one)
+    vector_index: str = "auto"
+    vector_dtype: str = "auto"
+    # Split the graph and tags by top-level package, loading packages on demand
+    shard_graph: bool = False
+    # Memory for the packages loaded at once from a sharded graph
+    shard_cache_mb: int = 512
 
     @classmethod
     def from_args(cls, args):
@@ -40,4 +66,19 @@ class AgentConfig:
             trajectory_file=(
                 Path(args.trajectory_file) if args.trajectory_file else None
             ),
+            artifact_store=(
+                Path(args.artifact_store)
+                if getattr(args, "artifact_store", None)
+                else None
+            ),
+            export_tags_json=getattr(args, "export_tags_json", False),
+            respect_gitignore=getattr(args, "respect_gitignore", False),
+            max_file_size=getattr(args, "max_file_size", None),
+            max_dir_entries=getattr(args, "max_dir_entries", 100),
+            embedding_model=getattr(args, "embedding_model", None),
+            embedding_backend=getattr(args, "embedding_backend", None),
+            vector_index=getattr(args, "vector_index", "auto"),
+            vector_dtype=getattr(args, "vector_dtype", "auto"),
+            shard_graph=getattr(args, "shard_graph", False),
+            shard_cache_mb=getattr(args, "shard_cache_mb", 512),
         )
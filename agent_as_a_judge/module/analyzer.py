@@ -0,0 +1,484 @@
+"""
+FileAnalyzer: everything DevGraph needs from a source file, in a single pass.
+
+The file is read once and parsed once with `ast`. One walk over the tree gives
+the structure (classes with their methods, and functions, as line spans),
+the imports that decide which names belong to libraries, and the definitions
+and calls the code graph is built from. Files that `ast` cannot parse (Python 2
+code, syntax errors) are parsed with tree-sitter instead, which recovers from
+errors but yields no structure or imports.
+"""
+
+import ast
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Tuple
+
+from tree_sitter_languages import get_language, get_parser
+
+from agent_as_a_judge.module.structure import (
+    EMPTY_STRUCTURE,
+    FileStructure,
+    Span,
+    decode_lines,
+    line_offsets,
+)
+
+
+# Definitions and calls, as captured by DevGraph's former tree-sitter query
+PYTHON_QUERY = """
+(class_definition
+name: (identifier) @name.definition.class) @definition.class
+
+(function_definition
+name: (identifier) @name.definition.function) @definition.function
+
+(call
+function: [
+    (identifier) @name.reference.call
+    (attribute
+        attribute: (identifier) @name.reference.call)
+]) @reference.call
+"""
+
+IDENTIFIER_QUERY = "(identifier) @name"
+
+
+# Kinds of the block events that make up the structure and the imports
+FUNCTION = 0
+ASYNC_FUNCTION = 1
+CLASS = 2
+IMPORT = 3
+
+
+@dataclass
+class Block:
+    """
+    One or more top-level statements sharing lines, and what a walk over them
+    found, with rows relative to the first line of the block.
+    """
+
+    # 0-based rows of the first and last line, decorators included
+    start_row: int
+    end_row: int
+    # (row, column, name, "def" or "ref")
+    symbols: List[Tuple[int, int, str, str]] = field(default_factory=list)
+    # (depth, row, column, kind, data) for every definition and import
+    events: List[tuple] = field(default_factory=list)
+    # (row, name), once the identifiers of the block were needed
+    names: Optional[List[Tuple[int, str]]] = None
+
+    def moved(self, rows: int) -> "Block":
+
+        if rows == 0:
+            return self
+        return replace(
+            self, start_row=self.start_row + rows, end_row=self.end_row + rows
+        )
+
+
+@dataclass
+class FileAnalysis:
+    # The file as read, and the byte offset of every line start plus its end
+    source: bytes
+    offsets: List[int]
+    structure: FileStructure = EMPTY_STRUCTURE
+    # (module, imported name or None for `import module`, relative level)
+    imports: List[Tuple[Optional[str], Optional[str], int]] = field(
+        default_factory=list
+    )
+    # (row, name, "def" or "ref") for every definition and call, in source
+    # order; rows are 0-based, unlike the 1-based lines of the structure
+    symbols: List[Tuple[int, str, str]] = field(default_factory=list)
+    # (row, name) for every identifier in source order, only filled for files
+    # with definitions but no calls, whose tags fall back to the names they use
+    names: List[Tuple[int, str]] = field(default_factory=list)
+    error: Optional[str] = None
+    # The top-level statements of files parsed with `ast`, for reanalysis
+    blocks: Optional[List[Block]] = None
+
+    def line(self, row: int) -> str:
+        """A 0-based source line, without its line ending."""
+
+        return decode_lines(self.source[self.offsets[row] : self.offsets[row + 1]])
+
+    def text(self, span: Span) -> str:
+
+        return decode_lines(self.source[span.start_byte : span.end_byte])
+
+
+def analyze_file(filepath: str) -> FileAnalysis:
+
+    with open(filepath, "rb") as f:
+        return analyze_source(f.read())
+
+
+def analyze_source(source) -> FileAnalysis:
+    """Analyze the bytes (or text) of a Python file."""
+
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    analysis = FileAnalysis(source, line_offsets(source))
+    code = decode_lines(source[analysis.offsets[0] :])
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+        analysis.error = repr(e)
+        _analyze_tree_sitter(code, analysis)
+        return analysis
+
+    _analyze_tree(tree, analysis)
+    return analysis
+
+
+def reanalyze_source(previous: FileAnalysis, source) -> FileAnalysis:
+    """
+    Analyze a new version of a file from the analysis of the previous one. The
+    edit is the byte range where the two versions differ, as in tree-sitter's
+    InputEdit; only the top-level statements it touches are parsed again, the
+    others are reused and moved by the number of lines the edit added. The
+    result is the same as `analyze_source(source)`, which it falls back to
+    when the edited statements do not parse on their own.
+    """
+
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if source == previous.source:
+        return previous
+    if previous.blocks is None:
+        return analyze_source(source)
+
+    old = previous.source
+    start = _common_prefix(old, source)
+    suffix = _common_prefix(old[start:][::-1], source[start:][::-1])
+    old_end = len(old) - suffix
+    new_end = len(source) - suffix
+
+    old_offsets = previous.offsets
+    offsets = line_offsets(source)
+    # Statements ending before the edit and starting after it are kept; those
+    # touching it, including the ones right next to it, are parsed again
+    head = [
+        block for block in previous.blocks if old_offsets[block.end_row + 1] < start
+    ]
+    tail = [
+        block
+        for block in previous.blocks[len(head) :]
+        if old_offsets[block.start_row] > old_end
+    ]
+    region_start = old_offsets[head[-1].end_row + 1] if head else offsets[0]
+    region_end = (
+        old_offsets[tail[0].start_row] + new_end - old_end if tail else len(source)
+    )
+    try:
+        tree = ast.parse(decode_lines(source[region_start:region_end]))
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return analyze_source(source)
+
+    region_row = bisect_left(offsets, region_start)
+    tail_row = bisect_left(offsets, region_end)
+    shift = tail_row - tail[0].start_row if tail else 0
+    blocks = head + _blocks(tree.body, region_row)
+    blocks += [block.moved(shift) for block in tail]
+
+    analysis = FileAnalysis(source, offsets, blocks=blocks)
+    _assemble(analysis)
+    if _needs_names(analysis.symbols):
+        _assign_names(blocks, _tree_names(tree), region_row)
+        analysis.names = _block_names(analysis)
+    return analysis
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    low, high = 0, n
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _analyze_tree(tree: ast.AST, analysis: FileAnalysis):
+
+    analysis.blocks = _blocks(tree.body, 0)
+    _assemble(analysis)
+    if _needs_names(analysis.symbols):
+        _assign_names(analysis.blocks, _tree_names(tree), 0)
+        analysis.names = _block_names(analysis)
+
+
+def _blocks(statements: List[ast.stmt], row: int) -> List[Block]:
+    """
+    Group top-level statements into blocks of whole lines, and walk each block
+    once, breadth first like ast.walk. `row` is the row of the first line of
+    the parsed code in the file.
+    """
+
+    groups = []
+    for statement in statements:
+        first = min(
+            [statement.lineno]
+            + [node.lineno for node in getattr(statement, "decorator_list", ())]
+        )
+        if groups and first - 1 <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], statement.end_lineno - 1)
+            groups[-1][2].append(statement)
+        else:
+            groups.append([first - 1, statement.end_lineno - 1, [statement]])
+
+    blocks = []
+    for first, last, group in groups:
+        block = Block(row + first, row + last)
+        # Rows relative to the block, so that moving it is free
+        base = first + 1
+        todo = deque((statement, 1) for statement in group)
+        while todo:
+            node, depth = todo.popleft()
+            todo.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+            node_type = type(node)
+            if node_type is ast.Call:
+                func = node.func
+                if type(func) is ast.Name:
+                    block.symbols.append(
+                        (func.lineno - base, func.col_offset, func.id, "ref")
+                    )
+                elif type(func) is ast.Attribute:
+                    # The attribute name ends the expression
+                    column = func.end_col_offset - len(func.attr)
+                    block.symbols.append(
+                        (func.end_lineno - base, column, func.attr, "ref")
+                    )
+
+            elif node_type is ast.FunctionDef or node_type is ast.AsyncFunctionDef:
+                block.symbols.append(
+                    (node.lineno - base, node.col_offset, node.name, "def")
+                )
+                block.events.append(
+                    (
+                        depth,
+                        node.lineno - base,
+                        node.col_offset,
+                        FUNCTION if node_type is ast.FunctionDef else ASYNC_FUNCTION,
+                        (node.name, node.end_lineno - base),
+                    )
+                )
+
+            elif node_type is ast.ClassDef:
+                block.symbols.append(
+                    (node.lineno - base, node.col_offset, node.name, "def")
+                )
+                methods = tuple(
+                    (item.name, item.lineno - base, item.end_lineno - base)
+                    for item in node.body
+                    if type(item) is ast.FunctionDef
+                )
+                block.events.append(
+                    (
+                        depth,
+                        node.lineno - base,
+                        node.col_offset,
+                        CLASS,
+                        (node.name, node.end_lineno - base, methods),
+                    )
+                )
+
+            elif node_type is ast.Import:
+                imports = tuple((alias.name, None, 0) for alias in node.names)
+                block.events.append(
+                    (depth, node.lineno - base, node.col_offset, IMPORT, imports)
+                )
+
+            elif node_type is ast.ImportFrom:
+                imports = tuple(
+                    (node.module, alias.name, node.level) for alias in node.names
+                )
+                block.events.append(
+                    (depth, node.lineno - base, node.col_offset, IMPORT, imports)
+                )
+        blocks.append(block)
+    return blocks
+
+
+def _assemble(analysis: FileAnalysis):
+    """
+    Put the blocks back together. Sorting the events by depth then position
+    gives the order of a breadth-first walk of the whole module, which decides
+    which functions count as methods, as it did when the module was walked
+    in one go.
+    """
+
+    offsets = analysis.offsets
+
+    def span(name, start_row, end_row, methods=()):
+        return Span(
+            name,
+            start_row + 1,
+            end_row + 1,
+            offsets[start_row],
+            offsets[end_row + 1],
+            methods,
+        )
+
+    symbols = []
+    events = []
+    for block in analysis.blocks:
+        row = block.start_row
+        symbols.extend(
+            (row + line, column, name, identifier)
+            for line, column, name, identifier in block.symbols
+        )
+        events.extend(
+            (depth, row + line, column, kind, row, data)
+            for depth, line, column, kind, data in block.events
+        )
+    events.sort(key=lambda event: event[:3])
+
+    classes = []
+    functions = []
+    class_methods = set()
+    for _, start_row, _, kind, row, data in events:
+        if kind == FUNCTION:
+            # Async functions are left out of the structure
+            name, end_line = data
+            if name not in class_methods:
+                functions.append(span(name, start_row, row + end_line))
+        elif kind == CLASS:
+            name, end_line, methods = data
+            classes.append(
+                span(
+                    name,
+                    start_row,
+                    row + end_line,
+                    tuple(
+                        span(method, row + start, row + end)
+                        for method, start, end in methods
+                    ),
+                )
+            )
+            class_methods.update(method for method, _, _ in methods)
+        elif kind == IMPORT:
+            analysis.imports.extend(data)
+
+    symbols.sort()
+    analysis.structure = FileStructure(tuple(classes), tuple(functions))
+    analysis.symbols = [(row, name, identifier) for row, _, name, identifier in symbols]
+
+
+def _assign_names(blocks: List[Block], names: List[Tuple[int, str]], row: int):
+    """Hand the names found in freshly parsed code to the blocks holding them."""
+
+    starts = [block.start_row for block in blocks]
+    fresh = defaultdict(list)
+    for name_row, name in names:
+        name_row += row
+        index = bisect_right(starts, name_row) - 1
+        fresh[index].append((name_row - starts[index], name))
+    for index, block_names in fresh.items():
+        blocks[index].names = block_names
+
+
+def _block_names(analysis: FileAnalysis) -> List[Tuple[int, str]]:
+    """The names of every block, parsing again the blocks that never kept theirs."""
+
+    names = []
+    for block in analysis.blocks:
+        if block.names is None:
+            start = analysis.offsets[block.start_row]
+            end = analysis.offsets[block.end_row + 1]
+            code = decode_lines(analysis.source[start:end])
+            block.names = _tree_names(ast.parse(code))
+        names.extend((block.start_row + row, name) for row, name in block.names)
+    return names
+
+
+def _needs_names(symbols: List[Tuple[int, str, str]]) -> bool:
+
+    identifiers = {identifier for _, _, identifier in symbols}
+    return "def" in identifiers and "ref" not in identifiers
+
+
+def _tree_names(tree: ast.AST) -> List[Tuple[int, str]]:
+    """Every identifier of the tree with its 0-based row, in source order."""
+
+    names = []
+    for node in ast.walk(tree):
+        node_type = type(node)
+        if node_type is ast.Name:
+            names.append((node.lineno, node.col_offset, node.id))
+        elif node_type is ast.Attribute:
+            column = node.end_col_offset - len(node.attr)
+            names.append((node.end_lineno, column, node.attr))
+        elif node_type is ast.arg or node_type is ast.keyword:
+            if node.arg:
+                names.append((node.lineno, node.col_offset, node.arg))
+        elif node_type in (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef):
+            names.append((node.lineno, node.col_offset, node.name))
+        elif node_type is ast.alias:
+            for name in node.name.split(".") + [node.asname]:
+                if name and name != "*":
+                    names.append((node.lineno, node.col_offset, name))
+        elif node_type is ast.ImportFrom and node.module:
+            for name in node.module.split("."):
+                names.append((node.lineno, node.col_offset, name))
+        elif node_type in (ast.Global, ast.Nonlocal):
+            names.extend((node.lineno, node.col_offset, name) for name in node.names)
+        elif node_type is ast.ExceptHandler and node.name:
+            names.append((node.lineno, node.col_offset, node.name))
+    # Stable sort: names sharing a position keep their order
+    names.sort(key=lambda name: name[:2])
+    return [(line - 1, name) for line, _, name in names]
+
+
+# Parsers are not thread-safe, so every thread keeps its own parser and
+# compiled queries, reused for all the files it analyzes
+_thread_local = threading.local()
+
+
+def _python_tools():
+
+    tools = getattr(_thread_local, "python", None)
+    if tools is None:
+        language = get_language("python")
+        tools = (
+            get_parser("python"),
+            language.query(PYTHON_QUERY),
+            language.query(IDENTIFIER_QUERY),
+        )
+        _thread_local.python = tools
+    return tools
+
+
+def _analyze_tree_sitter(code: str, analysis: FileAnalysis):
+
+    try:
+        parser, query, identifier_query = _python_tools()
+        tree = parser.parse(code.encode("utf-8"))
+    except Exception as e:
+        logging.debug(f"tree-sitter failed as well: {e}")
+        return
+
+    for node, tag in query.captures(tree.root_node):
+        if tag.startswith("name.definition."):
+            identifier = "def"
+        elif tag.startswith("name.reference."):
+            identifier = "ref"
+        else:
+            continue
+        analysis.symbols.append(
+            (node.start_point[0], node.text.decode("utf-8"), identifier)
+        )
+
+    if _needs_names(analysis.symbols):
+        analysis.names = [
+            (node.start_point[0], node.text.decode("utf-8"))
+            for node, _ in identifier_query.captures(tree.root_node)
+        ]
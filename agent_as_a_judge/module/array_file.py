@@ -0,0 +1,151 @@
+"""
+Array files: named numpy arrays stored back to back after a small JSON header,
+so that an artifact can be memory-mapped and used without being parsed. Used by
+the code graph and the tag store.
+"""
+
+import os
+import json
+import mmap
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _aligned(size: int) -> int:
+
+    return (size + 7) // 8 * 8
+
+
+def map_file(path: Path):
+    """Memory-map a file for reading; empty files map to empty bytes."""
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_atomic(path: Path, write):
+    """Write through a temporary file, so readers never see a partial file."""
+
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def save_arrays(
+    path: Path, magic: bytes, version: int, arrays: Dict[str, np.ndarray]
+):
+    """Write the arrays, each 8-byte aligned, after the magic and a header."""
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset += _aligned(array.nbytes)
+    header = json.dumps({"version": version, "arrays": layout}).encode("utf-8")
+
+    def write(f):
+        f.write(magic)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * (_aligned(array.nbytes) - array.nbytes))
+
+    write_atomic(path, write)
+
+
+def load_arrays(path: Path, magic: bytes, version: int) -> Dict[str, np.ndarray]:
+    """Memory-map the arrays of a file; nothing is read until they are used."""
+
+    buffer = map_file(path)
+    if buffer[: len(magic)] != magic:
+        raise ValueError(f"{path} is not a {magic.decode(errors='replace')} file")
+    header_start = len(magic) + 8
+    header_size = int.from_bytes(buffer[len(magic) : header_start], "little")
+    header = json.loads(buffer[header_start : header_start + header_size])
+    if header.get("version") != version:
+        raise ValueError(
+            f"Unsupported version {header.get('version')} of {path}, "
+            f"expected {version}"
+        )
+
+    start = _aligned(header_start + header_size)
+    return {
+        name: np.frombuffer(
+            buffer, dtype=np.dtype(dtype), count=length, offset=start + offset
+        )
+        for name, (dtype, offset, length) in header["arrays"].items()
+    }
+
+
+class StringTable:
+    """Strings stored as offsets into one UTF-8 buffer."""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+
+        return self.data[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+
+        return self.raw(i).decode("utf-8")
+
+    def find(self, value: str) -> Optional[int]:
+        """The index of a value, in a table sorted by UTF-8 bytes."""
+
+        raw = value.encode("utf-8")
+        table = _RawStrings(self)
+        i = bisect_left(table, raw)
+        if i < len(table) and table[i] == raw:
+            return i
+        return None
+
+    def tolist(self) -> List[str]:
+
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [
+            data[start:end].decode("utf-8")
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+    @staticmethod
+    def encode(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class _RawStrings:
+    """The strings of a table as bytes, for bisect."""
+
+    def __init__(self, table: StringTable):
+
+        self.table = table
+
+    def __len__(self) -> int:
+
+        return len(self.table)
+
+    def __getitem__(self, i: int) -> bytes:
+
+        return self.table.raw(i)
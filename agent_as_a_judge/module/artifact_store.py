@@ -0,0 +1,151 @@
+"""
+ArtifactStore: a content-addressed store for the artifacts built from a workspace
+(graph, tags, tree structure, search indexes), shared by all settings and reruns.
+
+Artifacts are stored under a key derived from the workspace fingerprint and the
+indexer version (and the embedding model, for those holding embeddings), and are
+hard-linked (or symlinked, or copied as a last resort) into the judge directory
+that needs them. Artifacts in the store are never modified; writers must remove
+a linked artifact before rewriting it.
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.embedding_service import embedding_signature
+from agent_as_a_judge.module.fingerprint import WorkspaceFingerprint, file_digest
+
+
+# Bump whenever graph/tags/structure/search artifacts change format or content.
+INDEXER_VERSION = "12"
+
+
+def workspace_fingerprint(
+    workspace: Path, config: AgentConfig, fingerprint: WorkspaceFingerprint = None
+) -> str:
+    """
+    Key the artifacts of a workspace by the Merkle root of the files the indexer
+    can see, together with the indexer configuration and version.
+    """
+
+    if fingerprint is None:
+        fingerprint = WorkspaceFingerprint.compute(workspace, config)
+    digest = hashlib.sha256()
+    digest.update(f"{INDEXER_VERSION}\0{Path(workspace).resolve()}\0".encode())
+    digest.update(
+        repr(
+            (
+                config.include_dirs,
+                config.exclude_dirs,
+                config.exclude_files,
+                config.respect_gitignore,
+                config.max_file_size,
+                config.shard_graph,
+                config.max_dir_entries,
+            )
+        ).encode()
+    )
+    digest.update(fingerprint.root_hash.encode())
+    return digest.hexdigest()
+
+
+def trajectory_fingerprint(trajectory_file: Path) -> str:
+
+    return hashlib.sha256(
+        f"{INDEXER_VERSION}\0{file_digest(str(trajectory_file))}".encode()
+    ).hexdigest()
+
+
+def embedding_fingerprint(key: str, config: AgentConfig) -> str:
+    """
+    Key artifacts that hold embeddings by the key of their source together with
+    the embedding model and backend, as the embeddings of one model are
+    meaningless to another.
+    """
+
+    signature = embedding_signature(config.embedding_model, config.embedding_backend)
+    return hashlib.sha256(
+        f"{key}\0{signature['model']}\0{signature['backend']}".encode()
+    ).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, root: Path):
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry_dir(self, key: str, group: str) -> Path:
+
+        return self.root / key[:2] / key / group
+
+    def has(self, key: str, group: str, names: Iterable[str]) -> bool:
+
+        entry = self.entry_dir(key, group)
+        return all((entry / name).exists() for name in names)
+
+    def fetch(self, key: str, group: str, names: List[str], target_dir: Path) -> bool:
+        """Link the artifacts of an entry into target_dir. Returns False on a miss."""
+
+        if not self.has(key, group, names):
+            return False
+
+        entry = self.entry_dir(key, group)
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            link_artifact(entry / name, target_dir / name)
+        logging.info(f"Reused {group} artifacts {key[:12]} from {self.root}")
+        return True
+
+    def publish(self, key: str, group: str, names: List[str], source_dir: Path):
+        """Copy freshly built artifacts into the store. The first publisher wins."""
+
+        source_dir = Path(source_dir)
+        entry = self.entry_dir(key, group)
+        if entry.exists() or not all((source_dir / name).exists() for name in names):
+            return
+
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f".{group}-"))
+        try:
+            for name in names:
+                shutil.copy2(source_dir / name, staging / name)
+            os.rename(staging, entry)
+        except OSError:
+            # Another process published the same entry first.
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def detach(target_dir: Path, names: Iterable[str]):
+        """Remove linked artifacts so rewriting them cannot modify the store."""
+
+        for name in names:
+            path = Path(target_dir) / name
+            if path.is_symlink() or (path.exists() and path.stat().st_nlink > 1):
+                path.unlink()
+
+
+def link_artifact(source: Path, target: Path):
+
+    if target.is_symlink() or target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        try:
+            os.symlink(source.resolve(), target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def make_store(config: AgentConfig) -> Optional[ArtifactStore]:
+
+    root = config.artifact_store or os.getenv("AAAJ_ARTIFACT_STORE")
+    return ArtifactStore(Path(root)) if root else None
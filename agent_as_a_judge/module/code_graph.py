@@ -0,0 +1,296 @@
+"""
+CodeGraph: a compact, read-only form of the code graph built by DevGraph, stored
+in CSR layout so that it can be memory-mapped and queried without building any
+networkx objects.
+
+The graph file holds numpy arrays: the out- and in-edge offsets per node with
+the edge targets, keys and counts, the node attributes as ids into an interned
+string table, and the node names sorted for binary search. The details of the
+nodes (function bodies, class methods) live in a side file and are only read
+for the nodes that are asked for. Unlike pickle, loading a graph runs no code.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import networkx as nx
+
+from agent_as_a_judge.module.array_file import (
+    StringTable,
+    load_arrays,
+    map_file,
+    save_arrays,
+    write_atomic,
+)
+
+
+GRAPH_FILE = "graph.csr"
+DETAILS_FILE = "graph.details"
+
+MAGIC = b"AAJGRAPH"
+
+# Bump whenever the layout of the graph file changes.
+GRAPH_FORMAT_VERSION = 2
+
+# Node line spans are [start, end]; a single line number (-1 for the names of
+# fallback references) is stored with this end
+NO_END = np.iinfo(np.int32).min
+
+ARRAYS = {
+    "name_offsets": np.int64,
+    "name_data": np.uint8,
+    "string_offsets": np.int64,
+    "string_data": np.uint8,
+    "node_category": np.int32,
+    "node_identifier": np.int32,
+    "node_fname": np.int32,
+    "node_line": np.int32,
+    "details_offsets": np.int64,
+    "out_offsets": np.int64,
+    "out_targets": np.int32,
+    "out_keys": np.int32,
+    "out_counts": np.int64,
+    "in_offsets": np.int64,
+    "in_edges": np.int32,
+}
+
+
+class CodeGraph:
+    def __init__(self, arrays: Dict[str, np.ndarray], details=b""):
+
+        self.arrays = arrays
+        self.names = StringTable(arrays["name_offsets"], arrays["name_data"])
+        self.strings = StringTable(arrays["string_offsets"], arrays["string_data"])
+        self._details = details
+
+    # Building and storage
+
+    @classmethod
+    def from_networkx(cls, G: Optional[nx.MultiDiGraph]) -> "CodeGraph":
+        """
+        Convert a DevGraph graph. Nodes keep the attributes DevGraph sets, edges
+        keep their key and count.
+        """
+
+        G = G if G is not None else nx.MultiDiGraph()
+        names = sorted(G.nodes, key=lambda name: name.encode("utf-8"))
+        node_ids = {name: i for i, name in enumerate(names)}
+        num_nodes = len(names)
+
+        strings = {}
+
+        def intern(value) -> int:
+            if value is None:
+                return -1
+            return strings.setdefault(value, len(strings))
+
+        category = np.full(num_nodes, -1, dtype=np.int32)
+        identifier = np.full(num_nodes, -1, dtype=np.int32)
+        fname = np.full(num_nodes, -1, dtype=np.int32)
+        line = np.full(2 * num_nodes, NO_END, dtype=np.int32)
+        details = []
+        for i, name in enumerate(names):
+            data = G.nodes[name]
+            category[i] = intern(data.get("category"))
+            identifier[i] = intern(data.get("identifier"))
+            fname[i] = intern(data.get("fname"))
+            node_line = data.get("line")
+            if isinstance(node_line, (list, tuple)):
+                line[2 * i : 2 * i + 2] = node_line
+            elif node_line is not None:
+                line[2 * i] = node_line
+            details.append((data.get("details") or "").encode("utf-8"))
+        details_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum([len(d) for d in details], out=details_offsets[1:])
+
+        edges = sorted(
+            (node_ids[u], node_ids[v], intern(str(key)), data.get("count", 1))
+            for u, v, key, data in G.edges(keys=True, data=True)
+        )
+        sources = np.array([e[0] for e in edges], dtype=np.int32)
+        out_targets = np.array([e[1] for e in edges], dtype=np.int32)
+        out_keys = np.array([e[2] for e in edges], dtype=np.int32)
+        out_counts = np.array([e[3] for e in edges], dtype=np.int64)
+        out_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=out_offsets[1:])
+        # Edge ids grouped by target, for predecessor queries
+        in_edges = np.argsort(out_targets, kind="stable").astype(np.int32)
+        in_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(out_targets, minlength=num_nodes), out=in_offsets[1:])
+
+        name_offsets, name_data = StringTable.encode(names)
+        string_offsets, string_data = StringTable.encode(list(strings))
+        arrays = {
+            "name_offsets": name_offsets,
+            "name_data": name_data,
+            "string_offsets": string_offsets,
+            "string_data": string_data,
+            "node_category": category,
+            "node_identifier": identifier,
+            "node_fname": fname,
+            "node_line": line,
+            "details_offsets": details_offsets,
+            "out_offsets": out_offsets,
+            "out_targets": out_targets,
+            "out_keys": out_keys,
+            "out_counts": out_counts,
+            "in_offsets": in_offsets,
+            "in_edges": in_edges,
+        }
+        return cls(arrays, b"".join(details))
+
+    def save(self, directory: Path):
+        """Write the graph and details files, replacing any previous ones."""
+
+        directory = Path(directory)
+        save_arrays(
+            directory / GRAPH_FILE, MAGIC, GRAPH_FORMAT_VERSION, self.stored_arrays()
+        )
+        write_atomic(directory / DETAILS_FILE, lambda f: f.write(self.details_data()))
+
+    def stored_arrays(self) -> Dict[str, np.ndarray]:
+        """The arrays, in the types of the graph file."""
+
+        return {
+            name: np.asarray(self.arrays[name], dtype=dtype)
+            for name, dtype in ARRAYS.items()
+        }
+
+    def details_data(self) -> bytes:
+        """The details of all nodes, back to back."""
+
+        return bytes(self._details)
+
+    @classmethod
+    def load(cls, directory: Path) -> "CodeGraph":
+        """Memory-map a saved graph; nothing is read until it is queried."""
+
+        directory = Path(directory)
+        arrays = load_arrays(directory / GRAPH_FILE, MAGIC, GRAPH_FORMAT_VERSION)
+        return cls(arrays, map_file(directory / DETAILS_FILE))
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+
+        directory = Path(directory)
+        return (directory / GRAPH_FILE).exists() and (directory / DETAILS_FILE).exists()
+
+    # Queries
+
+    def number_of_nodes(self) -> int:
+
+        return len(self.names)
+
+    def number_of_edges(self) -> int:
+
+        return len(self.arrays["out_targets"])
+
+    def __len__(self) -> int:
+
+        return self.number_of_nodes()
+
+    def __contains__(self, name: str) -> bool:
+
+        return self.node_id(name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+
+        return self.nodes()
+
+    def nodes(self) -> Iterator[str]:
+
+        for i in range(len(self.names)):
+            yield self.names[i]
+
+    def node_id(self, name: str) -> Optional[int]:
+
+        return self.names.find(name)
+
+    def node(self, name: str, details: bool = True) -> Dict:
+        """The attributes of a node, like G.nodes[name] of the networkx graph."""
+
+        i = self._require(name)
+        category = int(self.arrays["node_category"][i])
+        if category < 0:
+            return {}
+
+        data = {
+            "category": self.strings[category],
+            "fname": self._string(self.arrays["node_fname"][i]),
+            "line": self._line(i),
+            "identifier": self._string(self.arrays["node_identifier"][i]),
+        }
+        if details:
+            data["details"] = self.details(name)
+        return data
+
+    def details(self, name: str) -> str:
+
+        i = self._require(name)
+        offsets = self.arrays["details_offsets"]
+        return bytes(self._details[offsets[i] : offsets[i + 1]]).decode("utf-8")
+
+    def successors(self, name: str) -> List[Tuple[str, str, int]]:
+        """(target, key, count) of every edge leaving the node."""
+
+        i = self._require(name)
+        offsets = self.arrays["out_offsets"]
+        return [self._edge(e)[1:] for e in range(offsets[i], offsets[i + 1])]
+
+    def predecessors(self, name: str) -> List[Tuple[str, str, int]]:
+        """(source, key, count) of every edge entering the node."""
+
+        i = self._require(name)
+        offsets = self.arrays["in_offsets"]
+        in_edges = self.arrays["in_edges"]
+        result = []
+        for e in in_edges[offsets[i] : offsets[i + 1]]:
+            source, _, key, count = self._edge(int(e))
+            result.append((source, key, count))
+        return result
+
+    def edges(self) -> Iterator[Tuple[str, str, str, int]]:
+        """(source, target, key, count) of every edge."""
+
+        for e in range(self.number_of_edges()):
+            yield self._edge(e)
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        """Materialise the graph, e.g. for visualisation."""
+
+        G = nx.MultiDiGraph()
+        for name in self.nodes():
+            G.add_node(name, **self.node(name))
+        for source, target, key, count in self.edges():
+            G.add_edge(source, target, key=key, count=count)
+        return G
+
+    def _require(self, name: str) -> int:
+
+        i = self.node_id(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+    def _string(self, i) -> Optional[str]:
+
+        return None if i < 0 else self.strings[int(i)]
+
+    def _line(self, i: int):
+
+        start, end = (int(x) for x in self.arrays["node_line"][2 * i : 2 * i + 2])
+        if end == NO_END:
+            return None if start == NO_END else start
+        return [start, end]
+
+    def _edge(self, e: int) -> Tuple[str, str, str, int]:
+
+        source = int(np.searchsorted(self.arrays["out_offsets"], e, side="right")) - 1
+        return (
+            self.names[source],
+            self.names[int(self.arrays["out_targets"][e])],
+            self.strings[int(self.arrays["out_keys"][e])],
+            int(self.arrays["out_counts"][e]),
+        )
+
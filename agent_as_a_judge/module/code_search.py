@@ -5,16 +5,14 @@ DevCodeSearch: A class for searching and displaying code snippets and their meta
 import os
 import io
 import json
-import pickle
 import logging
 import numpy as np
-from typing import List, Dict, Any, Generator, Union
-import networkx as nx
+from typing import List, Dict, Any, Generator, Iterable, Optional, Tuple, Union
 import spacy
 from dotenv import load_dotenv
 from pathlib import Path
 from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
 from rich.logging import RichHandler
 from rich.console import Console
 from rich.table import Table
@@ -23,6 +21,25 @@ from rich.tree import Tree
 from rich.text import Text
 from rich.syntax import Syntax
 
+from agent_as_a_judge.module.artifact_store import ArtifactStore
+from agent_as_a_judge.module.code_graph import GRAPH_FILE, CodeGraph
+from agent_as_a_judge.module.embedding_cache import (
+    EMBEDDING_CACHE_FILE,
+    EmbeddingCache,
+    model_name,
+)
+from agent_as_a_judge.module.embedding_service import (
+    embedding_signature,
+    get_embedding_service,
+    load_signature,
+    save_signature,
+)
+from agent_as_a_judge.module.graph_query import GraphQuery
+from agent_as_a_judge.module.scanner import display_structure
+from agent_as_a_judge.module.shards import DEFAULT_CACHE_MB, ShardedIndex
+from agent_as_a_judge.module.tag_store import SEARCH_FIELDS, TAGS_FILE, TagStore
+from agent_as_a_judge.module.vector_index import VectorIndex, build_index
+
 console = Console()
 logging.basicConfig(
     level=logging.INFO,
@@ -32,28 +49,65 @@ logging.basicConfig(
 
 
 class DevCodeSearch:
-    def __init__(self, judge_path: str, setting: str = None):
+
+    EMBEDDINGS_FILE = "code_embeddings.npy"
+    SIGNATURE_FILE = "code_embeddings.json"
+    BM25_CORPUS_FILE = "bm25_corpus.json"
+
+    def __init__(
+        self,
+        judge_path: str,
+        setting: str = None,
+        embedding_model: SentenceTransformer = None,
+        embedding_model_name: str = None,
+        embedding_backend: str = None,
+        artifact_store: ArtifactStore = None,
+        artifact_key: str = None,
+        shard_cache_mb: int = DEFAULT_CACHE_MB,
+        vector_index: str = "auto",
+        vector_dtype: str = "auto",
+    ):
         self.judge_path = Path(judge_path)
-        self.graph_file = self.judge_path / "graph.pkl"
-        self.tags_file = self.judge_path / "tags.json"
+        self.graph_file = self.judge_path / GRAPH_FILE
+        self.tags_file = self.judge_path / TAGS_FILE
         self.structure_file = self.judge_path / "tree_structure.json"
+        self.embeddings_file = self.judge_path / self.EMBEDDINGS_FILE
+        self.signature_file = self.judge_path / self.SIGNATURE_FILE
+        self.bm25_corpus_file = self.judge_path / self.BM25_CORPUS_FILE
         self.setting = setting
+        self.artifact_store = artifact_store
+        self.artifact_key = artifact_key
 
         self.workspace = self.load_workspace()
+        self.shards = self.load_shards(shard_cache_mb)
+        # The shards searched, on a sharded index
+        self.scope: Tuple[int, ...] = ()
         self.graph = self.load_graph()
         self.tags = self.load_tags()
         self.structure = self.load_structure()
         self.tree = self.load_tree()
         self.spacy_nlp = None
         self.bm25 = None
-        # self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.embedding_model = SentenceTransformer("/media/sc/AI/self-llm/embed_model/sentence-transformers/all-MiniLM-L6-v2")
+        # Without a model given, the model of the process's embedding service
+        self._embedding_model = embedding_model
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self._embedding_cache = None
         self.code_embeddings = None
+        self.vector_index_kind = vector_index
+        self.vector_dtype = vector_dtype
+        self.vector_index: Optional[VectorIndex] = None
+        self._graph_query = None
 
     def search(
         self, query: str, search_type: str = "fuzzy", **kwargs
     ) -> List[Dict[str, Any]]:
 
+        if not self.scope:
+            self.focus(
+                query
+                or " ".join(v for v in kwargs.values() if isinstance(v, str))
+            )
         if search_type == "accurate":
             return list(self.accurate_search(query=query, **kwargs))
         elif search_type == "fuzzy":
@@ -72,26 +126,94 @@ class DevCodeSearch:
             self.spacy_nlp = spacy.load("en_core_web_sm")
         return self.spacy_nlp
 
-    def load_graph(self) -> nx.MultiDiGraph:
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+
+        if self._embedding_model is None:
+            self._embedding_model = get_embedding_service(
+                self.embedding_model_name, backend=self.embedding_backend
+            ).get()
+        return self._embedding_model
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+
+        if self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache(
+                self.judge_path / EMBEDDING_CACHE_FILE, model_name(self.embedding_model)
+            )
+        return self._embedding_cache
+
+    @property
+    def graph_query(self) -> GraphQuery:
+
+        if self._graph_query is None:
+            self._graph_query = GraphQuery(self.tags)
+        return self._graph_query
+
+    def load_shards(self, cache_mb: int = DEFAULT_CACHE_MB) -> Optional[ShardedIndex]:
+
+        if not ShardedIndex.exists(self.judge_path):
+            return None
+        try:
+            return ShardedIndex(self.judge_path, cache_mb)
+        except ValueError as e:
+            logging.warning(f"Failed to load shards: {e}")
+            return None
+
+    def focus(self, text: str = "", paths: Iterable[str] = ()) -> bool:
+        """
+        On a sharded index, search the shards the text and the paths touch,
+        loading them if needed. Returns whether the searched shards changed.
+        """
+
+        if self.shards is None:
+            return False
+        rel_paths = [
+            (
+                os.path.relpath(path, self.workspace)
+                if self.workspace and os.path.isabs(path)
+                else path
+            )
+            for path in paths
+        ]
+        scope = tuple(self.shards.shards_for(text, rel_paths))
+        if not scope or scope == self.scope:
+            return False
+        self.scope = scope
+        self.tags, self.graph = self.shards.view(scope)
+        self.bm25 = None
+        self.code_embeddings = None
+        self.vector_index = None
+        self._graph_query = None
+        logging.info(
+            "Searching packages "
+            f"{', '.join(self.shards.names[shard] for shard in scope)}"
+        )
+        return True
+
+    def load_graph(self) -> CodeGraph:
 
+        if self.shards is not None:
+            return CodeGraph.from_networkx(None)
         try:
-            with open(self.graph_file, "rb") as f:
-                return pickle.load(f)
-        except (FileNotFoundError, EOFError) as e:
+            return CodeGraph.load(self.judge_path)
+        except FileNotFoundError as e:
             logging.warning(f"Failed to load graph: {e}")
-            return nx.MultiDiGraph()
+            return CodeGraph.from_networkx(None)
         except Exception as e:
             logging.error(f"Unexpected error when loading graph: {e}")
-            return nx.MultiDiGraph()
+            return CodeGraph.from_networkx(None)
 
-    def load_tags(self) -> List[Dict[str, Any]]:
+    def load_tags(self) -> TagStore:
 
+        if self.shards is not None:
+            return TagStore.from_tags([])
         try:
-            with open(self.tags_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            return TagStore.load(self.judge_path)
+        except (FileNotFoundError, ValueError) as e:
             logging.warning(f"Failed to load tags: {e}")
-            return []
+            return TagStore.from_tags([])
 
     def load_workspace(self) -> str:
 
@@ -119,7 +241,7 @@ class DevCodeSearch:
                     tree.add(file_label)
 
         tree = Tree("[bold blue]Project Structure[/bold blue]")
-        add_branch(tree, self.structure["tree_structure"])
+        add_branch(tree, display_structure(self.structure))
 
         with io.StringIO() as buf:
             temp_console = Console(file=buf, record=True)
@@ -140,38 +262,35 @@ class DevCodeSearch:
     ) -> Generator[Dict[str, Any], None, None]:
 
         if kwargs:
-            for tag in self.tags:
-                match = all(
-                    value.lower() in tag.get(key, "").lower()
-                    for key, value in kwargs.items()
-                )
-                if match:
-                    yield tag
+            mask = np.ones(len(self.tags), dtype=bool)
+            for key, value in kwargs.items():
+                value = value.lower()
+                if key in self.tags.tables:
+                    mask &= self.tags.matches(key, lambda field: value in field)
+                elif value:
+                    # Missing fields only match the empty string
+                    mask[:] = False
         elif query:
-            for tag in self.tags:
-                if any(
-                    query.lower() in tag.get(field, "").lower()
-                    for field in ["name", "category", "identifier", "details"]
-                ):
-                    yield tag
+            query = query.lower()
+            mask = np.zeros(len(self.tags), dtype=bool)
+            for field in SEARCH_FIELDS:
+                mask |= self.tags.matches(field, lambda value: query in value)
+        else:
+            return
+        yield from self.tags.select(mask)
 
     def fuzzy_search(self, query: str, threshold: int = 70) -> List[Dict[str, Any]]:
         """Perform a fuzzy search on all tags and return results above the threshold."""
         from fuzzywuzzy import fuzz
 
         query = query.lower()
-        results = [
-            tag
-            for tag in self.tags
-            if max(
-                fuzz.partial_ratio(query, tag.get("name", "").lower()),
-                fuzz.partial_ratio(query, tag.get("details", "").lower()),
-                fuzz.partial_ratio(query, tag.get("category", "").lower()),
-                fuzz.partial_ratio(query, tag.get("identifier", "").lower()),
+        best = np.zeros(len(self.tags), dtype=np.int64)
+        for field in ["name", "details", "category", "identifier"]:
+            scores = self.tags.scores(
+                field, lambda value: fuzz.partial_ratio(query, value)
             )
-            >= threshold
-        ]
-        return results
+            best = np.maximum(best, scores)
+        return self.tags.select(best >= threshold)
 
     def bm25_search(self, query: str, top_n: int = 10) -> List[Dict[str, Any]]:
 
@@ -179,22 +298,7 @@ class DevCodeSearch:
             logging.warning("No tags available for BM25 search.")
             return []
         if self.bm25 is None:
-            self.corpus = [
-                [
-                    token.text.lower()
-                    for token in self.nlp(
-                        tag.get("name", "")
-                        + " "
-                        + tag.get("details", "")
-                        + " "
-                        + tag.get("category", "")
-                        + " "
-                        + tag.get("identifier", "")
-                    )
-                    if not token.is_stop and not token.is_punct
-                ]
-                for tag in self.tags
-            ]
+            self.corpus = self.load_bm25_corpus() or self.build_bm25_corpus()
             self.bm25 = BM25Okapi([doc for doc in self.corpus])
         tokenized_query = [
             token.text.lower()
@@ -202,11 +306,92 @@ class DevCodeSearch:
             if not token.is_stop and not token.is_punct
         ]
         scores = self.bm25.get_scores(tokenized_query)
+        # Aggregated references weigh in with how often the name occurs
+        scores = scores * (1 + np.log(self.tags.counts()))
         top_n_indices = np.argsort(scores)[-top_n:][::-1]
         return [self.tags[i] for i in top_n_indices]
 
+    def build_bm25_corpus(self) -> List[List[str]]:
+
+        # Tags sharing all their searched values share their tokens
+        documents = {}
+        corpus = []
+        fields = ["name", "details", "category", "identifier"]
+        values = [self.tags.values(field) for field in fields]
+        for ids in zip(*(self.tags.ids(field).tolist() for field in fields)):
+            if ids not in documents:
+                text = " ".join(column[i] for column, i in zip(values, ids))
+                documents[ids] = [
+                    token.text.lower()
+                    for token in self.nlp(text)
+                    if not token.is_stop and not token.is_punct
+                ]
+            corpus.append(documents[ids])
+        return corpus
+
+    def _resolve_artifact(self, path: Path) -> Path:
+        """Link a missing prebuilt artifact from the artifact store, if there is one."""
+
+        if not path.exists() and self.artifact_store and self.artifact_key:
+            self.artifact_store.fetch(
+                self.artifact_key, "search", [path.name], self.judge_path
+            )
+        return path
+
+    def load_bm25_corpus(self) -> List[List[str]]:
+
+        if self.shards is not None:
+            return []
+        self._resolve_artifact(self.bm25_corpus_file)
+        try:
+            with open(self.bm25_corpus_file, "r") as f:
+                corpus = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+        if len(corpus) != len(self.tags):
+            logging.warning("Prebuilt BM25 corpus does not match the tags, rebuilding")
+            return []
+        return corpus
+
+    @property
+    def embedding_signature(self) -> Dict[str, str]:
+
+        return embedding_signature(self.embedding_model_name, self.embedding_backend)
+
+    def load_code_embeddings(self) -> Union[np.ndarray, None]:
+
+        self._resolve_artifact(self.embeddings_file)
+        self._resolve_artifact(self.signature_file)
+        if not self.embeddings_file.exists():
+            return None
+        if load_signature(self.signature_file) != self.embedding_signature:
+            logging.warning(
+                "Prebuilt code embeddings were built with another model, rebuilding"
+            )
+            return None
+        try:
+            embeddings = np.load(
+                self.embeddings_file, mmap_mode="r" if self.shards else None
+            )
+        except (FileNotFoundError, ValueError):
+            return None
+        if self.shards is not None:
+            if len(embeddings) != self.shards.tag_offsets[-1]:
+                logging.warning("Prebuilt code embeddings do not match the shards")
+                return None
+            embeddings = np.concatenate(
+                [embeddings[slice(*self.shards.tag_range(i))] for i in self.scope]
+                or [embeddings[:0]]
+            )
+        if len(embeddings) != len(self.tags):
+            logging.warning("Prebuilt code embeddings do not match the tags, rebuilding")
+            return None
+        return embeddings
+
     def embed_search(self, query: str, top_n: int = 3) -> List[Dict[str, Any]]:
 
+        if self.code_embeddings is None:
+            self.code_embeddings = self.load_code_embeddings()
         if self.code_embeddings is None:
             logging.info("Generating code embeddings for the first time...")
             self.code_embeddings = self._generate_code_embeddings()
@@ -215,20 +400,71 @@ class DevCodeSearch:
             logging.error("No code embeddings available for search.")
             return []
 
-        query_embedding = self.embedding_model.encode(query, convert_to_tensor=True)
-        similarities = util.pytorch_cos_sim(query_embedding, self.code_embeddings)
-        actual_top_n = min(top_n, similarities.size(1))
-        if actual_top_n == 0:
-            logging.error("No valid embeddings found to compare with.")
-            return []
+        if self.vector_index is None:
+            self.vector_index = build_index(
+                self.code_embeddings, self.vector_index_kind, self.vector_dtype
+            )
+        query_embedding = self.embedding_model.encode([query], convert_to_numpy=True)
+        _, top_ids = self.vector_index.search(query_embedding, top_n)
+        return [self.tags[i] for i in top_ids[0].tolist() if i >= 0]
+
+    def _generate_code_embeddings(self, tags: TagStore = None) -> np.ndarray:
+        """Embed the details of the tags, encoding only those not cached yet."""
+
+        tags = self.tags if tags is None else tags
+        # Tags sharing their details share their embedding
+        embeddings = self.embedding_cache.encode(
+            tags.values("details"), self.embedding_model
+        )
+        return embeddings[tags.ids("details")]
+
+    def save_bm25_corpus(self) -> int:
+
+        self.corpus = self.build_bm25_corpus()
+        with open(self.bm25_corpus_file, "w") as f:
+            json.dump(self.corpus, f)
+        return len(self.corpus)
 
-        top_results = similarities.topk(actual_top_n)
-        return [self.tags[i] for i in top_results.indices.tolist()[0]]
+    def save_code_embeddings(self) -> int:
 
-    def _generate_code_embeddings(self):
+        if self.shards is not None:
+            # Shard by shard, in the order of their tags
+            embeddings = [
+                self._generate_code_embeddings(self.shards.load(i)[0])
+                for i in range(len(self.shards))
+            ]
+            embeddings = (
+                np.concatenate(embeddings)
+                if embeddings
+                else np.zeros((0, 0), dtype=np.float32)
+            )
+            np.save(self.embeddings_file, embeddings)
+            save_signature(self.signature_file, self.embedding_signature)
+            return len(embeddings)
 
-        code_texts = [tag.get("details", "") for tag in self.tags]
-        return self.embedding_model.encode(code_texts, convert_to_tensor=True)
+        self.code_embeddings = self._generate_code_embeddings()
+        self.vector_index = None
+        np.save(self.embeddings_file, self.code_embeddings)
+        save_signature(self.signature_file, self.embedding_signature)
+        return len(self.code_embeddings)
+
+    def graph_evidence(
+        self,
+        file_paths: List[str],
+        hops: int = 2,
+        max_tokens: int = 2000,
+        model: str = None,
+    ) -> str:
+        """
+        The source of the definitions reachable from the entry points of the
+        files, nearest first, instead of the files themselves.
+        """
+
+        # Breadth-first, so nearest first
+        reachable = self.graph_query.reachable_from_files(file_paths, hops=hops)
+        return self.graph_query.render(
+            list(reachable), max_tokens=max_tokens, model=model
+        )
 
     def display(
         self,
@@ -357,7 +593,7 @@ class DevCodeSearch:
 
     def get_filepaths(self) -> List[str]:
 
-        return [tag["fname"] for tag in self.tags]
+        return self.tags.column("fname")
 
     def display_tree(self, max_depth: int = None) -> None:
 
@@ -378,7 +614,7 @@ class DevCodeSearch:
                     add_branch(branch, value, current_depth + 1)
 
         tree = Tree("[bold blue]Project Structure[/bold blue]")
-        add_branch(tree, self.structure["tree_structure"], current_depth=0)
+        add_branch(tree, display_structure(self.structure), current_depth=0)
         metadata = Text.from_markup(
             f"[bold cyan]Tree Structure File:[/bold cyan] [bold white]{self.structure_file}[/bold white]\n"
             f"[bold cyan]Workspace Path:[/bold cyan] [bold white]{self.workspace}[/bold white]\n"
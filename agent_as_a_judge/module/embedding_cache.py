@@ -0,0 +1,161 @@
+"""
+EmbeddingCache: the embeddings of code texts persisted across judge runs, so
+that semantic search only encodes the tags added or changed since the last run.
+
+Embeddings are stored as one float16 matrix in an array file, next to the
+64-bit content hashes of the texts they encode, sorted for binary search, and
+the row of each. Texts are looked up by hash, so identical texts are encoded
+once and a moved tag keeps its row. The missing texts are encoded in batches of
+similar length, which keeps padding low, and the file is rewritten once with
+the new rows appended. A cache built by another model is discarded.
+"""
+
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from agent_as_a_judge.module.array_file import load_arrays, save_arrays
+
+
+EMBEDDING_CACHE_FILE = "code_embeddings.cache"
+
+MAGIC = b"AAJEMBED"
+
+# Bump whenever the layout of the cache file changes.
+CACHE_FORMAT_VERSION = 1
+
+BATCH_SIZE = 64
+
+
+def content_hash(text: str) -> int:
+    """A 64-bit hash of a text, stable across processes."""
+
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def model_name(model) -> str:
+    """The name or path a SentenceTransformer was loaded from, when it tells."""
+
+    if hasattr(model, "model_id"):
+        return model.model_id
+    try:
+        return model[0].auto_model.config._name_or_path
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return type(model).__name__
+
+
+class EmbeddingCache:
+    def __init__(self, path: Path, model_id: str):
+
+        self.path = Path(path)
+        self.model_id = model_id
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.matrix: Optional[np.ndarray] = None
+        self._load()
+
+    def _load(self):
+
+        try:
+            arrays = load_arrays(self.path, MAGIC, CACHE_FORMAT_VERSION)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.warning(f"Discarding embedding cache: {e}")
+            return
+        if arrays["model"].tobytes().decode("utf-8") != self.model_id:
+            logging.info(f"Discarding embedding cache of another model: {self.path}")
+            return
+        dim = int(arrays["dim"][0])
+        self.keys = arrays["keys"]
+        self.rows = arrays["rows"]
+        self.matrix = arrays["matrix"].reshape(-1, dim)
+
+    def __len__(self) -> int:
+
+        return len(self.keys)
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """The row of each hash, or -1 for the hashes not cached."""
+
+        if not len(self.keys):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.searchsorted(self.keys, hashes)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = self.keys[positions] == hashes
+        return np.where(found, self.rows[positions], -1)
+
+    def encode(self, texts: List[str], model, batch_size: int = BATCH_SIZE):
+        """
+        The float32 embeddings of the texts, encoding and caching the ones not
+        cached yet.
+        """
+
+        hashes = np.fromiter(
+            (content_hash(text) for text in texts), dtype=np.uint64, count=len(texts)
+        )
+        rows = self.lookup(hashes)
+        missing = {}
+        for i in np.flatnonzero(rows < 0).tolist():
+            missing.setdefault(int(hashes[i]), texts[i])
+        if missing:
+            logging.info(
+                f"Encoding {len(missing)} new texts, {len(texts) - len(missing)} cached"
+            )
+            encoded = self._encode(list(missing.values()), model, batch_size)
+            self._add(list(missing), encoded)
+            rows = self.lookup(hashes)
+        if self.matrix is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.matrix[rows].astype(np.float32)
+
+    def _encode(self, texts: List[str], model, batch_size: int = BATCH_SIZE):
+        """Encode in batches of similar length, returning rows in text order."""
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            encoded = model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            for i, embedding in zip(batch, encoded):
+                embeddings[i] = embedding
+        return np.asarray(embeddings, dtype=np.float16)
+
+    def _add(self, hashes: List[int], embeddings: np.ndarray):
+
+        dim = embeddings.shape[1]
+        if self.matrix is None or self.matrix.shape[1] != dim:
+            self.keys = np.zeros(0, dtype=np.uint64)
+            self.rows = np.zeros(0, dtype=np.int64)
+            self.matrix = np.zeros((0, dim), dtype=np.float16)
+        new_rows = np.arange(len(self.matrix), len(self.matrix) + len(hashes))
+        keys = np.concatenate([self.keys, np.array(hashes, dtype=np.uint64)])
+        rows = np.concatenate([self.rows, new_rows])
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.matrix = np.concatenate([self.matrix, embeddings])
+        try:
+            save_arrays(
+                self.path,
+                MAGIC,
+                CACHE_FORMAT_VERSION,
+                {
+                    "model": np.frombuffer(self.model_id.encode("utf-8"), np.uint8),
+                    "dim": np.array([dim], dtype=np.int64),
+                    "keys": self.keys,
+                    "rows": self.rows,
+                    "matrix": self.matrix.reshape(-1),
+                },
+            )
+        except OSError as e:
+            logging.warning(f"Failed to save the embedding cache: {e}")
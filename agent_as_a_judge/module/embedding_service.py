@@ -0,0 +1,161 @@
+"""
+EmbeddingService: the sentence embedding model shared by code search and
+trajectory retrieval, loaded at most once per process and only when an embedding
+is first needed, so that runs whose workflow never searches never load it.
+
+The model is the one AgentConfig.embedding_model names, else the one the
+AAAJ_EMBEDDING_MODEL environment variable names, else all-MiniLM-L6-v2: a model
+on the Hugging Face hub or a local path. A warm-up thread can load it ahead of
+time, while the judge waits on other steps. The "onnx" backend runs the model
+quantised to int8 with onnxruntime (AgentConfig.embedding_backend, else
+AAAJ_EMBEDDING_BACKEND).
+
+Embeddings saved to disk carry a signature, the model and backend they were
+built with, so that those of another model are never searched.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+EMBEDDING_MODEL_ENV = "AAAJ_EMBEDDING_MODEL"
+EMBEDDING_DEVICE_ENV = "AAAJ_EMBEDDING_DEVICE"
+EMBEDDING_BACKEND_ENV = "AAAJ_EMBEDDING_BACKEND"
+
+BACKENDS = ("torch", "onnx")
+
+
+def embedding_model_name(name: Optional[str] = None) -> str:
+    """The model to load: `name`, else that of the environment, else the default."""
+
+    return name or os.getenv(EMBEDDING_MODEL_ENV) or DEFAULT_EMBEDDING_MODEL
+
+
+def embedding_backend_name(backend: Optional[str] = None) -> str:
+    """The backend to run: `backend`, else that of the environment, else torch."""
+
+    return backend or os.getenv(EMBEDDING_BACKEND_ENV) or "torch"
+
+
+def embedding_signature(
+    name: Optional[str] = None, backend: Optional[str] = None
+) -> Dict[str, str]:
+    """The model and backend that embeddings are built with."""
+
+    return {
+        "model": embedding_model_name(name),
+        "backend": embedding_backend_name(backend),
+    }
+
+
+def load_signature(path: Path) -> Optional[Dict[str, str]]:
+    """The signature saved next to embeddings, None if there is none."""
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_signature(path: Path, signature: Dict[str, str]):
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(signature, f)
+
+
+class EmbeddingService:
+    def __init__(
+        self, name: str, device: Optional[str] = None, backend: str = "torch"
+    ):
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+        self.name = name
+        self.device = device
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+        self._warm_up: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+
+        return self._model is not None
+
+    def get(self):
+        """The model, loaded on first use; waits for a warm-up under way."""
+
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start_time = time.time()
+                    self._model = self._load()
+                    logging.info(
+                        f"Loaded {self.backend} embedding model {self.name} in "
+                        f"{time.time() - start_time:.1f}s"
+                    )
+        return self._model
+
+    def _load(self):
+
+        if self.backend == "onnx":
+            from agent_as_a_judge.module.onnx_embedding import OnnxEmbedder
+
+            return OnnxEmbedder(self.name)
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.name, device=self.device)
+
+    def warm_up(self) -> Optional[threading.Thread]:
+        """
+        Load the model in a background thread, unless it is loaded or loading
+        already. A failed warm-up is only logged: the next `get` loads again and
+        raises.
+        """
+
+        with _services_lock:
+            if self._model is None and not (
+                self._warm_up and self._warm_up.is_alive()
+            ):
+                self._warm_up = threading.Thread(
+                    target=self._load_quietly, name="embedding-warm-up", daemon=True
+                )
+                self._warm_up.start()
+            return self._warm_up
+
+    def _load_quietly(self):
+
+        try:
+            self.get()
+        except Exception as e:
+            logging.warning(f"Failed to warm up embedding model {self.name}: {e}")
+
+
+_services: Dict[Tuple[str, Optional[str], str], EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(
+    name: Optional[str] = None,
+    device: Optional[str] = None,
+    backend: Optional[str] = None,
+) -> EmbeddingService:
+    """The service of a model in this process, created on first request."""
+
+    key = (
+        embedding_model_name(name),
+        device or os.getenv(EMBEDDING_DEVICE_ENV),
+        embedding_backend_name(backend),
+    )
+    with _services_lock:
+        if key not in _services:
+            _services[key] = EmbeddingService(*key)
+        return _services[key]
@@ -0,0 +1,212 @@
+"""
+WorkspaceFingerprint: a Merkle tree over the files of a workspace that the indexer
+can see, used to detect exactly which files changed between two judge runs.
+
+Files whose size and mtime match the previous fingerprint reuse its content hash,
+so refreshing the fingerprint of an unchanged workspace only costs a stat per file.
+"""
+
+import json
+import hashlib
+import logging
+from collections import defaultdict
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.scanner import Manifest, scan_config
+
+
+FINGERPRINT_FILE = "fingerprint.json"
+
+
+@dataclass
+class FileEntry:
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+@dataclass
+class WorkspaceChanges:
+    added: Set[str] = field(default_factory=set)
+    removed: Set[str] = field(default_factory=set)
+    changed: Set[str] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def paths(self) -> Set[str]:
+
+        return self.added | self.removed | self.changed
+
+    def summary(self) -> str:
+
+        return (
+            f"{len(self.added)} added, {len(self.removed)} removed, "
+            f"{len(self.changed)} changed"
+        )
+
+
+class WorkspaceFingerprint:
+    def __init__(self, files: Dict[str, FileEntry] = None):
+
+        self.files = files or {}
+        self._layout = None
+        self._tree = None
+
+    @classmethod
+    def compute(
+        cls,
+        workspace: Path,
+        config: AgentConfig,
+        previous: Optional["WorkspaceFingerprint"] = None,
+        manifest: Optional[Manifest] = None,
+    ) -> "WorkspaceFingerprint":
+        """
+        Fingerprint the files of the workspace manifest, hashing only files whose
+        size or mtime differ from the previous fingerprint.
+        """
+
+        if manifest is None:
+            manifest = scan_config(workspace, config)
+        previous_files = previous.files if previous else {}
+        files = {}
+        hashed = 0
+
+        for manifest_entry in manifest.files():
+            entry = previous_files.get(manifest_entry.path)
+            if (
+                entry is None
+                or entry.size != manifest_entry.size
+                or entry.mtime_ns != manifest_entry.mtime_ns
+            ):
+                entry = FileEntry(
+                    manifest_entry.size,
+                    manifest_entry.mtime_ns,
+                    file_digest(manifest.abspath(manifest_entry)),
+                )
+                hashed += 1
+            files[manifest_entry.path] = entry
+
+        logging.debug(f"Fingerprinted {len(files)} files, hashed {hashed}")
+        return cls(files)
+
+    @property
+    def root_hash(self) -> str:
+
+        return self.tree[""]
+
+    @property
+    def layout(self) -> Dict[str, Tuple[List[str], Set[str]]]:
+        """Files and subdirectories of every directory ("" for the root)."""
+
+        if self._layout is None:
+            layout = defaultdict(lambda: ([], set()))
+            layout[""] = ([], set())
+            for rel_path in self.files:
+                parent = rel_path.rpartition("/")[0]
+                layout[parent][0].append(rel_path)
+                child = parent
+                while child:
+                    parent = child.rpartition("/")[0]
+                    if child in layout[parent][1]:
+                        break
+                    layout[parent][1].add(child)
+                    child = parent
+            self._layout = dict(layout)
+        return self._layout
+
+    @property
+    def tree(self) -> Dict[str, str]:
+        """Merkle hash of every directory, computed from the deepest one up."""
+
+        if self._tree is None:
+            tree = {}
+            for directory in sorted(
+                self.layout, key=lambda d: d.count("/") + bool(d), reverse=True
+            ):
+                files, subdirs = self.layout[directory]
+                entries = [
+                    (path.rpartition("/")[2], self.files[path].digest) for path in files
+                ] + [(d.rpartition("/")[2] + "/", tree[d]) for d in subdirs]
+                digest = hashlib.sha256()
+                for name, child_hash in sorted(entries):
+                    digest.update(f"{name}\0{child_hash}\n".encode())
+                tree[directory] = digest.hexdigest()
+            self._tree = tree
+        return self._tree
+
+    def diff(self, previous: Optional["WorkspaceFingerprint"]) -> WorkspaceChanges:
+        """Files added, removed and changed since the previous fingerprint."""
+
+        if previous is None:
+            return WorkspaceChanges(added=set(self.files))
+
+        changes = WorkspaceChanges()
+        self._diff_dir("", previous, changes)
+        return changes
+
+    def _diff_dir(
+        self,
+        directory: str,
+        previous: "WorkspaceFingerprint",
+        changes: WorkspaceChanges,
+    ):
+        # Only descend into directories whose hashes differ
+        if self.tree.get(directory) == previous.tree.get(directory):
+            return
+
+        files, subdirs = self.layout.get(directory, ([], set()))
+        old_files, old_subdirs = previous.layout.get(directory, ([], set()))
+        for rel_path in files:
+            if rel_path not in previous.files:
+                changes.added.add(rel_path)
+            elif self.files[rel_path].digest != previous.files[rel_path].digest:
+                changes.changed.add(rel_path)
+        changes.removed.update(path for path in old_files if path not in self.files)
+
+        for subdir in subdirs | old_subdirs:
+            self._diff_dir(subdir, previous, changes)
+
+    def save(self, path: Path):
+
+        data = {
+            "root": self.root_hash,
+            "files": {
+                rel_path: [entry.size, entry.mtime_ns, entry.digest]
+                for rel_path, entry in self.files.items()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["WorkspaceFingerprint"]:
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(
+                {
+                    rel_path: FileEntry(*entry)
+                    for rel_path, entry in data["files"].items()
+                }
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except OSError as e:
+        logging.warning(f"Failed to hash {path}: {e}")
+    return digest.hexdigest()
@@ -10,28 +10,67 @@ import os
 import re
 import ast
 import json
-import pickle
+import logging
+import multiprocessing
 
-import inspect
 import builtins
 import networkx as nx
 
-from copy import deepcopy
-from collections import namedtuple
+from collections import Counter, defaultdict, namedtuple
 from pathlib import Path
 from dotenv import load_dotenv
 from matplotlib import pyplot as plt
 from tqdm import tqdm
 from typing import List
 
-from pygments.lexers import guess_lexer_for_filename
-from pygments.token import Token
-from pygments.util import ClassNotFound
-from tree_sitter_languages import get_language, get_parser
 from grep_ast import TreeContext, filename_to_lang
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-Tag = namedtuple("Tag", "rel_fname fname line name identifier category details".split())
+from agent_as_a_judge.module.analyzer import (
+    analyze_file,
+    analyze_source,
+    reanalyze_source,
+)
+from agent_as_a_judge.module.code_graph import CodeGraph
+from agent_as_a_judge.module.structure import (
+    EMPTY_STRUCTURE,
+    StructureStore,
+    decode_lines,
+)
+from agent_as_a_judge.module.scanner import TEXT, Manifest, scan_workspace
+from agent_as_a_judge.module.symbols import get_symbol_table
+from agent_as_a_judge.module.tag_cache import TAG_CACHE_FILE, TagCache
+from agent_as_a_judge.module.tag_pool import TagExtractionPool
+
+# Aggregated references count their occurrences and list their rows in `lines`
+Tag = namedtuple(
+    "Tag",
+    "rel_fname fname line name identifier category details count lines".split(),
+    defaults=(1, ()),
+)
+
+# Built-in functions and the members of the built-in containers, never tagged
+BUILTIN_NAMES = frozenset(dir(builtins)).union(
+    dir(list), dir(dict), dir(set), dir(str), dir(tuple)
+)
+
+
+def changed_tags(old_tags, new_tags):
+    """
+    The tags that only one of two versions of a file has, counting duplicates:
+    the tags of unchanged (and unmoved) definitions and calls are left out.
+    """
+
+    def key(tag):
+        line = tuple(tag.line) if isinstance(tag.line, list) else tag.line
+        return tag._replace(line=line, lines=tuple(tag.lines))
+
+    old_keys = Counter(key(tag) for tag in old_tags)
+    new_keys = Counter(key(tag) for tag in new_tags)
+    removed = old_keys - new_keys
+    added = new_keys - old_keys
+    return [tag for tag in old_tags if key(tag) in removed] + [
+        tag for tag in new_tags if key(tag) in added
+    ]
 
 
 class DevGraph:
@@ -44,6 +83,14 @@ class DevGraph:
         include_dirs=None,
         exclude_dirs=None,
         exclude_files=None,
+        cache_dir=None,
+        num_workers=None,
+        file_timeout=60.0,
+        memory_limit_mb=2048,
+        manifest=None,
+        respect_gitignore=False,
+        max_file_size=None,
+        incremental=False,
     ):
         self.io = io
         self.verbose = verbose
@@ -51,9 +98,65 @@ class DevGraph:
         self.include_dirs = include_dirs
         self.exclude_dirs = exclude_dirs or ["__pycache__", "env", "venv"]
         self.exclude_files = exclude_files or [".DS_Store"]
-        self.structure = self.create_structure(self.root)
+        self.respect_gitignore = respect_gitignore
+        self.max_file_size = max_file_size
+        # A manifest of the root scanned by the caller can be shared
+        self._manifest = manifest
+        self._structure = None
+        self._main_files = None
+        self._project_modules = None
         self.warned_files = set()
         self.tree_cache = {}
+        self.tree_context_cache = {}
+        self.tag_cache = (
+            TagCache(Path(cache_dir) / TAG_CACHE_FILE, self.root) if cache_dir else None
+        )
+        self.changed_tags = None
+        self._cache_updates = ({}, [])
+        # The last analysis of every file analyzed in this process, so that a
+        # file edited since is reanalyzed from it rather than from scratch
+        self._analyses = {} if incremental else None
+        # 0 extracts tags in this process, without timeouts or memory caps
+        self.num_workers = (os.cpu_count() or 1) if num_workers is None else num_workers
+        self.file_timeout = file_timeout
+        self.memory_limit_mb = memory_limit_mb
+
+    @property
+    def structure(self):
+        if self._structure is None:
+            self._structure = self.create_structure(self.root)
+        return self._structure
+
+    @property
+    def manifest(self) -> Manifest:
+        if self._manifest is None:
+            self._manifest = self._scan(self.root)
+        return self._manifest
+
+    def _scan(self, directory) -> Manifest:
+
+        return scan_workspace(
+            directory,
+            self.exclude_dirs,
+            self.exclude_files,
+            self.respect_gitignore,
+            self.max_file_size,
+        )
+
+    def _manifest_of(self, directory) -> Manifest:
+        """The root is scanned once; other directories are scanned on demand."""
+
+        if os.path.normpath(str(directory)) == os.path.normpath(str(self.root)):
+            return self.manifest
+        return self._scan(directory)
+
+    @property
+    def main_files(self):
+        if self._main_files is None:
+            self._main_files = {
+                os.path.normpath(f) for f in self.list_all_files(self.root)
+            }
+        return self._main_files
 
     def build(self, filepaths, mentioned=None):
         if not filepaths:
@@ -61,32 +164,161 @@ class DevGraph:
 
         mentioned = mentioned or set()
         tags = self._get_tags_from_files(filepaths, mentioned)
-        dev_graph = self._tags_to_graph(tags)
+        if self.tag_cache is None:
+            return tags, self._tags_to_graph(tags)
+
+        # Patch the cached graph with the tags of the changed files only
+        graph = self.tag_cache.load_graph() if self.changed_tags is not None else None
+        dev_graph = self._tags_to_graph(tags, graph, self.changed_tags)
+        updated, removed = self._cache_updates
+        if graph is None or self.changed_tags or updated:
+            self.tag_cache.update(updated, removed, graph=dev_graph)
 
         return tags, dev_graph
 
+    def build_tags(self, filepaths):
+        """The tags of the files, for callers building their own graphs."""
+
+        if not filepaths:
+            return None
+        tags = self._get_tags_from_files(filepaths)
+        if self.tag_cache is not None:
+            updated, removed = self._cache_updates
+            if self.changed_tags or updated or removed:
+                self.tag_cache.update(updated, removed, keep_graph=False)
+        return tags
+
+    def build_graph(self, tags):
+        """The graph of the given tags alone, e.g. of one package."""
+
+        return self._tags_to_graph(tags)
+
+    def refresh(self):
+        """
+        Rescan the workspace and rebuild the graph, for a workspace that is
+        still being worked on. With a tag cache, only the files changed since
+        the last build are analyzed again, and with `incremental` only the
+        statements touched by their edits are parsed again.
+        """
+
+        self._manifest = None
+        self._structure = None
+        self._main_files = None
+        self._project_modules = None
+        self.tree_cache = {}
+        self.tree_context_cache = {}
+        return self.build(self.list_py_files([self.root]))
+
     def _get_tags_from_files(self, filepaths, mentioned=None):
         try:
-            tags_of_files = []
             filepaths = sorted(set(filepaths))
+            cached = self.tag_cache.load() if self.tag_cache else {}
+            tags_by_file = {}
+            stale = []
+            updated = {}
+
+            relative_filepaths = {}
+            for filepath in filepaths:
+                relative_filepath = self.get_relative_filepath(filepath)
+                relative_filepaths[relative_filepath] = filepath
+                entry = cached.get(relative_filepath)
+                mtime_ns = entry.mtime_ns if entry else None
+                if entry is not None and entry.is_valid(filepath):
+                    tags_by_file[filepath] = entry.tags
+                    if entry.mtime_ns != mtime_ns:
+                        updated[relative_filepath] = entry
+                else:
+                    stale.append(filepath)
+
+            tags_by_file.update(self._extract_tags(stale))
+
+            if self.tag_cache is not None:
+                removed = [f for f in cached if f not in relative_filepaths]
+                self.changed_tags = [tag for f in removed for tag in cached[f].tags]
+                for filepath in stale:
+                    relative_filepath = self.get_relative_filepath(filepath)
+                    old_entry = cached.get(relative_filepath)
+                    self.changed_tags.extend(
+                        changed_tags(
+                            old_entry.tags if old_entry else [],
+                            tags_by_file[filepath],
+                        )
+                    )
+                    entry = TagCache.make_entry(filepath, tags_by_file[filepath])
+                    if entry is not None:
+                        updated[relative_filepath] = entry
+                if not cached:
+                    self.changed_tags = None  # Nothing to patch, build from scratch
+                # Written by build together with the graph built from these tags
+                self._cache_updates = (updated, removed)
+                if stale or removed:
+                    logging.info(
+                        f"Extracted tags of {len(stale)} changed files, "
+                        f"{len(filepaths) - len(stale)} cached, {len(removed)} removed"
+                    )
 
-            with ThreadPoolExecutor() as executor:
-                future_to_filepath = {
-                    executor.submit(self._process_file, filepath): filepath
-                    for filepath in filepaths
-                }
-
-                for future in as_completed(future_to_filepath):
-                    tags = future.result()
-                    if tags:
-                        tags_of_files.extend(tags)
-
-            return tags_of_files
+            # Keep the order of the files stable, whichever finished first
+            return [tag for filepath in filepaths for tag in tags_by_file[filepath]]
 
         except RecursionError:
             self.io.tool_error("Disabling code graph, git repo too large?")
             return None
 
+    def _extract_tags(self, filepaths):
+        """
+        Extract the tags of the given files, in worker processes unless there is
+        a single file. A file that fails, times out or exceeds the memory cap is
+        dropped on its own, with no tags.
+        """
+
+        tags_by_file, failures = {}, {}
+        if self._analyses is not None:
+            # Files analyzed here before are reanalyzed here, from that analysis
+            for filepath in filepaths:
+                if filepath in self._analyses:
+                    try:
+                        tags_by_file[filepath] = self._process_file(filepath)
+                    except Exception as e:
+                        failures[filepath] = repr(e)
+            filepaths = [f for f in filepaths if f not in self._analyses]
+
+        use_pool = (
+            self.num_workers > 0
+            and len(filepaths) > 1
+            and not multiprocessing.current_process().daemon
+        )
+        if use_pool:
+            # Workers see the file set of this graph: its manifest, not a rescan
+            # with default options
+            pool = TagExtractionPool(
+                graph_kwargs=dict(
+                    root=self.root,
+                    include_dirs=self.include_dirs,
+                    exclude_dirs=self.exclude_dirs,
+                    exclude_files=self.exclude_files,
+                    manifest=self.manifest,
+                    respect_gitignore=self.respect_gitignore,
+                    max_file_size=self.max_file_size,
+                ),
+                num_workers=self.num_workers,
+                file_timeout=self.file_timeout,
+                memory_limit_mb=self.memory_limit_mb,
+            )
+            pool_tags, pool_failures = pool.extract(filepaths)
+            tags_by_file.update(pool_tags)
+            failures.update(pool_failures)
+        else:
+            for filepath in filepaths:
+                try:
+                    tags_by_file[filepath] = self._process_file(filepath)
+                except Exception as e:
+                    failures[filepath] = repr(e)
+
+        for filepath, reason in failures.items():
+            logging.warning(f"Code graph skips {filepath}: {reason}")
+            tags_by_file[filepath] = []
+        return tags_by_file
+
     def _process_file(self, filepath):
         if not self._is_valid_file(filepath):
             return []
@@ -114,6 +346,9 @@ class DevGraph:
         self.warned_files.add(filepath)
 
     def get_relative_filepath(self, filepath):
+        prefix = os.path.join(self.root, "")
+        if filepath.startswith(prefix) and ".." not in filepath:
+            return filepath[len(prefix) :]
         return os.path.relpath(filepath, self.root)
 
     def get_tags(self, filepath, relative_filepath):
@@ -131,64 +366,28 @@ class DevGraph:
 
     def _get_tags_raw(self, filepath, relative_filepath):
 
-        relative_filepath_list = relative_filepath.split("/")
-        s = self._navigate_structure(relative_filepath_list)
-        if s is None:
-            return
-
-        structure_classes, structure_all_funcs = self._extract_structure_info(s)
-
-        lang, parser = self._get_language_parser(filepath)
-        if not lang:
+        if os.path.normpath(filepath) not in self.main_files:
             return
-
-        code, codelines = self._read_code(filepath)
-        if not code:
+        if filename_to_lang(filepath) != "python":
             return
 
-        tree = parser.parse(bytes(code, "utf-8"))
-
-        try:
-            std_funcs, std_libs = self._std_proj_funcs(code, filepath)
-        except Exception:
-            std_funcs, std_libs = [], []
-
-        builtins_funs = [name for name in dir(builtins)]
-        builtins_funs += dir(list)
-        builtins_funs += dir(dict)
-        builtins_funs += dir(set)
-        builtins_funs += dir(str)
-        builtins_funs += dir(tuple)
-
-        captures = self._get_syntax_captures(lang, tree)
-
-        # Process each capture, identifying and categorizing them
-        saw = set()  # Set to record encountered tag types
-
-        def_count = 0
-        ref_count = 0
-
-        for node, tag in captures:
-            if tag.startswith("name.definition."):
-                identifier = "def"  # Define a class or function
-                def_count += 1
-            elif tag.startswith("name.reference."):
-                identifier = "ref"  # Reference a class or function
-                ref_count += 1
-            else:
-                continue
+        # A single read and parse gives the structure, imports and symbols
+        analysis = self._analyze(filepath)
+        structure_classes, structure_all_funcs = self._extract_structure_info(
+            analysis.structure
+        )
 
-            saw.add(identifier)  # Record the encountered tag type
+        std_funcs, std_libs = self._std_proj_funcs(analysis.imports)
 
-            cur_cdl = codelines[node.start_point[0]]  # Get the current code line
+        for row, tag_name, identifier in analysis.symbols:
+            cur_cdl = analysis.line(row)  # Get the current code line
             category = "class" if "class " in cur_cdl else "function"
-            tag_name = node.text.decode("utf-8")  # Get the tag name
 
             # Ignore standard functions, standard libraries, and built-in functions
             if (
                 tag_name in std_funcs
                 or tag_name in std_libs
-                or tag_name in builtins_funs
+                or tag_name in BUILTIN_NAMES
             ):
                 continue
 
@@ -197,21 +396,13 @@ class DevGraph:
 
             if category == "class":
                 if tag_name in structure_classes:
-                    if "methods" in structure_classes[tag_name]:
-                        class_functions = [
-                            item["name"]
-                            for item in structure_classes[tag_name]["methods"]
-                        ]
-                    else:
-                        class_functions = []
+                    class_span = structure_classes[tag_name]
+                    class_functions = [method.name for method in class_span.methods]
 
                     if identifier == "def":
-                        line_nums = [
-                            structure_classes[tag_name]["start_line"],
-                            structure_classes[tag_name]["end_line"],
-                        ]
+                        line_nums = [class_span.start_line, class_span.end_line]
                     else:
-                        line_nums = [node.start_point[0], node.end_point[0]]
+                        line_nums = [row, row]
 
                     result = Tag(
                         rel_fname=relative_filepath,
@@ -226,19 +417,17 @@ class DevGraph:
                     print(f"Warning: Class {tag_name} not found in structure")
             elif category == "function":
                 if identifier == "def":
-                    cur_cdl = "\n".join(
-                        structure_all_funcs.get(tag_name, {}).get("text", [])
-                    )
-                    line_nums = [
-                        structure_all_funcs.get(tag_name, {}).get(
-                            "start_line", node.start_point[0]
-                        ),
-                        structure_all_funcs.get(tag_name, {}).get(
-                            "end_line", node.end_point[0]
-                        ),
-                    ]
+                    func_span = structure_all_funcs.get(tag_name)
+                    if func_span is not None:
+                        # Decoded only for the definitions that are kept
+                        cur_cdl = analysis.text(func_span)
+                        line_nums = [func_span.start_line, func_span.end_line]
+                    else:
+                        cur_cdl = ""
+                        line_nums = [row, row]
                 else:
-                    line_nums = [node.start_point[0], node.end_point[0]]
+                    cur_cdl += "\n"
+                    line_nums = [row, row]
 
                 result = Tag(
                     rel_fname=relative_filepath,
@@ -253,305 +442,146 @@ class DevGraph:
             if result:  # Check if the result is not None
                 yield result
 
-        if "ref" in saw or "def" not in saw:
-            return  # Return if any references are found or if no definitions are found
+        # Files defining things without calling anything reference every name,
+        # with one tag per name rather than one per occurrence
+        rows_by_name = defaultdict(list)
+        for row, name in analysis.names:
+            rows_by_name[name].append(row)
+        for name, rows in rows_by_name.items():
+            lines = sorted(set(rows))
+            yield Tag(
+                rel_fname=relative_filepath,
+                fname=filepath,
+                name=name,
+                identifier="ref",
+                line=[lines[0], lines[-1]],
+                category="function",
+                details="none",
+                count=len(rows),
+                lines=tuple(lines),
+            )
+
+    def _analyze(self, filepath):
 
-        yield from self._process_additional_tokens(
-            filepath, relative_filepath, codelines
-        )
+        if self._analyses is None:
+            return analyze_file(filepath)
+        with open(filepath, "rb") as f:
+            source = f.read()
+        previous = self._analyses.get(filepath)
+        if previous is None:
+            analysis = analyze_source(source)
+        else:
+            analysis = reanalyze_source(previous, source)
+        self._analyses[filepath] = analysis
+        return analysis
 
     def _navigate_structure(self, relative_filepath_list):
-        s = deepcopy(self.structure)
-        for fname_part in relative_filepath_list:
-            s = s.get(fname_part)
-            if s is None:
-                return None
-        return s
+        relative_filepath = "/".join(relative_filepath_list)
+        if self._structure is None:
+            # Parse only this file instead of the whole workspace
+            return self._file_structure(relative_filepath)
+        return self.structure.get(relative_filepath)
+
+    def _file_structure(self, relative_filepath):
+        filepath = os.path.join(self.root, relative_filepath)
+        if os.path.normpath(filepath) not in self.main_files:
+            return None
+        if not filepath.endswith(".py"):
+            return EMPTY_STRUCTURE
+
+        try:
+            return analyze_file(filepath).structure
+        except Exception as e:
+            print(f"Error in file {filepath}: {e}")
+            return EMPTY_STRUCTURE
 
     def _extract_structure_info(self, s):
-        structure_classes = {item["name"]: item for item in s.get("classes", [])}
-        structure_functions = {item["name"]: item for item in s.get("functions", [])}
+        structure_classes = {span.name: span for span in s.classes}
+        structure_functions = {span.name: span for span in s.functions}
         structure_class_methods = {
-            item["name"]: item
-            for cls in s.get("classes", [])
-            for item in cls.get("methods", [])
+            span.name: span for cls in s.classes for span in cls.methods
         }
         structure_all_funcs = {**structure_functions, **structure_class_methods}
 
         return structure_classes, structure_all_funcs
 
-    def _get_language_parser(self, filepath):
-        lang = filename_to_lang(filepath)
-        if not lang:
-            return None, None
-
-        language = get_language(lang)
-        parser = get_parser(lang)
-        return language, parser
-
-    def _read_code(self, filepath):
-
-        with open(filepath, "r", encoding="utf-8") as f:
-            code = f.read()
-
-        # Preprocess the code content, replacing some special characters and patterns
-        code = code.replace("\ufeff", "")  # Remove BOM marker
-        code = code.replace("constants.False", "_False")
-        code = code.replace("constants.True", "_True")
-        code = code.replace("False", "_False")
-        code = code.replace("True", "_True")
-        code = code.replace("DOMAIN\\username", "DOMAIN\\\\username")
-        code = code.replace("Error, ", "Error as ")
-        code = code.replace("Exception, ", "Exception as ")
-        code = code.replace("print ", "yield ")
-
-        # Replace some exception handling patterns to match new syntax
-        pattern = r"except\s+\(([^,]+)\s+as\s+([^)]+)\):"
-        code = re.sub(pattern, r"except (\1, \2):", code)
-        code = code.replace("raise AttributeError as aname", "raise AttributeError")
-
-        if not code:
-            return "", []
-
-        with open(str(filepath), "r", encoding="utf-8") as f:
-            codelines = f.readlines()
-
-        return code, codelines
-
-    def _get_syntax_captures(self, language, tree):
-        query_scm = """
-        (class_definition
-        name: (identifier) @name.definition.class) @definition.class
-
-        (function_definition
-        name: (identifier) @name.definition.function) @definition.function
-
-        (call
-        function: [
-            (identifier) @name.reference.call
-            (attribute
-                attribute: (identifier) @name.reference.call)
-        ]) @reference.call
-        """
-        query = language.query(query_scm)
-        return query.captures(tree.root_node)
-
-    def _process_captures(
-        self,
-        captures,
-        codelines,
-        std_funcs,
-        std_libs,
-        builtins_funs,
-        structure_classes,
-        structure_all_funcs,
-        filepath,
-        relative_filepath,
-    ):
-
-        captures = list(captures)
-        saw = set()
-
-        def_count = 0
-        ref_count = 0
-
-        for node, tag in captures:
-            if tag.startswith("name.definition."):
-                identifier = "def"  # Define a class or function
-                def_count += 1
-            elif tag.startswith("name.reference."):
-                identifier = "ref"  # Reference a class or function
-                ref_count += 1
-            else:
-                continue
-
-            saw.add(identifier)
+    def _tags_to_graph(self, tags, graph=None, changed_tags=None):
+        if graph is not None and changed_tags is not None:
+            return self._patch_graph(graph, tags, changed_tags)
 
-            cur_cdl = codelines[node.start_point[0]]  # Get the current code line
-            category = (
-                "class" if "class " in cur_cdl else "function"
-            )  # Determine if the tag belongs to a class or function
-            tag_name = node.text.decode("utf-8")  # Get the tag name
+        G = nx.MultiDiGraph()
+        self._add_nodes(G, tags)
+        self._add_class_edges(G, tags)
+        self._add_reference_edges(G, tags)
+        return G
 
-            if tag_name in std_funcs:
-                continue
-            elif tag_name in std_libs:
-                continue
-            elif tag_name in builtins_funs:
-                continue
+    def _patch_graph(self, G, tags, changed_tags):
+        """
+        Update a graph built from older tags: only the nodes named by the tags of
+        changed files (and the methods they list) are removed and rebuilt.
+        """
 
-            if category == "class":
-                # Handle class tag information
-                class_functions = [
-                    item["name"] for item in structure_classes[tag_name]["methods"]
-                ]
-                if identifier == "def":
-                    line_nums = [
-                        structure_classes[tag_name]["start_line"],
-                        structure_classes[tag_name]["end_line"],
-                    ]
-                else:
-                    line_nums = [node.start_point[0], node.end_point[0]]
-                result = Tag(
-                    rel_fname=relative_filepath,
-                    fname=filepath,
-                    name=tag_name,
-                    identifier=identifier,
-                    category=category,
-                    details="\n".join(class_functions),  # Class method information
-                    line=line_nums,
-                )
-            elif category == "function":
-                # Handle function tag information
-                if identifier == "def":
-                    cur_cdl = "\n".join(structure_all_funcs[tag_name]["text"])
-                    line_nums = [
-                        structure_all_funcs[tag_name]["start_line"],
-                        structure_all_funcs[tag_name]["end_line"],
-                    ]
-                else:
-                    line_nums = [node.start_point[0], node.end_point[0]]
+        affected = set()
+        for tag in changed_tags:
+            affected.add(tag.name)
+            if tag.category == "class":
+                affected.update(f.strip() for f in tag.details.split("\n"))
+        if not affected:
+            return G
+
+        G.remove_nodes_from([name for name in affected if name in G])
+        self._add_nodes(G, tags, affected)
+        self._add_class_edges(G, tags, affected)
+        self._add_reference_edges(G, tags, affected)
+        return G
 
-                result = Tag(
-                    rel_fname=relative_filepath,
-                    fname=filepath,
-                    name=tag_name,
-                    identifier=identifier,
-                    category=category,
-                    details=cur_cdl,
-                    line=line_nums,
+    def _add_nodes(self, G, tags, names=None):
+        for tag in tags:
+            if names is None or tag.name in names:
+                G.add_node(
+                    tag.name,
+                    category=tag.category,
+                    details=tag.details,
+                    fname=tag.fname,
+                    line=tag.line,
+                    identifier=tag.identifier,
                 )
 
-            yield result  # Generate tag result
-
-        if "ref" in saw or "def" not in saw:
-            return
-
-        yield from self._process_additional_tokens(
-            filepath, relative_filepath, codelines
-        )
-
-    def _identify_tag(self, node, tag, codelines):
-        if tag.startswith("name.definition."):
-            identifier = "def"
-        elif tag.startswith("name.reference."):
-            identifier = "ref"
-        else:
-            return None, None
-
-        cur_cdl = codelines[node.start_point[0]]
-        category = "class" if "class " in cur_cdl else "function"
-        return identifier, category
-
-    def _is_ignored_tag(self, tag_name, std_funcs, std_libs):
-        return (
-            tag_name in std_funcs or tag_name in std_libs or tag_name in dir(builtins)
-        )
-
-    def _create_class_tag(
-        self, tag_name, identifier, structure_classes, node, filepath, relative_filepath
-    ):
-        class_info = structure_classes.get(tag_name, {})
-        class_methods = "\n".join(
-            [item["name"] for item in class_info.get("methods", [])]
-        )
-        line_nums = [
-            class_info.get("start_line", node.start_point[0]),
-            class_info.get("end_line", node.end_point[0]),
-        ]
-        return Tag(
-            rel_fname=relative_filepath,
-            fname=filepath,
-            name=tag_name,
-            identifier=identifier,
-            category="class",
-            details=class_methods,
-            line=line_nums,
-        )
-
-    def _create_function_tag(
-        self,
-        tag_name,
-        identifier,
-        structure_all_funcs,
-        node,
-        filepath,
-        relative_filepath,
-        codelines,
-    ):
-        func_info = structure_all_funcs.get(tag_name, {})
-        line_nums = [
-            func_info.get("start_line", node.start_point[0]),
-            func_info.get("end_line", node.end_point[0]),
-        ]
-        details = "\n".join(
-            func_info.get("text", codelines[node.start_point[0] : node.end_point[0]])
-        )
-        return Tag(
-            rel_fname=relative_filepath,
-            fname=filepath,
-            name=tag_name,
-            identifier=identifier,
-            category="function",
-            details=details,
-            line=line_nums,
-        )
-
-    def _process_additional_tokens(self, filepath, relative_filepath, codelines):
-
-        code = "\n".join(codelines)
-
-        try:
-            lexer = guess_lexer_for_filename(filepath, code)
-        except ClassNotFound:
-            return
-
-        tokens = list(lexer.get_tokens(code))
-        tokens = [token[1] for token in tokens if token[0] in Token.Name]
-
-        for token in tokens:
-            yield Tag(
-                rel_fname=relative_filepath,
-                fname=filepath,
-                name=token,
-                identifier="ref",
-                line=-1,
-                category="function",
-                details="none",
-            )
-
-    def _tags_to_graph(self, tags):
-        G = nx.MultiDiGraph()
+    def _add_class_edges(self, G, tags, names=None):
+        """One class -> method edge per pair, counting the class tags listing it."""
 
+        counts = Counter()
         for tag in tags:
-            G.add_node(
-                tag.name,
-                category=tag.category,
-                details=tag.details,
-                fname=tag.fname,
-                line=tag.line,
-                identifier=tag.identifier,
-            )
+            if tag.category != "class":
+                continue
+            for f in tag.details.split("\n"):
+                f = f.strip()
+                if names is None or tag.name in names or f in names:
+                    counts[tag.name, f] += 1
 
-        for tag in tags:
-            if tag.category == "class":
-                self._add_class_edges(G, tag)
+        for (name, f), count in counts.items():
+            G.add_edge(name, f, key="method", count=count)
 
-        self._add_reference_edges(G, tags)
-        return G
+    def _add_reference_edges(self, G, tags, names=None):
+        """
+        Link references to definitions through a name -> definitions index. Each
+        name gets one edge whose count is the number of (reference, def) pairs.
+        """
 
-    def _add_class_edges(self, G, tag):
-        class_funcs = tag.details.split("\n")
-        for f in class_funcs:
-            G.add_edge(tag.name, f.strip())
+        ref_counts = Counter()
+        defs_by_name = defaultdict(list)
+        for tag in tags:
+            if names is not None and tag.name not in names:
+                continue
+            if tag.identifier == "ref":
+                ref_counts[tag.name] += tag.count
+            elif tag.identifier == "def":
+                defs_by_name[tag.name].append(tag)
 
-    def _add_reference_edges(self, G, tags):
-        tags_ref = [tag for tag in tags if tag.identifier == "ref"]
-        tags_def = [tag for tag in tags if tag.identifier == "def"]
-        for tag_ref in tags_ref:
-            for tag_def in tags_def:
-                if tag_ref.name == tag_def.name:
-                    G.add_edge(tag_ref.name, tag_def.name)
+        for name, ref_count in ref_counts.items():
+            defs = defs_by_name.get(name)
+            if defs:
+                G.add_edge(name, name, key="reference", count=ref_count * len(defs))
 
     def split_path(self, path):
         path = os.path.relpath(path, self.root)
@@ -577,165 +607,104 @@ class DevGraph:
 
         return match.group(0) if match else None
 
-    def _std_proj_funcs(self, code, fname):
-        std_libs = []
-        std_funcs = []
-        tree = ast.parse(code)
-        codelines = code.split("\n")
+    def _std_proj_funcs(self, imports):
+        """
+        Names to ignore because they come from libraries: the imported names and
+        the callable members of imported library modules and classes, looked up
+        in the static symbol table. Imports of unknown, non-workspace modules are
+        treated as external. Nothing is ever imported.
+        """
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                import_statement = codelines[node.lineno - 1]
-                for alias in node.names:
-                    import_name = alias.name.split(".")[0]
-                    if import_name in fname:
-                        continue
-                    else:
-                        try:
-                            exec(import_statement.strip())
-                        except:
-                            continue
-                        std_libs.append(alias.name)
-                        eval_name = alias.name if alias.asname is None else alias.asname
-                        std_funcs.extend(
-                            [
-                                name
-                                for name, member in inspect.getmembers(eval(eval_name))
-                                if callable(member)
-                            ]
-                        )
+        std_libs = set()
+        std_funcs = set()
+        symbol_table = get_symbol_table()
 
-            if isinstance(node, ast.ImportFrom):
-                import_statement = codelines[node.lineno - 1]
-                if node.module is None:
-                    continue
-                module_name = node.module.split(".")[0]
-                if module_name in fname:
-                    continue
-                else:
-                    if "(" in import_statement:
-                        for ln in range(node.lineno - 1, len(codelines)):
-                            if ")" in codelines[ln]:
-                                code_num = ln
-                                break
-                        import_statement = "\n".join(
-                            codelines[node.lineno - 1 : code_num + 1]
-                        )
-                    try:
-                        exec(import_statement.strip())
-                    except:
-                        continue
-                    for alias in node.names:
-                        std_libs.append(alias.name)
-                        eval_name = alias.name if alias.asname is None else alias.asname
-                        if eval_name == "*":
-                            continue
-                        std_funcs.extend(
-                            [
-                                name
-                                for name, member in inspect.getmembers(eval(eval_name))
-                                if callable(member)
-                            ]
-                        )
+        for module, name, level in imports:
+            if module is None or level > 0 or self._is_project_module(module):
+                continue
+            if name is None:
+                # import module
+                std_libs.add(module)
+                std_funcs.update(symbol_table.module_callables(module) or ())
+            elif name == "*":
+                std_funcs.update(symbol_table.module_callables(module) or ())
+            else:
+                std_libs.add(name)
+                std_funcs.update(symbol_table.member_callables(module, name) or ())
         return std_funcs, std_libs
 
+    @property
+    def project_modules(self):
+        """Names of the Python modules and packages of the workspace itself."""
+
+        if self._project_modules is None:
+            modules = set()
+            for filepath in self.main_files:
+                if filepath.endswith(".py"):
+                    parts = Path(self.get_relative_filepath(filepath)).parts
+                    modules.update(parts[:-1])
+                    modules.add(Path(filepath).stem)
+            self._project_modules = modules
+        return self._project_modules
+
+    def _is_project_module(self, module):
+        return module.split(".")[0] in self.project_modules
+
     def create_structure(self, directory_path):
-        structure = {}
-        main_file_set = set(self.list_all_files(directory_path))
-        num_files = len(list(os.walk(directory_path)))
-        for root, _, files in tqdm(
-            os.walk(directory_path), total=num_files, desc="Parsing files"
-        ):
-            relative_root = os.path.relpath(root, directory_path)
-            current_structure = structure
-
-            if relative_root != ".":
-                for part in relative_root.split(os.sep):
-                    if part not in current_structure:
-                        current_structure[part] = {}
-                    current_structure = current_structure[part]
-
-            for filename in files:
-                if filename.endswith(".py"):
-                    filepath = os.path.join(root, filename)
-                    if filepath not in main_file_set:
-                        continue  # added to avoid parsing the contents of venv/
-                    class_info, function_names, code_lines = self.parse_python_file(
-                        filepath
-                    )
-                    current_structure[filename] = {
-                        "classes": class_info,
-                        "functions": function_names,
-                        "code": code_lines,
-                    }
-                else:
-                    current_structure[filename] = {}
+        """
+        The classes, methods and functions of every workspace file, indexed by
+        relative path. Only line numbers and byte offsets are kept; the source
+        is read from the files when needed.
+        """
+
+        structure = StructureStore(directory_path)
+        manifest = self._manifest_of(directory_path)
+        entries = sorted(manifest.files(self.include_dirs), key=lambda e: e.path)
+        for entry in tqdm(entries, desc="Parsing files"):
+            filepath = manifest.abspath(entry)
+            # Binary and oversized files are listed without being parsed
+            if entry.path.endswith(".py") and entry.type == TEXT:
+                try:
+                    analysis = analyze_file(filepath)
+                except Exception as e:
+                    print(f"Error in file {filepath}: {e}")
+                    continue
+                if analysis.error is not None:
+                    print(f"Error in file {filepath}: {analysis.error}")
+                structure.add(entry.path, analysis.structure)
+            else:
+                structure.add(entry.path, EMPTY_STRUCTURE)
 
         return structure
 
     def parse_python_file(self, file_path, file_content=None):
-        if file_content is None:
-            try:
-                with open(file_path, "r") as file:
-                    file_content = file.read()
-                    parsed_data = ast.parse(file_content)
-            except Exception as e:
-                print(f"Error in file {file_path}: {e}")
-                return [], [], ""
-        else:
-            try:
-                parsed_data = ast.parse(file_content)
-            except Exception as e:
-                print(f"Error in file {file_path}: {e}")
-                return [], [], ""
-
-        class_info = []
-        function_names = []
-        class_methods = set()
-
-        for node in ast.walk(parsed_data):
-            if isinstance(node, ast.ClassDef):
-                methods = []
-                for n in node.body:
-                    if isinstance(n, ast.FunctionDef):
-                        methods.append(
-                            {
-                                "name": n.name,
-                                "start_line": n.lineno,
-                                "end_line": n.end_lineno,
-                                "text": file_content.splitlines()[
-                                    n.lineno - 1 : n.end_lineno
-                                ],
-                            }
-                        )
-                        class_methods.add(n.name)
-                class_info.append(
-                    {
-                        "name": node.name,
-                        "start_line": node.lineno,
-                        "end_line": node.end_lineno,
-                        "text": file_content.splitlines()[
-                            node.lineno - 1 : node.end_lineno
-                        ],
-                        "methods": methods,
-                    }
-                )
-            elif isinstance(node, ast.FunctionDef) and not isinstance(
-                node, ast.AsyncFunctionDef
-            ):
-                if node.name not in class_methods:
-                    function_names.append(
-                        {
-                            "name": node.name,
-                            "start_line": node.lineno,
-                            "end_line": node.end_lineno,
-                            "text": file_content.splitlines()[
-                                node.lineno - 1 : node.end_lineno
-                            ],
-                        }
-                    )
+        try:
+            if file_content is None:
+                analysis = analyze_file(file_path)
+            else:
+                analysis = analyze_source(file_content)
+        except Exception as e:
+            print(f"Error in file {file_path}: {e}")
+            return [], [], ""
+        if analysis.error is not None:
+            print(f"Error in file {file_path}: {analysis.error}")
+            return [], [], ""
+
+        def span_info(span):
+            return {
+                "name": span.name,
+                "start_line": span.start_line,
+                "end_line": span.end_line,
+                "text": analysis.text(span).split("\n"),
+            }
 
-        return class_info, function_names, file_content.splitlines()
+        class_info = [
+            {**span_info(span), "methods": [span_info(m) for m in span.methods]}
+            for span in analysis.structure.classes
+        ]
+        function_names = [span_info(span) for span in analysis.structure.functions]
+        code = decode_lines(analysis.source[analysis.offsets[0] :])
+        return class_info, function_names, code.split("\n") if code else []
 
     def render_tree(self, abs_fname, rel_fname, lois):
         key = (rel_fname, tuple(sorted(lois)))
@@ -743,25 +712,34 @@ class DevGraph:
         if key in self.tree_cache:
             return self.tree_cache[key]
 
-        with open(str(abs_fname), "r", encoding="utf-8") as f:
-            code = f.read() or ""
-
-        if not code.endswith("\n"):
-            code += "\n"
-
-        context = TreeContext(
-            rel_fname,
-            code,
-            color=False,
-            line_number=False,
-            child_context=False,
-            last_line=False,
-            margin=0,
-            mark_lois=False,
-            loi_pad=0,
-            show_top_of_file_parent_scope=False,
-        )
+        # Files are parsed once; only the lines of interest change between calls
+        context = self.tree_context_cache.get(rel_fname)
+        if context is None:
+            try:
+                with open(str(abs_fname), "r", encoding="utf-8") as f:
+                    code = f.read() or ""
+            except (OSError, UnicodeDecodeError) as e:
+                logging.warning(f"Failed to read {abs_fname}: {e}")
+                return ""
+
+            if not code.endswith("\n"):
+                code += "\n"
+
+            context = TreeContext(
+                rel_fname,
+                code,
+                color=False,
+                line_number=False,
+                child_context=False,
+                last_line=False,
+                margin=0,
+                mark_lois=False,
+                loi_pad=0,
+                show_top_of_file_parent_scope=False,
+            )
+            self.tree_context_cache[rel_fname] = context
 
+        context.lines_of_interest = set()
         context.add_lines_of_interest(lois)
         context.add_context()
         res = context.format()
@@ -792,69 +770,54 @@ class DevGraph:
                     lois = None
                 elif cur_fname:
                     output += "\n" + cur_fname + "\n"
-                if identifier(tag) is Tag:
+                if isinstance(tag, Tag):
                     lois = []
                     cur_abs_fname = tag.fname
                 cur_fname = this_rel_fname
 
             if lois is not None:
-                lois.append(tag.line)
+                lois.append(self._tag_row(tag))
 
         # truncate long lines, in case we get minified js or something else crazy
         output = "\n".join([line[:100] for line in output.splitlines()]) + "\n"
 
         return output
 
+    @staticmethod
+    def _tag_row(tag):
+        """The 0-based row a tag points at, for TreeContext."""
+
+        line = tag.line[0] if isinstance(tag.line, (list, tuple)) else tag.line
+        # Definitions span 1-based structure lines; references hold rows
+        if tag.identifier == "def":
+            line -= 1
+        return max(line, 0)
+
     def list_all_files(self, directory):
         """
-        Recursively list all files under the given directory while applying the
-        inclusion/exclusion rules for directories and files, and excluding hidden files.
+        All files under the given directory that pass the inclusion/exclusion
+        rules, from the manifest of the directory.
         """
-        main_files = []
-        include_all = self.include_dirs is None
-
-        for root, dirs, files in os.walk(directory):
-            dirs[:] = [
-                d
-                for d in dirs
-                if not any(
-                    excluded in os.path.basename(d) for excluded in self.exclude_dirs
-                )
-            ]
-            if include_all or any(included in root for included in self.include_dirs):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if not file.startswith(".") and not any(
-                        excluded_file in file for excluded_file in self.exclude_files
-                    ):
-                        main_files.append(file_path)
 
-        return main_files
+        manifest = self._manifest_of(directory)
+        return [manifest.abspath(entry) for entry in manifest.files(self.include_dirs)]
 
     def list_py_files(self, directories: List, python_only=True):
         files = []
         for directory in directories:
             if Path(directory).is_dir():
-                files += self.list_all_files(
-                    directory
-                )  # Recursively get all files/directories
-            else:
+                manifest = self._manifest_of(directory)
+                files += [
+                    manifest.abspath(entry)
+                    for entry in manifest.files(self.include_dirs)
+                    # Binary and oversized files are never parsed
+                    if not python_only
+                    or (entry.path.endswith(".py") and entry.type == TEXT)
+                ]
+            elif not python_only or str(directory).endswith(".py"):
                 files.append(directory)
 
-        if not python_only:
-            return files
-
-        python_files = []
-        for item in files:
-            if not item.endswith(".py"):
-                continue
-
-            # relative_path = os.path.relpath(item, self.root)
-            # if self._is_included(relative_path):
-            #     python_files.append(item)
-            python_files.append(item)
-
-        return python_files
+        return files
 
     def save_file_structure(self, dir, save_dir):
         """
@@ -862,36 +825,7 @@ class DevGraph:
         inclusion/exclusion rules for directories and files, and excluding hidden files.
         """
 
-        def build_tree_structure(current_path):
-            tree = {}
-            include_all = self.include_dirs is None
-
-            for root, dirs, files in os.walk(current_path):
-                dirs[:] = [
-                    d
-                    for d in dirs
-                    if not any(excluded in d for excluded in self.exclude_dirs)
-                    and not d.startswith(".")
-                ]
-                if include_all or any(
-                    included in root for included in self.include_dirs
-                ):
-                    relative_root = os.path.relpath(root, self.root)
-
-                    tree[relative_root] = {}
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if not file.startswith(".") and not any(
-                            excluded_file in file
-                            for excluded_file in self.exclude_files
-                        ):
-                            # Add the file to the tree structure
-                            tree[relative_root][file] = None
-
-            return tree
-
-        # Build the directory tree structure
-        tree_structure = build_tree_structure(dir)
+        tree_structure = self._manifest_of(dir).tree_structure(self.include_dirs)
 
         print(
             f"🌲 Successfully constructed the directory tree structure for directory ''{dir}： \n{tree_structure}''"
@@ -946,14 +880,10 @@ if __name__ == "__main__":
     # all_files = dev_graph.list_all_files(workspace_path)
     py_files = dev_graph.list_py_files([workspace_path])
     tags, G = dev_graph.build(py_files)
-    with open(os.path.join(judge_path, "graph.pkl"), "wb") as f:
-        pickle.dump(G, f)
+    CodeGraph.from_networkx(G).save(judge_path)
 
-    with open(os.path.join(judge_path, "graph.pkl"), "rb") as f:
-        try:
-            G = pickle.load(f)
-        except EOFError:
-            G = nx.MultiDiGraph()
+    # The saved graph is memory-mapped; networkx is only needed for drawing
+    G = CodeGraph.load(judge_path).to_networkx()
     dev_graph.save_file_structure(
         workspace_path, os.path.join(judge_path, "tree_structure.json")
     )
@@ -0,0 +1,353 @@
+"""
+GraphQuery: indexed queries over the definitions of a workspace and the calls
+between them, for evidence that follows the code instead of quoting whole files.
+
+The nodes are the definition tags of the tag store. A reference is attributed to
+the innermost definition whose lines contain it, which the name-level code graph
+cannot tell, and linked to the definitions of the name it refers to (those of
+its own file when there are any). Classes are linked to their methods and
+functions to the functions nested in them. The edges are kept in CSR layout in
+both directions, next to the definitions grouped by name and by file, so that
+definitions, callers, callees and k-hop neighbourhoods are array lookups.
+
+The entry points of a file are the definitions called from its module-level
+code, followed by its top-level definitions that nothing else in the file calls.
+"""
+
+import os
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent_as_a_judge.module.tag_store import NO_END, TagStore
+from agent_as_a_judge.utils import count_tokens
+
+
+EDGE_TYPES = ("calls", "method", "contains")
+
+# Followed by default when expanding evidence
+EVIDENCE_EDGE_TYPES = ("calls", "method")
+
+
+def _group(keys: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR offsets and the positions of `keys` grouped by key."""
+
+    order = np.argsort(keys, kind="stable").astype(np.int32)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return offsets, order
+
+
+class GraphQuery:
+    def __init__(self, tags: TagStore):
+
+        self.tags = tags
+        identifiers = tags.values("identifier")
+        identifier_ids = tags.ids("identifier")
+        def_id = identifiers.index("def") if "def" in identifiers else -1
+        ref_id = identifiers.index("ref") if "ref" in identifiers else -1
+
+        # Node -> tag index
+        self.node_tags = np.flatnonzero(identifier_ids == def_id).astype(np.int32)
+        num_nodes = len(self.node_tags)
+        line = tags.arrays["line"].reshape(-1, 2)
+        self.starts = line[self.node_tags, 0].astype(np.int32)
+        ends = line[self.node_tags, 1]
+        self.ends = np.where(ends == NO_END, self.starts, ends).astype(np.int32)
+        self.node_names = tags.ids("name")[self.node_tags]
+        self.node_files = tags.ids("rel_fname")[self.node_tags]
+        categories = tags.values("category")
+        self.node_is_class = np.array(
+            [categories[i] == "class" for i in tags.ids("category")[self.node_tags]],
+            dtype=bool,
+        )
+
+        self._name_ids = None
+        self._file_ids = None
+        self.by_name = _group(self.node_names, len(tags.values("name")))
+        self.by_file = _group(self.node_files, len(tags.values("rel_fname")))
+
+        parents, owners = self._nest()
+        edges = Counter()
+        for child, parent in enumerate(parents.tolist()):
+            if parent >= 0:
+                edge_type = "method" if self.node_is_class[parent] else "contains"
+                edges[parent, child, EDGE_TYPES.index(edge_type)] += 1
+
+        module_calls = defaultdict(set)
+        ref_tags = np.flatnonzero(identifier_ids == ref_id).tolist()
+        name_ids = tags.ids("name")
+        file_ids = tags.ids("rel_fname")
+        lines_offsets = tags.arrays["lines_offsets"]
+        rows = tags.arrays["lines"]
+        for t in ref_tags:
+            callees = self._callees_of(int(name_ids[t]), int(file_ids[t]))
+            if not len(callees):
+                continue
+            start, end = lines_offsets[t], lines_offsets[t + 1]
+            tag_rows = rows[start:end].tolist() if end > start else [line[t, 0]]
+            owner = owners.get(int(file_ids[t]))
+            for row in tag_rows:
+                # Reference rows are 0-based, definition lines 1-based
+                caller = -1
+                if owner is not None and 0 <= row + 1 < len(owner):
+                    caller = int(owner[row + 1])
+                if caller < 0:
+                    module_calls[int(file_ids[t])].update(callees.tolist())
+                    continue
+                for callee in callees.tolist():
+                    if callee != caller:
+                        edges[caller, callee, 0] += 1
+
+        self._build_csr(edges, num_nodes)
+        self._entry_points = self._find_entry_points(parents, module_calls)
+
+    # Building
+
+    def _nest(self) -> Tuple[np.ndarray, Dict[int, np.ndarray]]:
+        """
+        The enclosing definition of every node, and per file the innermost
+        definition of every line (-1 for module-level lines).
+        """
+
+        parents = np.full(len(self.node_tags), -1, dtype=np.int32)
+        owners = {}
+        offsets, order = self.by_file
+        for file_id in np.flatnonzero(np.diff(offsets)).tolist():
+            nodes = order[offsets[file_id] : offsets[file_id + 1]].tolist()
+            # Outer definitions are painted before the ones nested in them
+            nodes.sort(key=lambda v: (self.starts[v], -self.ends[v]))
+            owner = np.full(int(self.ends[nodes].max()) + 2, -1, dtype=np.int32)
+            for v in nodes:
+                start, end = int(self.starts[v]), int(self.ends[v])
+                parents[v] = owner[start]
+                owner[start : end + 1] = v
+            owners[file_id] = owner
+        return parents, owners
+
+    def _callees_of(self, name_id: int, file_id: int) -> np.ndarray:
+
+        offsets, order = self.by_name
+        nodes = order[offsets[name_id] : offsets[name_id + 1]]
+        # A name defined in the referencing file most likely means that one
+        local = nodes[self.node_files[nodes] == file_id]
+        return local if len(local) else nodes
+
+    def _build_csr(self, edges: Counter, num_nodes: int):
+
+        items = sorted(edges.items())
+        sources = np.array([key[0] for key, _ in items], dtype=np.int32)
+        self.out_targets = np.array([key[1] for key, _ in items], dtype=np.int32)
+        self.out_types = np.array([key[2] for key, _ in items], dtype=np.int8)
+        self.out_counts = np.array([count for _, count in items], dtype=np.int64)
+        self.out_sources = sources
+        self.out_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=self.out_offsets[1:])
+        self.in_offsets, self.in_edges = _group(self.out_targets, num_nodes)
+
+    def _find_entry_points(
+        self, parents: np.ndarray, module_calls: Dict[int, set]
+    ) -> Dict[int, List[int]]:
+
+        called_in_file = set()
+        calls = np.flatnonzero(self.out_types == 0)
+        same_file = (
+            self.node_files[self.out_sources[calls]]
+            == self.node_files[self.out_targets[calls]]
+        )
+        called_in_file.update(self.out_targets[calls[same_file]].tolist())
+
+        entry_points = {}
+        offsets, order = self.by_file
+        for file_id in np.flatnonzero(np.diff(offsets)).tolist():
+            nodes = order[offsets[file_id] : offsets[file_id + 1]].tolist()
+            top_level = [
+                v for v in nodes if parents[v] < 0 and v not in called_in_file
+            ]
+            called = sorted(module_calls.get(file_id, ()), key=self._position)
+            entry_points[file_id] = called + sorted(
+                set(top_level).difference(called), key=self._position
+            )
+        return entry_points
+
+    def _position(self, node: int) -> Tuple[int, int]:
+
+        return int(self.node_files[node]), int(self.starts[node])
+
+    # Queries
+
+    def __len__(self) -> int:
+
+        return len(self.node_tags)
+
+    def tag(self, node: int) -> Dict:
+        """The tag record of a node."""
+
+        return self.tags[int(self.node_tags[node])]
+
+    def name(self, node: int) -> str:
+
+        return self.tags.values("name")[int(self.node_names[node])]
+
+    def rel_fname(self, node: int) -> str:
+
+        return self.tags.values("rel_fname")[int(self.node_files[node])]
+
+    def definitions(self, name: str) -> List[int]:
+        """The nodes defining a name."""
+
+        if self._name_ids is None:
+            self._name_ids = {v: i for i, v in enumerate(self.tags.values("name"))}
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            return []
+        offsets, order = self.by_name
+        return order[offsets[name_id] : offsets[name_id + 1]].tolist()
+
+    def file_definitions(self, path: str) -> List[int]:
+        """The nodes of a file, in line order."""
+
+        file_id = self._file_id(path)
+        if file_id is None:
+            return []
+        offsets, order = self.by_file
+        nodes = order[offsets[file_id] : offsets[file_id + 1]].tolist()
+        return sorted(nodes, key=lambda v: self.starts[v])
+
+    def entry_points(self, path: str) -> List[int]:
+
+        file_id = self._file_id(path)
+        if file_id is None:
+            return []
+        return list(self._entry_points.get(file_id, ()))
+
+    def successors(
+        self, node: int, edge_types: Optional[Iterable[str]] = None
+    ) -> List[Tuple[int, str, int]]:
+        """(target, edge type, count) of every edge leaving the node."""
+
+        edges = range(self.out_offsets[node], self.out_offsets[node + 1])
+        return self._edges(edges, edge_types, self.out_targets)
+
+    def predecessors(
+        self, node: int, edge_types: Optional[Iterable[str]] = None
+    ) -> List[Tuple[int, str, int]]:
+        """(source, edge type, count) of every edge entering the node."""
+
+        edges = self.in_edges[self.in_offsets[node] : self.in_offsets[node + 1]]
+        return self._edges(edges.tolist(), edge_types, self.out_sources)
+
+    def callees(self, node: int) -> List[Tuple[int, str, int]]:
+
+        return self.successors(node, ("calls",))
+
+    def callers(self, node: int) -> List[Tuple[int, str, int]]:
+
+        return self.predecessors(node, ("calls",))
+
+    def neighborhood(
+        self,
+        nodes: Iterable[int],
+        hops: int = 1,
+        direction: str = "out",
+        edge_types: Optional[Iterable[str]] = None,
+    ) -> Dict[int, int]:
+        """
+        The nodes within `hops` edges of `nodes`, with their distance, in
+        breadth-first order. `direction` is "out", "in" or "both".
+        """
+
+        if direction not in ("out", "in", "both"):
+            raise ValueError(f"Unsupported direction: {direction}")
+        distances = {}
+        frontier = []
+        for node in nodes:
+            if node not in distances:
+                distances[node] = 0
+                frontier.append(node)
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for node in frontier:
+                neighbors = []
+                if direction in ("out", "both"):
+                    neighbors += self.successors(node, edge_types)
+                if direction in ("in", "both"):
+                    neighbors += self.predecessors(node, edge_types)
+                for neighbor, _, _ in neighbors:
+                    if neighbor not in distances:
+                        distances[neighbor] = hop
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return distances
+
+    def reachable_from_files(
+        self,
+        paths: Iterable[str],
+        hops: int = 2,
+        edge_types: Optional[Iterable[str]] = EVIDENCE_EDGE_TYPES,
+    ) -> Dict[int, int]:
+        """The nodes reachable from the entry points of the files."""
+
+        entry_points = [node for path in paths for node in self.entry_points(path)]
+        return self.neighborhood(entry_points, hops, "out", edge_types)
+
+    def render(
+        self,
+        nodes: Sequence[int],
+        max_tokens: int = 2000,
+        model: Optional[str] = None,
+    ) -> str:
+        """
+        The source of the nodes, in the given order, for as many as fit
+        `max_tokens`. Classes are shown by their method names.
+        """
+
+        blocks = []
+        used = 0
+        for node in nodes:
+            tag = self.tag(node)
+            start, end = int(self.starts[node]), int(self.ends[node])
+            if self.node_is_class[node]:
+                methods = ", ".join(tag["details"].split("\n"))
+                body = f"class {tag['name']}: {methods}"
+            else:
+                body = tag["details"].rstrip("\n")
+            block = f"{tag['rel_fname']}:{start}-{end}\n{body}\n"
+            tokens = count_tokens(block, model)
+            if used + tokens > max_tokens:
+                continue
+            blocks.append(block)
+            used += tokens
+        return "\n".join(blocks)
+
+    def _edges(
+        self, edges: Iterable[int], edge_types: Optional[Iterable[str]], ends
+    ) -> List[Tuple[int, str, int]]:
+
+        types = None
+        if edge_types is not None:
+            types = {EDGE_TYPES.index(edge_type) for edge_type in edge_types}
+        result = []
+        for e in edges:
+            edge_type = int(self.out_types[e])
+            if types is None or edge_type in types:
+                result.append(
+                    (int(ends[e]), EDGE_TYPES[edge_type], int(self.out_counts[e]))
+                )
+        return result
+
+    def _file_id(self, path: str) -> Optional[int]:
+        """The file a path names: relative, absolute, or a suffix of either."""
+
+        if self._file_ids is None:
+            self._file_ids = {
+                v: i for i, v in enumerate(self.tags.values("rel_fname")) if v
+            }
+        path = str(path).replace(os.sep, "/").strip()
+        if path in self._file_ids:
+            return self._file_ids[path]
+        for rel_fname, file_id in self._file_ids.items():
+            if path.endswith("/" + rel_fname) or rel_fname.endswith("/" + path):
+                return file_id
+        return None
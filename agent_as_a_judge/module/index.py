@@ -0,0 +1,386 @@
+"""
+DevIndexer: builds every artifact the judge needs for one workspace (code graph,
+tags, tree structure, BM25 corpora, embeddings and trajectory indexes), so a judge
+run only has to load them.
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.graph import DevGraph
+from agent_as_a_judge.module.code_graph import DETAILS_FILE, GRAPH_FILE, CodeGraph
+from agent_as_a_judge.module.scanner import Manifest, scan_config
+from agent_as_a_judge.module.shards import (
+    SHARDED_DETAILS_FILE,
+    SHARDED_GRAPH_FILE,
+    SHARDED_TAGS_FILE,
+    save_shards,
+)
+from agent_as_a_judge.module.tag_store import TAGS_FILE, TAGS_JSON_FILE, TagStore
+from agent_as_a_judge.module.artifact_store import (
+    embedding_fingerprint,
+    make_store,
+    trajectory_fingerprint,
+    workspace_fingerprint,
+)
+from agent_as_a_judge.module.embedding_service import (
+    embedding_signature,
+    load_signature,
+)
+from agent_as_a_judge.module.fingerprint import (
+    FINGERPRINT_FILE,
+    WorkspaceChanges,
+    WorkspaceFingerprint,
+)
+
+
+GRAPH_ARTIFACTS = [GRAPH_FILE, DETAILS_FILE, TAGS_FILE, "tree_structure.json"]
+SHARDED_GRAPH_ARTIFACTS = [
+    SHARDED_GRAPH_FILE,
+    SHARDED_DETAILS_FILE,
+    SHARDED_TAGS_FILE,
+    "tree_structure.json",
+]
+# The embeddings of each group are saved with the signature of their model
+SEARCH_EMBEDDING_ARTIFACTS = ["code_embeddings.npy", "code_embeddings.json"]
+SEARCH_BM25_ARTIFACTS = ["bm25_corpus.json"]
+SEARCH_ARTIFACTS = SEARCH_EMBEDDING_ARTIFACTS + SEARCH_BM25_ARTIFACTS
+TRAJECTORY_EMBEDDING_ARTIFACTS = [
+    "trajectory_embeddings.npy",
+    "trajectory_embeddings.json",
+]
+TRAJECTORY_BM25_ARTIFACTS = ["trajectory_bm25_corpus.json"]
+TRAJECTORY_ARTIFACTS = TRAJECTORY_EMBEDDING_ARTIFACTS + TRAJECTORY_BM25_ARTIFACTS
+SIGNATURE_FILES = {SEARCH_EMBEDDING_ARTIFACTS[1], TRAJECTORY_EMBEDDING_ARTIFACTS[1]}
+
+
+class DevIndexer:
+    def __init__(
+        self,
+        workspace: Path,
+        judge_dir: Path,
+        config: AgentConfig,
+        trajectory_file: Path = None,
+        graph_workers: int = None,
+    ):
+
+        self.workspace = Path(workspace)
+        self.config = config
+        self.trajectory_file = Path(trajectory_file) if trajectory_file else None
+        self.graph_workers = graph_workers
+        self.judge_workspace = Path(
+            judge_dir, os.path.basename(os.path.normpath(self.workspace))
+        )
+        self.judge_workspace.mkdir(parents=True, exist_ok=True)
+        self.graph_file = self.judge_workspace / (
+            SHARDED_GRAPH_FILE if config.shard_graph else GRAPH_FILE
+        )
+        self.tags_file = self.judge_workspace / (
+            SHARDED_TAGS_FILE if config.shard_graph else TAGS_FILE
+        )
+        self.structure_file = self.judge_workspace / "tree_structure.json"
+        self.fingerprint_file = self.judge_workspace / FINGERPRINT_FILE
+        self.store = make_store(config)
+        self._artifact_key = None
+        self._manifest = None
+        self._fingerprint = None
+        self._changes = None
+
+    @property
+    def artifact_key(self) -> str:
+
+        if self._artifact_key is None:
+            self._artifact_key = workspace_fingerprint(
+                self.workspace, self.config, self.fingerprint
+            )
+        return self._artifact_key
+
+    @property
+    def search_key(self) -> str:
+        """The key of the search artifacts, which hold embeddings of the model."""
+
+        return embedding_fingerprint(self.artifact_key, self.config)
+
+    @property
+    def graph_artifacts(self) -> List[str]:
+
+        return SHARDED_GRAPH_ARTIFACTS if self.config.shard_graph else GRAPH_ARTIFACTS
+
+    @property
+    def manifest(self) -> Manifest:
+        """The files of the workspace, scanned once for every stage."""
+
+        if self._manifest is None:
+            self._manifest = scan_config(self.workspace, self.config)
+        return self._manifest
+
+    @property
+    def fingerprint(self) -> WorkspaceFingerprint:
+        """Current fingerprint, rehashing only files whose size or mtime changed."""
+
+        if self._fingerprint is None:
+            previous = WorkspaceFingerprint.load(self.fingerprint_file)
+            self._fingerprint = WorkspaceFingerprint.compute(
+                self.workspace, self.config, previous, self.manifest
+            )
+            self._changes = self._fingerprint.diff(previous)
+        return self._fingerprint
+
+    @property
+    def changes(self) -> WorkspaceChanges:
+        """Files added, removed and changed since the artifacts were last built."""
+
+        if self._changes is None:
+            self.fingerprint
+        return self._changes
+
+    def save_fingerprint(self):
+
+        self.fingerprint.save(self.fingerprint_file)
+        self._changes = WorkspaceChanges()
+
+    def has_graph(self) -> bool:
+
+        return (
+            self.graph_file.exists()
+            and self.tags_file.exists()
+            and self.structure_file.exists()
+        )
+
+    def ensure_graph(self) -> Optional[Dict[str, Any]]:
+        """
+        Make the graph artifacts available, building them only on a store miss.
+        Returns the stage statistics if the graph had to be built.
+        """
+
+        if self.has_graph():
+            if not self.changes:
+                return None
+            # Stale artifacts of a workspace changed since they were built
+            logging.info(
+                f"Workspace {self.workspace.name} changed ({self.changes.summary()}), "
+                "invalidating its artifacts"
+            )
+            self.invalidate(self.graph_artifacts + SEARCH_ARTIFACTS)
+
+        if self.fetch("graph", self.graph_artifacts):
+            self.save_fingerprint()
+            return None
+        return self.index_graph()
+
+    def invalidate(self, names: List[str]):
+
+        for name in names:
+            path = self.judge_workspace / name
+            if path.is_symlink() or path.exists():
+                path.unlink()
+
+    def has_artifacts(self, group: str, names: List[str]) -> bool:
+        """Whether the artifacts are present and up to date, linking them if needed."""
+
+        # Local workspace artifacts are invalidated by ensure_graph when stale
+        if group != "trajectory" and self.has_current(names):
+            return True
+        return self.fetch(group, names)
+
+    def has_current(self, names: List[str]) -> bool:
+        """
+        Whether the local artifacts are present, the embeddings among them built
+        with the configured model and backend.
+        """
+
+        signature = embedding_signature(
+            self.config.embedding_model, self.config.embedding_backend
+        )
+        return all((self.judge_workspace / name).exists() for name in names) and all(
+            load_signature(self.judge_workspace / name) == signature
+            for name in names
+            if name in SIGNATURE_FILES
+        )
+
+    def fetch(self, group: str, names: List[str]) -> bool:
+
+        if self.store is None:
+            return False
+        if group == "trajectory" and not (
+            self.trajectory_file and self.trajectory_file.exists()
+        ):
+            return False
+        return self.store.fetch(self._key(group), group, names, self.judge_workspace)
+
+    def publish(self, group: str, names: List[str]):
+
+        if self.store is not None:
+            self.store.publish(self._key(group), group, names, self.judge_workspace)
+
+    def _key(self, group: str) -> str:
+
+        if group == "trajectory":
+            return embedding_fingerprint(
+                trajectory_fingerprint(self.trajectory_file), self.config
+            )
+        if group == "search":
+            return self.search_key
+        return self.artifact_key
+
+    def _detach(self, names: List[str]):
+
+        if self.store is not None:
+            self.store.detach(self.judge_workspace, names)
+
+    def index_graph(self) -> Dict[str, Any]:
+        """Build and save the code graph, the tags and the tree structure."""
+
+        self._detach(self.graph_artifacts + SEARCH_ARTIFACTS)
+        start_time = time.time()
+        dev_graph = DevGraph(
+            root=str(self.workspace),
+            include_dirs=self.config.include_dirs,
+            exclude_dirs=self.config.exclude_dirs,
+            exclude_files=self.config.exclude_files,
+            cache_dir=self.judge_workspace,
+            num_workers=self.graph_workers,
+            manifest=self.manifest,
+            respect_gitignore=self.config.respect_gitignore,
+            max_file_size=self.config.max_file_size,
+        )
+        filepaths = dev_graph.list_py_files([str(self.workspace)])
+        if self.config.shard_graph:
+            tags = dev_graph.build_tags(filepaths)
+            self.save_shards(dev_graph, tags)
+        else:
+            tags, graph = dev_graph.build(filepaths) if filepaths else (None, None)
+            self.save_graph_and_tags(graph, tags)
+        self.save_file_structure()
+        self.save_fingerprint()
+        self.publish("graph", self.graph_artifacts)
+        return self._stage("graph", len(filepaths), start_time, tags=len(tags or []))
+
+    def index_search(
+        self, embedding_model=None, bm25: bool = True, embeddings: bool = True
+    ) -> List[Dict]:
+        """Build the BM25 corpus and the embeddings used by DevCodeSearch."""
+
+        from agent_as_a_judge.module.code_search import DevCodeSearch
+
+        stages = []
+        search = DevCodeSearch(
+            str(self.judge_workspace),
+            self.config.setting,
+            embedding_model=embedding_model,
+            embedding_model_name=self.config.embedding_model,
+            embedding_backend=self.config.embedding_backend,
+            shard_cache_mb=self.config.shard_cache_mb,
+        )
+        if not (search.tags or search.shards):
+            return stages
+        # A sharded index builds the BM25 model of the shards a query touches
+        bm25 = bm25 and search.shards is None
+
+        if not self.has_current(SEARCH_EMBEDDING_ARTIFACTS):
+            # Embeddings of another model must not be published under this key
+            self.invalidate(SEARCH_EMBEDDING_ARTIFACTS)
+        self._detach(
+            (SEARCH_EMBEDDING_ARTIFACTS if embeddings else [])
+            + (SEARCH_BM25_ARTIFACTS if bm25 else [])
+        )
+        if bm25:
+            start_time = time.time()
+            stages.append(self._stage("bm25", search.save_bm25_corpus(), start_time))
+        if embeddings:
+            start_time = time.time()
+            stages.append(
+                self._stage("embeddings", search.save_code_embeddings(), start_time)
+            )
+        self.publish("search", SEARCH_ARTIFACTS)
+        return stages
+
+    def index_trajectory(
+        self, embedding_model=None, bm25: bool = True, embeddings: bool = True
+    ) -> List[Dict]:
+        """Build the BM25 corpus and the embeddings used by DevTextRetrieve."""
+
+        from agent_as_a_judge.module.text_retrieve import DevTextRetrieve
+
+        stages = []
+        if not self.trajectory_file or not self.trajectory_file.exists():
+            return stages
+
+        retrieve = DevTextRetrieve(
+            str(self.trajectory_file),
+            index_dir=str(self.judge_workspace),
+            embedding_model=embedding_model,
+            embedding_model_name=self.config.embedding_model,
+            embedding_backend=self.config.embedding_backend,
+        )
+        if not retrieve.text_data:
+            return stages
+
+        if not self.has_current(TRAJECTORY_EMBEDDING_ARTIFACTS):
+            self.invalidate(TRAJECTORY_EMBEDDING_ARTIFACTS)
+        self._detach(
+            (TRAJECTORY_EMBEDDING_ARTIFACTS if embeddings else [])
+            + (TRAJECTORY_BM25_ARTIFACTS if bm25 else [])
+        )
+        if bm25:
+            start_time = time.time()
+            stages.append(
+                self._stage("trajectory_bm25", retrieve.save_bm25_corpus(), start_time)
+            )
+        if embeddings:
+            start_time = time.time()
+            stages.append(
+                self._stage(
+                    "trajectory_embeddings",
+                    retrieve.save_text_embeddings(),
+                    start_time,
+                )
+            )
+        self.publish("trajectory", TRAJECTORY_ARTIFACTS)
+        return stages
+
+    def _stage(self, name: str, items: int, start_time: float, **extra) -> Dict:
+
+        return {
+            "workspace": self.workspace.name,
+            "stage": name,
+            "items": items,
+            "seconds": time.time() - start_time,
+            **extra,
+        }
+
+    def save_graph_and_tags(self, graph, tags):
+
+        logging.info("Saving the graph and tags...")
+        CodeGraph.from_networkx(graph).save(self.judge_workspace)
+        tag_store = TagStore.from_tags(tags)
+        tag_store.save(self.judge_workspace)
+        if self.config.export_tags_json:
+            tag_store.export_json(self.judge_workspace / TAGS_JSON_FILE)
+
+    def save_shards(self, dev_graph: DevGraph, tags):
+
+        logging.info("Saving the graph and tags by package...")
+        names = save_shards(self.judge_workspace, tags, dev_graph.build_graph)
+        logging.info(f"Saved {len(names)} shards")
+        if self.config.export_tags_json:
+            TagStore.from_tags(tags).export_json(self.judge_workspace / TAGS_JSON_FILE)
+
+    def save_file_structure(self) -> Dict[str, Any]:
+
+        tree_structure, collapsed = self.manifest.summarised_tree(
+            max_entries=self.config.max_dir_entries
+        )
+        workspace_info = {
+            "workspace": str(self.workspace),
+            "tree_structure": tree_structure,
+            "collapsed": collapsed,
+        }
+        with open(self.structure_file, "w", encoding="utf-8") as f:
+            json.dump(workspace_info, f, indent=4)
+        return workspace_info
@@ -0,0 +1,268 @@
+"""
+OnnxEmbedder: a sentence embedding model exported to ONNX, its weights quantised
+to int8, and run by onnxruntime on CPU in place of PyTorch inference.
+
+The whole SentenceTransformer (transformer, pooling and normalisation) is
+exported once into one graph whose weights are quantised dynamically, the
+activations being quantised at run time. The graph is kept with the tokenizer
+in a cache directory per model, so later processes load neither torch nor the
+original weights. onnxruntime and onnx are optional dependencies, only imported
+when this backend is used.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+
+ONNX_CACHE_ENV = "AAAJ_ONNX_CACHE"
+ONNX_THREADS_ENV = "AAAJ_ONNX_THREADS"
+
+MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedder.json"
+
+# Bump whenever the exported graph or its configuration changes.
+EXPORT_VERSION = 1
+
+OPSET = 17
+
+BATCH_SIZE = 32
+
+
+def _require_onnxruntime():
+
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError(
+            "The onnx embedding backend needs onnxruntime and onnx: "
+            "pip install agent-as-a-judge[onnx]"
+        ) from e
+    return onnxruntime
+
+
+def default_cache_dir() -> Path:
+
+    return Path(
+        os.getenv(ONNX_CACHE_ENV)
+        or Path.home() / ".cache" / "agent_as_a_judge" / "onnx"
+    )
+
+
+def default_threads() -> int:
+    """The intra-op threads: $AAAJ_ONNX_THREADS, else the CPUs of this process."""
+
+    if os.getenv(ONNX_THREADS_ENV):
+        return int(os.getenv(ONNX_THREADS_ENV))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def model_directory(name: str, cache_dir: Optional[Path] = None) -> Path:
+    """The cache directory of a model, readable and unique per name or path."""
+
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name.strip("/"))[-64:]
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=4).hexdigest()
+    return Path(cache_dir or default_cache_dir()) / f"{slug}-{digest}"
+
+
+def export_model(name: str, directory: Path):
+    """
+    Export a SentenceTransformer to an int8 ONNX graph and its tokenizer into
+    `directory`, written elsewhere first so that concurrent exports never leave
+    a partial directory.
+    """
+
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    start_time = time.time()
+    # Eager attention traces to plain operators that quantise and run faster in
+    # onnxruntime than the traced scaled dot product attention
+    model = SentenceTransformer(
+        name, device="cpu", model_kwargs={"attn_implementation": "eager"}
+    ).eval()
+    sample = model.tokenizer(
+        ["def export(self): return model", "export"], padding=True, return_tensors="pt"
+    )
+    input_names = [
+        key
+        for key in ("input_ids", "attention_mask", "token_type_ids")
+        if key in sample
+    ]
+
+    class SentenceEmbedding(torch.nn.Module):
+        def __init__(self):
+
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+
+            return self.model(dict(zip(input_names, inputs)))["sentence_embedding"]
+
+    # Newer torch exports through dynamo by default; the tracing exporter
+    # handles the models of sentence-transformers without extra dependencies
+    options = {"opset_version": OPSET}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=".export-"))
+    try:
+        float_file = tmp_dir / "model.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                SentenceEmbedding(),
+                tuple(sample[key] for key in input_names),
+                str(float_file),
+                input_names=input_names,
+                output_names=["sentence_embedding"],
+                dynamic_axes={
+                    **{key: {0: "batch", 1: "sequence"} for key in input_names},
+                    "sentence_embedding": {0: "batch"},
+                },
+                **options,
+            )
+        # The quantiser logs every tensor it skips
+        logging.disable(logging.INFO)
+        try:
+            quantize_dynamic(
+                str(float_file), str(tmp_dir / MODEL_FILE), weight_type=QuantType.QInt8
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        float_file.unlink()
+        model.tokenizer.save_pretrained(str(tmp_dir))
+        config = {
+            "version": EXPORT_VERSION,
+            "model": name,
+            "max_seq_length": model.max_seq_length,
+            "inputs": input_names,
+        }
+        (tmp_dir / CONFIG_FILE).write_text(json.dumps(config, indent=2))
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except OSError:
+        # Another process exported the model first
+        if not (directory / CONFIG_FILE).exists():
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logging.info(
+        f"Exported {name} to int8 ONNX in {time.time() - start_time:.1f}s: {directory}"
+    )
+
+
+class OnnxEmbedder:
+    """Encodes sentences like SentenceTransformer.encode, with onnxruntime."""
+
+    def __init__(
+        self,
+        name: str,
+        cache_dir: Optional[Path] = None,
+        threads: Optional[int] = None,
+    ):
+
+        ort = _require_onnxruntime()
+        self.name = name
+        self.directory = model_directory(name, cache_dir)
+        if not self._exported():
+            export_model(name, self.directory)
+        config = json.loads((self.directory / CONFIG_FILE).read_text())
+        self.max_seq_length = config["max_seq_length"]
+        self.input_names = config["inputs"]
+
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.directory))
+        self.threads = threads or default_threads()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        # Batches run one at a time: parallelism comes from within each operator
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(self.directory / MODEL_FILE),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def _exported(self) -> bool:
+
+        try:
+            config = json.loads((self.directory / CONFIG_FILE).read_text())
+        except (OSError, ValueError):
+            return False
+        return (
+            config.get("version") == EXPORT_VERSION
+            and (self.directory / MODEL_FILE).exists()
+        )
+
+    @property
+    def model_id(self) -> str:
+        """Names the embeddings apart from those of the torch model."""
+
+        return f"{self.name}@onnx-int8"
+
+    def get_sentence_embedding_dimension(self) -> int:
+
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = BATCH_SIZE,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        convert_to_tensor: bool = False,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ):
+        """The embeddings of the sentences, encoded in batches of similar length."""
+
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = np.zeros(
+            (len(sentences), self.get_sentence_embedding_dimension()), dtype=np.float32
+        )
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            features = self.tokenizer(
+                [sentences[i] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            embeddings[batch] = self.session.run(
+                None,
+                {name: features[name].astype(np.int64) for name in self.input_names},
+            )[0]
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.where(norms == 0, 1, norms)
+        if single:
+            embeddings = embeddings[0]
+        if convert_to_tensor:
+            import torch
+
+            return torch.from_numpy(embeddings)
+        return embeddings
@@ -47,6 +47,7 @@ class Planning:
             "workspace": r"\[Workspace\]",
             "locate": r"\[Locate\]",
             "read": r"\[Read\]",
+            "graph": r"\[Graph\]",
             "search": r"\[Search\]",
             "history": r"\[History\]",
             "trajectory": r"\[Trajectory\]",
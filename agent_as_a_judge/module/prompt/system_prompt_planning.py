@@ -11,6 +11,7 @@ def get_planning_system_prompt(language="English"):
         - [Workspace]: Analyze the overall workspace structure to understand the project’s components and dependencies.
         - [Locate]: Locate specific files or directories in the workspace that may contain relevant information or code.
         - [Read]: Read and examine the contents of files to verify their correctness and relevance to the requirement.
+        - [Graph]: Follow the functions and methods reachable from the located files' entry points, to inspect the code paths involved without reading whole files.
         - [Search]: Search for relevant code snippets, functions, or variables related to the requirement.
         - [History]: Refer to previous judgments, evaluations, or decisions made in earlier iterations or related projects.
         - [Trajectory]: Analyze the historical development or decision-making trajectory of the project, including previous changes or iterations that impacted the current state.
@@ -0,0 +1,197 @@
+"""
+RepoMap: workspace evidence of a requirement, next to the directory tree: a map
+of the files and definitions most relevant to its criteria that fits a token
+budget, with paths under the workspace root as in the tree.
+
+Files are ranked with PageRank over the graph of references between them,
+personalised towards the files and names the criteria mention. Each definition
+gets a share of the rank of the files referencing it. The map lists as many of
+the ranked definitions as fit the budget, rendered with TreeContext in the
+scope they belong to, followed by the names of the remaining files.
+"""
+
+import os
+import re
+import math
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+from agent_as_a_judge.module.graph import DevGraph, Tag
+from agent_as_a_judge.module.tag_store import TagStore
+from agent_as_a_judge.utils import count_tokens
+
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class RepoMap:
+    def __init__(
+        self,
+        dev_graph: DevGraph,
+        tags: Iterable[Tag],
+        files: Iterable[str] = (),
+        model: Optional[str] = None,
+    ):
+        """`files` are the relative paths of every workspace file, code or not."""
+
+        self.dev_graph = dev_graph
+        self.model = model
+        self.files = sorted(set(files))
+        self.defines: Dict[str, Set[str]] = defaultdict(set)
+        self.references: Dict[str, Counter] = defaultdict(Counter)
+        self.definitions: Dict[Tuple[str, str], List[Tag]] = defaultdict(list)
+        for tag in tags:
+            if tag.identifier == "def":
+                self.defines[tag.name].add(tag.rel_fname)
+                self.definitions[tag.rel_fname, tag.name].append(tag)
+            elif tag.identifier == "ref":
+                self.references[tag.name][tag.rel_fname] += tag.count
+        self.code_files = sorted(
+            {fname for fnames in self.defines.values() for fname in fnames}
+            | {fname for counts in self.references.values() for fname in counts}
+        )
+
+    @classmethod
+    def from_tag_store(
+        cls,
+        dev_graph: DevGraph,
+        tag_store: TagStore,
+        files: Iterable[str] = (),
+        model: Optional[str] = None,
+    ) -> "RepoMap":
+        """Build from the saved tags, without decoding their details."""
+
+        columns = [
+            tag_store.column(field) for field in ("rel_fname", "name", "identifier")
+        ]
+        lines = tag_store.arrays["line"].tolist()
+        counts = tag_store.counts().tolist()
+        tags = [
+            Tag(
+                rel_fname=rel_fname,
+                fname=os.path.join(dev_graph.root, rel_fname),
+                line=lines[2 * i],
+                name=name,
+                identifier=identifier,
+                category="",
+                details="",
+                count=counts[i],
+            )
+            for i, (rel_fname, name, identifier) in enumerate(zip(*columns))
+        ]
+        return cls(dev_graph, tags, files, model)
+
+    def get_map(self, criteria: str, max_tokens: int = 2000) -> str:
+        """The longest prefix of the ranked map that fits `max_tokens`."""
+
+        ranked = [self._under_root(entry) for entry in self.rank(criteria)]
+        best = ""
+        lower, upper = 0, len(ranked)
+        while lower <= upper:
+            middle = (lower + upper) // 2
+            tree = self.dev_graph.to_tree(ranked[:middle], ())
+            if count_tokens(tree, self.model) <= max_tokens:
+                best = tree
+                lower = middle + 1
+            else:
+                upper = middle - 1
+        return best
+
+    def _under_root(self, entry: tuple) -> tuple:
+        """A ranked entry with its path joined to the workspace root."""
+
+        path = os.path.join(self.dev_graph.root, entry[0])
+        return entry._replace(rel_fname=path) if isinstance(entry, Tag) else (path,)
+
+    def rank(self, criteria: str) -> List[tuple]:
+        """
+        Definition tags by decreasing relevance, then the other files as
+        (rel_fname,) entries: the mentioned ones first.
+        """
+
+        mentioned_idents = set(IDENTIFIER.findall(criteria))
+        mentioned_files = self._mentioned_files(criteria, mentioned_idents)
+        graph, ranks = self._pagerank(mentioned_idents, mentioned_files)
+
+        ranked_definitions = defaultdict(float)
+        for src in graph.nodes:
+            out_edges = graph.out_edges(src, data=True)
+            total_weight = sum(data["weight"] for _, _, data in out_edges)
+            for _, dst, data in out_edges:
+                ranked_definitions[dst, data["ident"]] += (
+                    ranks[src] * data["weight"] / total_weight
+                )
+
+        ranked = []
+        listed = set()
+        for (fname, ident), _ in sorted(
+            ranked_definitions.items(), key=lambda item: (-item[1], item[0])
+        ):
+            ranked.extend(self.definitions.get((fname, ident), ()))
+            listed.add(fname)
+
+        others = [fname for fname in self.files if fname not in listed]
+        others.sort(
+            key=lambda fname: (fname not in mentioned_files, -ranks.get(fname, 0.0))
+        )
+        ranked.extend((fname,) for fname in others)
+        return ranked
+
+    def _mentioned_files(self, criteria: str, mentioned_idents: Set[str]) -> Set[str]:
+
+        words = {word.lower() for word in mentioned_idents}
+        mentioned = set()
+        for fname in self.files:
+            stem = os.path.splitext(os.path.basename(fname))[0].lower()
+            if fname in criteria or stem in words:
+                mentioned.add(fname)
+        return mentioned
+
+    def _pagerank(
+        self, mentioned_idents: Set[str], mentioned_files: Set[str]
+    ) -> Tuple[nx.MultiDiGraph, Dict[str, float]]:
+        """The reference graph between files, and the rank of its files."""
+
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(self.code_files)
+        for ident, definers in self.defines.items():
+            mul = 10.0 if ident in mentioned_idents else 1.0
+            if ident.startswith("_"):
+                mul *= 0.1
+            references = self.references.get(ident)
+            if not references:
+                # Unreferenced definitions still take a share of their file
+                for definer in definers:
+                    graph.add_edge(definer, definer, weight=0.1 * mul, ident=ident)
+                continue
+            for referencer, num_refs in references.items():
+                for definer in definers:
+                    graph.add_edge(
+                        referencer,
+                        definer,
+                        weight=mul * math.sqrt(num_refs),
+                        ident=ident,
+                    )
+
+        personalization = {
+            fname: 1.0 / len(mentioned_files)
+            for fname in mentioned_files
+            if fname in graph
+        }
+        ranks = {}
+        if len(graph):
+            try:
+                ranks = nx.pagerank(
+                    graph,
+                    weight="weight",
+                    personalization=personalization or None,
+                    dangling=personalization or None,
+                )
+            except (ZeroDivisionError, nx.PowerIterationFailedConvergence) as e:
+                logging.warning(f"Falling back to uniform file ranks: {e}")
+                ranks = {fname: 1.0 / len(graph) for fname in graph}
+        return graph, ranks
+
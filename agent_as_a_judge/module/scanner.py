@@ -0,0 +1,508 @@
+"""
+Workspace scanner: a single `os.scandir` pass over a workspace, producing the
+manifest (path, size, mtime, type) that the code graph, the tree structure, the
+fingerprint, the statistics and the scheduler all read instead of walking the
+workspace themselves.
+
+Hidden entries and the configured directory and file names are skipped and, on
+request, paths matched by the `.gitignore` files found along the way (with the
+usual semantics: nested files, negation, anchoring and directory-only patterns).
+Files are typed by extension, and only files of unknown extensions are sniffed
+for binary content; files above the size cap are never read.
+
+The tree structure lists the directories breadth-first within a budget, and
+summarises crowded directories (the images, checkpoints and CSVs developer
+agents dump into results/ or data/) as a few sample names plus counts per
+extension and total size, so that its size does not grow with the data.
+"""
+
+import os
+import re
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pathspec
+
+from agent_as_a_judge.config import AgentConfig
+
+
+IGNORE_FILE = ".gitignore"
+
+# Files above this size are listed but never read or parsed
+MAX_FILE_SIZE = 5 * 2**20
+
+# Entry types
+DIR = "dir"
+TEXT = "text"
+BINARY = "binary"
+OVERSIZED = "oversized"
+
+TEXT_EXTENSIONS = frozenset(
+    """
+    .py .pyi .ipynb .txt .md .rst .json .jsonl .yaml .yml .toml .ini .cfg .csv
+    .tsv .xml .html .css .js .ts .sh .bat .sql .r .tex .log .c .h .cpp .java .go
+    .rs
+    """.split()
+)
+
+BINARY_EXTENSIONS = frozenset(
+    """
+    .png .jpg .jpeg .gif .bmp .tif .tiff .ico .webp .svgz .pdf .zip .gz .tgz .bz2
+    .xz .7z .tar .rar .npy .npz .pkl .pickle .joblib .pt .pth .ckpt .h5 .hdf5
+    .onnx .safetensors .bin .parquet .feather .arrow .db .sqlite .so .dll .dylib
+    .exe .pyc .whl .mp3 .wav .flac .mp4 .avi .mov .mkv .xlsx .xls .docx .pptx
+    .ttf .woff .woff2
+    """.split()
+)
+
+# Bytes sniffed for a NUL, like git does
+SNIFF_SIZE = 8000
+
+# Directories with more entries than this are summarised in the tree structure
+MAX_DIR_ENTRIES = 100
+# Entries listed in the tree structure before the remaining directories are
+# summarised
+MAX_TREE_ENTRIES = 2000
+# File names still listed by a summarised directory
+SUMMARY_SAMPLES = 5
+# Extensions named in the summary line of a directory
+SUMMARY_EXTENSIONS = 4
+# Files listed when a summarised directory is expanded
+EXPAND_LIMIT = 100
+
+IDENTIFIER = re.compile(r"[A-Za-z0-9]+")
+
+
+class ManifestEntry(NamedTuple):
+    # Relative to the workspace, "/"-separated
+    path: str
+    size: int
+    mtime_ns: int
+    type: str
+
+
+class IgnoreRules:
+    """The `.gitignore` patterns in effect in a directory, outermost first."""
+
+    def __init__(self, specs: Tuple[Tuple[str, list], ...] = ()):
+
+        # (directory, [(regex, ignores)]) with the last pattern of a file first
+        self.specs = specs
+
+    def extend(self, directory: str, ignore_file: str) -> "IgnoreRules":
+
+        try:
+            with open(ignore_file, "r", encoding="utf-8", errors="replace") as f:
+                spec = pathspec.GitIgnoreSpec.from_lines(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read {ignore_file}: {e}")
+            return self
+        patterns = [
+            (pattern.regex, pattern.include)
+            for pattern in reversed(spec.patterns)
+            if pattern.include is not None
+        ]
+        if not patterns:
+            return self
+        return IgnoreRules(self.specs + ((directory, patterns),))
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+
+        ignored = False
+        for directory, patterns in self.specs:
+            relative = path[len(directory) + 1 :] if directory else path
+            if is_dir:
+                relative += "/"
+            # The last matching pattern of a file decides, and deeper ignore
+            # files override outer ones
+            for regex, ignores in patterns:
+                if regex.search(relative) is not None:
+                    ignored = ignores
+                    break
+        return ignored
+
+
+class Manifest:
+    def __init__(self, root: str, entries: List[ManifestEntry]):
+
+        self.root = str(root)
+        # Directories come before their contents, in depth-first order
+        self.entries = entries
+        self._by_path = None
+
+    def __iter__(self) -> Iterator[ManifestEntry]:
+
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+
+        return len(self.entries)
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+
+        if self._by_path is None:
+            self._by_path = {entry.path: entry for entry in self.entries}
+        return self._by_path.get(path)
+
+    def abspath(self, entry: ManifestEntry) -> str:
+
+        return os.path.join(self.root, entry.path)
+
+    def files(self, include_dirs: Optional[List[str]] = None) -> List[ManifestEntry]:
+        """Files, restricted to directories matching `include_dirs` if given."""
+
+        return [
+            entry
+            for entry in self.entries
+            if entry.type != DIR
+            and _included(entry.path.rpartition("/")[0], include_dirs)
+        ]
+
+    def tree_structure(
+        self,
+        include_dirs: Optional[List[str]] = None,
+        max_entries: int = MAX_DIR_ENTRIES,
+        max_total: int = MAX_TREE_ENTRIES,
+    ) -> Dict[str, Dict[str, None]]:
+        """
+        The files of every directory, keyed by its relative path ("." for root).
+        Summarised directories list only a few sample files; what they leave
+        out is in `collapsed` (see `display_structure`).
+        """
+
+        return self.summarised_tree(include_dirs, max_entries, max_total)[0]
+
+    def summarised_tree(
+        self,
+        include_dirs: Optional[List[str]] = None,
+        max_entries: int = MAX_DIR_ENTRIES,
+        max_total: int = MAX_TREE_ENTRIES,
+    ) -> Tuple[Dict[str, Dict[str, None]], Dict[str, Dict[str, Any]]]:
+        """
+        The tree structure, and what each summarised directory leaves out.
+
+        Directories are listed breadth-first. One with more than `max_entries`
+        files lists a few samples of them, and one with more than
+        `max_entries` subdirectories folds them into its summary; once
+        `max_total` entries are listed, the remaining directories are only
+        summarised. 0 disables either limit.
+        """
+
+        files_of: Dict[str, List[ManifestEntry]] = {"": []}
+        dirs_of: Dict[str, List[str]] = {"": []}
+        for entry in self.entries:
+            parent = entry.path.rpartition("/")[0]
+            if entry.type == DIR:
+                files_of[entry.path] = []
+                dirs_of[entry.path] = []
+                dirs_of[parent].append(entry.path)
+            else:
+                files_of[parent].append(entry)
+
+        # The files listed by every visited directory; those whose files beyond
+        # the samples are summarised, and those summarised with their subtree
+        shown = {}
+        sampled = {}
+        folded = set()
+        # Directories count when they are queued, so the queue stays in budget
+        listed = 1
+        queue = deque([""])
+        while queue:
+            directory = queue.popleft()
+            files, subdirs = files_of[directory], dirs_of[directory]
+            if max_total and listed >= max_total:
+                folded.add(directory)
+                shown[directory] = []
+                continue
+            crowded = max_entries and len(files) > max_entries
+            shown[directory] = _samples(files) if crowded else files
+            if crowded:
+                sampled[directory] = shown[directory]
+            if _included(directory, include_dirs):
+                listed += len(shown[directory])
+            if (max_entries and len(subdirs) > max_entries) or (
+                max_total and listed + len(subdirs) > max_total
+            ):
+                folded.add(directory)
+            else:
+                queue.extend(subdirs)
+                listed += len(subdirs)
+
+        collapsed = {
+            os.path.normpath(directory or "."): summary
+            for directory, summary in self._summaries(sampled, folded).items()
+            if summary["files"] or summary["directories"]
+        }
+        tree = {}
+        # In scan order, each directory before its subdirectories
+        for directory in [""] + [e.path for e in self.entries if e.type == DIR]:
+            if directory not in shown or not _included(directory, include_dirs):
+                continue
+            key = os.path.normpath(directory or ".")
+            tree[key] = {
+                entry.path.rpartition("/")[2]: None for entry in shown[directory]
+            }
+        return tree, collapsed
+
+    def collapsed(
+        self,
+        include_dirs: Optional[List[str]] = None,
+        max_entries: int = MAX_DIR_ENTRIES,
+        max_total: int = MAX_TREE_ENTRIES,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        The summarised directories of the tree structure, with the number of
+        files and directories they leave out, their total size, the file
+        counts per extension and the sample names still listed.
+        """
+
+        return self.summarised_tree(include_dirs, max_entries, max_total)[1]
+
+    def _summaries(
+        self, sampled: Dict[str, List[ManifestEntry]], folded: set
+    ) -> Dict[str, Dict[str, Any]]:
+
+        summaries = {}
+
+        def summary(directory: str) -> Dict[str, Any]:
+            if directory not in summaries:
+                summaries[directory] = {
+                    "files": 0,
+                    "directories": 0,
+                    "size": 0,
+                    "extensions": Counter(),
+                    "samples": [
+                        entry.path.rpartition("/")[2]
+                        for entry in sampled.get(directory, ())
+                    ],
+                    # Whether its subdirectories are summarised too
+                    "folded": directory in folded,
+                }
+            return summaries[directory]
+
+        shown = {entry.path for entries in sampled.values() for entry in entries}
+        for directory in folded:
+            summary(directory)
+        for entry in self.entries:
+            # The outermost folded directory above the entry hides it
+            parent = entry.path.rpartition("/")[0]
+            owner = None
+            ancestor = parent
+            while True:
+                if ancestor in folded:
+                    owner = ancestor
+                if not ancestor:
+                    break
+                ancestor = ancestor.rpartition("/")[0]
+            if owner is None:
+                if entry.type == DIR or parent not in sampled or entry.path in shown:
+                    continue
+                owner = parent
+            if entry.type == DIR:
+                summary(owner)["directories"] += 1
+                continue
+            info = summary(owner)
+            info["files"] += 1
+            info["size"] += entry.size
+            info["extensions"][os.path.splitext(entry.path)[1].lower() or "(none)"] += 1
+
+        for info in summaries.values():
+            info["extensions"] = dict(info["extensions"].most_common())
+        return summaries
+
+    def expand(
+        self, directory: str, query: str = "", limit: int = EXPAND_LIMIT
+    ) -> List[str]:
+        """
+        The files beneath a directory, for a summarised directory the judge
+        wants to look into: those whose path shares words with the query
+        first, then text files, each group in scan order.
+        """
+
+        directory = os.path.normpath(directory).replace(os.sep, "/")
+        prefix = "" if directory == "." else directory + "/"
+        words = {word.lower() for word in IDENTIFIER.findall(query)}
+        matches, texts, others = [], [], []
+        for entry in self.entries:
+            if entry.type == DIR or not entry.path.startswith(prefix):
+                continue
+            path_words = {word.lower() for word in IDENTIFIER.findall(entry.path)}
+            if words & path_words:
+                matches.append(entry.path)
+            elif entry.type == TEXT:
+                texts.append(entry.path)
+            else:
+                others.append(entry.path)
+            if len(matches) >= limit:
+                break
+        return (matches + texts + others)[:limit]
+
+
+def _samples(files: List[ManifestEntry]) -> List[ManifestEntry]:
+    """A few files of a crowded directory: one per extension, text files first."""
+
+    by_extension = {}
+    for entry in sorted(files, key=lambda entry: entry.type != TEXT):
+        by_extension.setdefault(os.path.splitext(entry.path)[1].lower(), entry)
+    samples = list(by_extension.values())[:SUMMARY_SAMPLES]
+    chosen = set(samples)
+    samples += [entry for entry in files if entry not in chosen][
+        : SUMMARY_SAMPLES - len(samples)
+    ]
+    order = {entry: i for i, entry in enumerate(files)}
+    return sorted(samples, key=order.__getitem__)
+
+
+def _summary_line(summary: Dict[str, Any]) -> str:
+
+    line = f"... {summary['files']:,} more files"
+    if summary["directories"]:
+        line += f" in {summary['directories']:,} more directories"
+    extensions = list(summary["extensions"].items())
+    counts = ", ".join(
+        f"{count:,} {extension}"
+        for extension, count in extensions[:SUMMARY_EXTENSIONS]
+    )
+    if len(extensions) > SUMMARY_EXTENSIONS:
+        counts += ", ..."
+    details = [part for part in (counts, format_size(summary["size"])) if part]
+    return f"{line} ({'; '.join(details)})"
+
+
+def display_structure(structure: Dict[str, Any]) -> Dict[str, Dict[str, None]]:
+    """
+    The tree structure of a saved workspace structure for display, each
+    summarised directory ending with a line summing up what it leaves out.
+    """
+
+    collapsed = structure.get("collapsed") or {}
+    return {
+        directory: (
+            {**names, _summary_line(collapsed[directory]): None}
+            if directory in collapsed
+            else names
+        )
+        for directory, names in structure.get("tree_structure", {}).items()
+    }
+
+
+def format_size(size: int) -> str:
+
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def _included(directory: str, include_dirs: Optional[List[str]]) -> bool:
+
+    return include_dirs is None or any(
+        included in directory for included in include_dirs
+    )
+
+
+def scan_workspace(
+    root,
+    exclude_dirs: Optional[List[str]] = None,
+    exclude_files: Optional[List[str]] = None,
+    respect_gitignore: bool = False,
+    max_file_size: Optional[int] = None,
+) -> Manifest:
+    """
+    Scan a workspace once. Directory and file names containing any of the
+    excluded names are skipped, like the former walkers did.
+    """
+
+    root = str(root)
+    max_file_size = MAX_FILE_SIZE if max_file_size is None else max_file_size
+    exclude_dirs = exclude_dirs or []
+    exclude_files = exclude_files or []
+    entries = []
+    stack = [("", None, IgnoreRules())]
+
+    while stack:
+        directory, directory_entry, rules = stack.pop()
+        if directory_entry is not None:
+            entries.append(directory_entry)
+        try:
+            with os.scandir(os.path.join(root, directory)) as it:
+                items = sorted(it, key=lambda item: item.name)
+        except OSError as e:
+            logging.warning(f"Failed to scan {os.path.join(root, directory)}: {e}")
+            continue
+
+        if respect_gitignore:
+            for item in items:
+                if item.name == IGNORE_FILE and item.is_file():
+                    rules = rules.extend(directory, item.path)
+
+        subdirs = []
+        for item in items:
+            name = item.name
+            if name.startswith("."):
+                continue
+            path = f"{directory}/{name}" if directory else name
+            try:
+                is_dir = item.is_dir()
+                if is_dir:
+                    # Symlinked directories are not followed, as with os.walk
+                    if (
+                        item.is_symlink()
+                        or any(excluded in name for excluded in exclude_dirs)
+                        or rules.ignored(path, True)
+                    ):
+                        continue
+                    stat = item.stat()
+                    subdirs.append(
+                        (path, ManifestEntry(path, 0, stat.st_mtime_ns, DIR), rules)
+                    )
+                    continue
+                if any(excluded in name for excluded in exclude_files) or (
+                    rules.ignored(path, False)
+                ):
+                    continue
+                stat = item.stat()
+            except OSError as e:
+                logging.warning(f"Failed to stat {item.path}: {e}")
+                continue
+            entries.append(
+                ManifestEntry(
+                    path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    file_type(item.path, stat.st_size, max_file_size),
+                )
+            )
+        stack.extend(reversed(subdirs))
+
+    return Manifest(root, entries)
+
+
+def scan_config(root, config: AgentConfig) -> Manifest:
+    """Scan a workspace with the exclusion rules of an agent configuration."""
+
+    return scan_workspace(
+        root,
+        config.exclude_dirs,
+        config.exclude_files,
+        config.respect_gitignore,
+        config.max_file_size,
+    )
+
+
+def file_type(path: str, size: int, max_file_size: int = MAX_FILE_SIZE) -> str:
+
+    if size > max_file_size:
+        return OVERSIZED
+    extension = os.path.splitext(path)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        return TEXT
+    if extension in BINARY_EXTENSIONS:
+        return BINARY
+    try:
+        with open(path, "rb") as f:
+            return BINARY if b"\0" in f.read(SNIFF_SIZE) else TEXT
+    except OSError:
+        return BINARY
@@ -0,0 +1,187 @@
+"""
+InstanceCostModel: predicts how long judging an instance will take, so that a
+run can schedule the heaviest instances first and avoid a long tail.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.scanner import scan_config
+
+
+MEDIA_EXTENSIONS = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".bmp",
+    ".mp4",
+    ".avi",
+    ".mov",
+    ".webm",
+}
+
+
+@dataclass
+class InstanceFeatures:
+    name: str
+    requirements: int = 0
+    workspace_files: int = 0
+    workspace_bytes: int = 0
+    code_bytes: int = 0
+    media_files: int = 0
+    trajectory_bytes: int = 0
+
+    def vector(self) -> List[float]:
+        return [
+            1.0,
+            float(self.requirements),
+            self.code_bytes / 1024,
+            float(self.media_files),
+            self.workspace_files / 100,
+            self.trajectory_bytes / 1024,
+        ]
+
+
+class InstanceCostModel:
+
+    FEATURE_NAMES = [
+        "bias",
+        "requirements",
+        "code_kb",
+        "media_files",
+        "workspace_files_x100",
+        "trajectory_kb",
+    ]
+    # Rough seconds per unit, used until enough judge_stats are available to fit.
+    DEFAULT_WEIGHTS = [5.0, 20.0, 0.5, 2.0, 3.0, 0.05]
+
+    def __init__(self, config: AgentConfig):
+
+        self.config = config
+        self.weights = np.array(self.DEFAULT_WEIGHTS)
+        self.fitted = False
+        self._features = {}
+
+    def features(self, instance_file: Path) -> InstanceFeatures:
+
+        instance_file = Path(instance_file)
+        if instance_file.stem in self._features:
+            return self._features[instance_file.stem]
+
+        features = InstanceFeatures(name=instance_file.stem)
+        try:
+            with open(instance_file, "r") as f:
+                features.requirements = len(json.load(f).get("requirements", []))
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Failed to read instance {instance_file}: {e}")
+
+        workspace = Path(self.config.workspace_dir) / instance_file.stem
+        for entry in scan_config(workspace, self.config).files():
+            ext = os.path.splitext(entry.path)[1].lower()
+            features.workspace_files += 1
+            features.workspace_bytes += entry.size
+            if ext == ".py":
+                features.code_bytes += entry.size
+            elif ext in MEDIA_EXTENSIONS:
+                features.media_files += 1
+
+        if self.config.setting != "black_box" and self.config.trajectory_file:
+            trajectory = Path(self.config.trajectory_file) / instance_file.name
+            if trajectory.exists():
+                features.trajectory_bytes = trajectory.stat().st_size
+
+        self._features[instance_file.stem] = features
+        return features
+
+    def predict(self, instance_file: Path) -> float:
+
+        vector = np.array(self.features(instance_file).vector())
+        return float(max(vector @ self.weights, 0.0))
+
+    def fit(self, judge_dirs: List[Path]) -> bool:
+        """
+        Fit the per-feature weights on the judge_stats of instances that were
+        already judged. Falls back to the default weights when there are fewer
+        judged instances than features.
+        """
+
+        rows, targets = [], []
+        instance_dir = Path(self.config.instance_dir)
+        for judge_dir in judge_dirs:
+            for judgment_file in Path(judge_dir).glob("*.json"):
+                actual = self.actual_time(judgment_file)
+                instance_file = instance_dir / judgment_file.name
+                if actual is None or not instance_file.exists():
+                    continue
+                rows.append(self.features(instance_file).vector())
+                targets.append(actual)
+
+        if len(rows) < len(self.FEATURE_NAMES):
+            logging.info(
+                f"Only {len(rows)} judged instances available, using default cost weights"
+            )
+            return False
+
+        weights, *_ = np.linalg.lstsq(np.array(rows), np.array(targets), rcond=None)
+        self.weights = np.clip(weights, 0.0, None)
+        self.fitted = True
+        fitted_weights = dict(
+            zip(self.FEATURE_NAMES, np.round(self.weights, 3).tolist())
+        )
+        logging.info(f"Fitted cost weights on {len(rows)} instances: {fitted_weights}")
+        return True
+
+    @staticmethod
+    def actual_time(judgment_file: Path) -> Optional[float]:
+
+        try:
+            with open(judgment_file, "r") as f:
+                judge_stats = json.load(f).get("judge_stats")
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return None
+        if not judge_stats:
+            return None
+        return sum(entry.get("total_time", 0.0) for entry in judge_stats)
+
+    def schedule(self, instance_files: List[Path]) -> List[Tuple[Path, float]]:
+        """Order instances longest-job-first by predicted cost."""
+
+        predicted = [(f, self.predict(f)) for f in instance_files]
+        return sorted(predicted, key=lambda item: item[1], reverse=True)
+
+    def report(
+        self, predicted: Dict[str, float], actual: Dict[str, float], report_file: Path
+    ):
+        """Write the predicted and actual time of every instance, once per run."""
+
+        entries = []
+        for name, seconds in predicted.items():
+            entry = {
+                "instance": name,
+                "predicted_time": round(seconds, 2),
+                "actual_time": (
+                    round(actual[name], 2) if actual.get(name) is not None else None
+                ),
+                "features": (
+                    asdict(self._features[name]) if name in self._features else None
+                ),
+            }
+            entries.append(entry)
+
+        with open(report_file, "w") as f:
+            json.dump(
+                {
+                    "fitted": self.fitted,
+                    "weights": dict(zip(self.FEATURE_NAMES, self.weights.tolist())),
+                    "instances": entries,
+                },
+                f,
+                indent=4,
+            )
@@ -0,0 +1,311 @@
+"""
+Shards: the tags and the code graph of a workspace split by top-level package,
+for workspaces whose graph is too large to hold in memory at once.
+
+Each shard holds the tags of the files under one top-level directory (the files
+at the root of the workspace form a shard of their own) and the code graph built
+from them, so the edges of a shard stay within it. All shards are stored in one
+memory-mapped file per artifact, next to a symbol directory that maps every name
+to the shards defining and referencing it: that is how a query finds the other
+packages a symbol leads to. ShardedIndex loads the shards a query touches and
+keeps the most recently used ones in memory, up to a cap.
+"""
+
+import os
+import re
+import logging
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import networkx as nx
+
+from agent_as_a_judge.module.array_file import (
+    StringTable,
+    load_arrays,
+    map_file,
+    save_arrays,
+    write_atomic,
+)
+from agent_as_a_judge.module.code_graph import CodeGraph
+from agent_as_a_judge.module.tag_store import TagStore
+
+
+SHARDED_TAGS_FILE = "tags.shards"
+SHARDED_GRAPH_FILE = "graph.shards"
+SHARDED_DETAILS_FILE = "graph.shards.details"
+
+TAGS_MAGIC = b"AAJTSHRD"
+GRAPH_MAGIC = b"AAJGSHRD"
+
+# Bump whenever the layout of the shard files changes.
+SHARD_FORMAT_VERSION = 1
+
+# The shard of the files at the root of the workspace
+ROOT_SHARD = "."
+
+DEFAULT_CACHE_MB = 512
+
+# Symbols defined in more shards than this do not pick shards on their own
+MAX_SYMBOL_SHARDS = 8
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def shard_name(rel_fname: str) -> str:
+    """The shard of a file: its top-level directory in the workspace."""
+
+    head, sep, _ = rel_fname.replace(os.sep, "/").lstrip("/").partition("/")
+    return head if sep else ROOT_SHARD
+
+
+def _prefixed(shard: int, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+
+    return {f"{shard}/{name}": array for name, array in arrays.items()}
+
+
+def _unprefixed(arrays: Dict[str, np.ndarray], shard: int) -> Dict[str, np.ndarray]:
+
+    prefix = f"{shard}/"
+    return {
+        name[len(prefix) :]: array
+        for name, array in arrays.items()
+        if name.startswith(prefix)
+    }
+
+
+def _csr(lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in lists], out=offsets[1:])
+    values = np.array([i for items in lists for i in items], dtype=np.int32)
+    return offsets, values
+
+
+def save_shards(
+    directory: Path, tags, build_graph: Callable[[list], nx.MultiDiGraph]
+) -> List[str]:
+    """
+    Save the tags grouped by shard, each shard with the graph `build_graph`
+    builds from its tags. Returns the names of the shards.
+    """
+
+    directory = Path(directory)
+    tags_by_shard = defaultdict(list)
+    for tag in tags or []:
+        tags_by_shard[shard_name(tag.rel_fname)].append(tag)
+    names = sorted(tags_by_shard)
+
+    tag_arrays = {}
+    graph_arrays = {}
+    details = []
+    details_size = 0
+    tag_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    shard_bytes = np.zeros(len(names), dtype=np.int64)
+    defined_in = defaultdict(set)
+    referenced_in = defaultdict(set)
+    for i, name in enumerate(names):
+        shard_tags = tags_by_shard[name]
+        tag_offsets[i + 1] = tag_offsets[i] + len(shard_tags)
+        for tag in shard_tags:
+            if tag.identifier == "def":
+                defined_in[tag.name].add(i)
+            else:
+                referenced_in[tag.name].add(i)
+
+        store = TagStore.from_tags(shard_tags)
+        graph = CodeGraph.from_networkx(build_graph(shard_tags))
+        arrays = graph.stored_arrays()
+        shard_details = graph.details_data()
+        # Offsets into the details of all shards
+        arrays["details_offsets"] = arrays["details_offsets"] + details_size
+        details.append(shard_details)
+        details_size += len(shard_details)
+        tag_arrays.update(_prefixed(i, store.arrays))
+        graph_arrays.update(_prefixed(i, arrays))
+        shard_bytes[i] = (
+            sum(array.nbytes for array in store.arrays.values())
+            + sum(array.nbytes for array in arrays.values())
+            + len(shard_details)
+        )
+
+    symbols = sorted(
+        set(defined_in) | set(referenced_in), key=lambda name: name.encode("utf-8")
+    )
+    tag_arrays["shard_names_offsets"], tag_arrays["shard_names_data"] = (
+        StringTable.encode(names)
+    )
+    tag_arrays["shard_tag_offsets"] = tag_offsets
+    tag_arrays["shard_bytes"] = shard_bytes
+    tag_arrays["symbol_offsets"], tag_arrays["symbol_data"] = StringTable.encode(
+        symbols
+    )
+    tag_arrays["symbol_def_offsets"], tag_arrays["symbol_def_shards"] = _csr(
+        [sorted(defined_in.get(symbol, ())) for symbol in symbols]
+    )
+    tag_arrays["symbol_ref_offsets"], tag_arrays["symbol_ref_shards"] = _csr(
+        [sorted(referenced_in.get(symbol, ())) for symbol in symbols]
+    )
+
+    save_arrays(
+        directory / SHARDED_TAGS_FILE, TAGS_MAGIC, SHARD_FORMAT_VERSION, tag_arrays
+    )
+    save_arrays(
+        directory / SHARDED_GRAPH_FILE,
+        GRAPH_MAGIC,
+        SHARD_FORMAT_VERSION,
+        graph_arrays,
+    )
+    write_atomic(
+        directory / SHARDED_DETAILS_FILE,
+        lambda f: [f.write(shard_details) for shard_details in details],
+    )
+    return names
+
+
+class ShardedIndex:
+    def __init__(self, directory: Path, cache_mb: int = DEFAULT_CACHE_MB):
+        """Memory-map the shard files; no shard is read until it is loaded."""
+
+        directory = Path(directory)
+        self.tag_arrays = load_arrays(
+            directory / SHARDED_TAGS_FILE, TAGS_MAGIC, SHARD_FORMAT_VERSION
+        )
+        self.graph_arrays = load_arrays(
+            directory / SHARDED_GRAPH_FILE, GRAPH_MAGIC, SHARD_FORMAT_VERSION
+        )
+        self.details = map_file(directory / SHARDED_DETAILS_FILE)
+        arrays = self.tag_arrays
+        self.names = StringTable(
+            arrays["shard_names_offsets"], arrays["shard_names_data"]
+        ).tolist()
+        self.shard_ids = {name: i for i, name in enumerate(self.names)}
+        self.tag_offsets = arrays["shard_tag_offsets"]
+        self.shard_bytes = arrays["shard_bytes"]
+        self.symbols = StringTable(arrays["symbol_offsets"], arrays["symbol_data"])
+        self.cache_bytes = cache_mb * 2**20
+        self._loaded: "OrderedDict[int, Tuple[TagStore, CodeGraph]]" = OrderedDict()
+        self._loaded_bytes = 0
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+
+        directory = Path(directory)
+        return all(
+            (directory / name).exists()
+            for name in (SHARDED_TAGS_FILE, SHARDED_GRAPH_FILE, SHARDED_DETAILS_FILE)
+        )
+
+    def __len__(self) -> int:
+
+        return len(self.names)
+
+    def load(self, shard: int) -> Tuple[TagStore, CodeGraph]:
+        """
+        The tags and graph of a shard. Loaded shards are kept until the ones
+        used since take more than the cache size, the size of a shard being
+        estimated by that of its arrays.
+        """
+
+        if shard in self._loaded:
+            self._loaded.move_to_end(shard)
+            return self._loaded[shard]
+
+        loaded = (
+            TagStore(_unprefixed(self.tag_arrays, shard)),
+            CodeGraph(_unprefixed(self.graph_arrays, shard), self.details),
+        )
+        self._loaded[shard] = loaded
+        self._loaded_bytes += int(self.shard_bytes[shard])
+        while self._loaded_bytes > self.cache_bytes and len(self._loaded) > 1:
+            evicted, _ = self._loaded.popitem(last=False)
+            self._loaded_bytes -= int(self.shard_bytes[evicted])
+            logging.debug(f"Evicted shard {self.names[evicted]} from memory")
+        return loaded
+
+    def loaded(self) -> List[int]:
+        """The shards in memory, least recently used first."""
+
+        return list(self._loaded)
+
+    def tag_range(self, shard: int) -> Tuple[int, int]:
+        """The positions of the tags of a shard among the tags of all shards."""
+
+        return int(self.tag_offsets[shard]), int(self.tag_offsets[shard + 1])
+
+    def shard_of(self, rel_fname: str) -> Optional[int]:
+
+        return self.shard_ids.get(shard_name(rel_fname))
+
+    def shards_defining(self, name: str) -> List[int]:
+
+        return self._symbol_shards(name, "def")
+
+    def shards_referencing(self, name: str) -> List[int]:
+
+        return self._symbol_shards(name, "ref")
+
+    def _symbol_shards(self, name: str, kind: str) -> List[int]:
+
+        i = self.symbols.find(name)
+        if i is None:
+            return []
+        offsets = self.tag_arrays[f"symbol_{kind}_offsets"]
+        return self.tag_arrays[f"symbol_{kind}_shards"][
+            offsets[i] : offsets[i + 1]
+        ].tolist()
+
+    def shards_for(
+        self, text: str = "", paths: Iterable[str] = (), limit: int = 4
+    ) -> List[int]:
+        """
+        The shards a query touches: those of the given relative paths and of
+        the packages the text names, plus up to `limit` shards defining the
+        identifiers of the text, the rarer identifiers counting more.
+        """
+
+        selected = {self.shard_of(path) for path in paths} - {None}
+        scores = defaultdict(float)
+        for word in set(IDENTIFIER.findall(text)):
+            if word in self.shard_ids:
+                selected.add(self.shard_ids[word])
+            defining = self.shards_defining(word)
+            if 0 < len(defining) <= MAX_SYMBOL_SHARDS:
+                for shard in defining:
+                    scores[shard] += 1.0 / len(defining)
+        ranked = sorted(
+            (shard for shard in scores if shard not in selected),
+            key=lambda shard: (-scores[shard], shard),
+        )
+        selected.update(ranked[:limit])
+        return sorted(selected)
+
+    def view(self, shards: Sequence[int]) -> Tuple[TagStore, CodeGraph]:
+        """
+        The tags and graph of several shards as one, tags in shard order. Nodes
+        found in several shards are merged and the counts of their shared edges
+        summed.
+        """
+
+        shards = sorted(set(shards))
+        if not shards:
+            return TagStore.from_tags([]), CodeGraph.from_networkx(None)
+        if len(shards) == 1:
+            return self.load(shards[0])
+
+        loaded = [self.load(shard) for shard in shards]
+        tags = TagStore.from_records(
+            record for tag_store, _ in loaded for record in tag_store
+        )
+        merged = nx.MultiDiGraph()
+        for _, graph in loaded:
+            for name in graph.nodes():
+                if name not in merged:
+                    merged.add_node(name, **graph.node(name))
+            for source, target, key, count in graph.edges():
+                if merged.has_edge(source, target, key):
+                    merged.edges[source, target, key]["count"] += count
+                else:
+                    merged.add_edge(source, target, key=key, count=count)
+        return tags, CodeGraph.from_networkx(merged)
@@ -0,0 +1,92 @@
+"""
+StructureStore: the classes, methods and functions of every workspace file,
+indexed by relative path and holding only line numbers and byte offsets.
+
+Source text is never copied into the structure. It is sliced from the file
+(memory-mapped) only when the text of a class or function is actually needed,
+so the store stays small however large the workspace is.
+"""
+
+import os
+import re
+import mmap
+import codecs
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+LINE_END = re.compile(rb"\r\n|\r|\n")
+
+
+class Span(NamedTuple):
+    name: str
+    # 1-based, inclusive, like ast line numbers
+    start_line: int
+    end_line: int
+    # Byte range of the whole lines, in the file as stored on disk
+    start_byte: int
+    end_byte: int
+    methods: Tuple["Span", ...] = ()
+
+
+class FileStructure(NamedTuple):
+    classes: Tuple[Span, ...] = ()
+    functions: Tuple[Span, ...] = ()
+
+
+EMPTY_STRUCTURE = FileStructure()
+
+
+def line_offsets(data: bytes) -> List[int]:
+    """Byte offset of the start of every line, followed by the end of the data."""
+
+    start = len(codecs.BOM_UTF8) if data.startswith(codecs.BOM_UTF8) else 0
+    offsets = [start]
+    offsets.extend(match.end() for match in LINE_END.finditer(data))
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    return offsets
+
+
+def decode_lines(data: bytes) -> str:
+    """Decode whole lines, with universal newlines and without the last one."""
+
+    text = data.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text[:-1] if text.endswith("\n") else text
+
+
+class StructureStore:
+    def __init__(self, root: str):
+
+        self.root = root
+        self.files: Dict[str, FileStructure] = {}
+
+    def __contains__(self, relative_filepath: str) -> bool:
+
+        return relative_filepath in self.files
+
+    def __iter__(self) -> Iterator[str]:
+
+        return iter(self.files)
+
+    def __len__(self) -> int:
+
+        return len(self.files)
+
+    def add(self, relative_filepath: str, structure: FileStructure):
+
+        self.files[relative_filepath] = structure
+
+    def get(self, relative_filepath: str) -> Optional[FileStructure]:
+
+        return self.files.get(relative_filepath)
+
+    def text(self, relative_filepath: str, span: Span) -> str:
+        """The source of a class or function, read from the file on demand."""
+
+        if span.end_byte <= span.start_byte:
+            return ""
+        with open(os.path.join(self.root, relative_filepath), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode_lines(data[span.start_byte : span.end_byte])
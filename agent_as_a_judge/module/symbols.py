@@ -0,0 +1,94 @@
+"""
+SymbolTable: the callable members of standard-library and common third-party
+modules, precomputed by scripts/build_symbol_table.py so that DevGraph can tell
+library calls apart from workspace code without importing anything.
+"""
+
+import json
+import inspect
+import logging
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional
+
+
+SYMBOL_TABLE_FILE = Path(__file__).parent / "data" / "symbol_table.json"
+
+# Bump whenever the layout of the symbol table file changes.
+SYMBOL_TABLE_VERSION = 1
+
+# Members every class and every function has; left out of the table file.
+OBJECT_MEMBERS = frozenset(
+    name for name, member in inspect.getmembers(object) if callable(member)
+)
+FUNCTION_MEMBERS = frozenset(
+    name for name, member in inspect.getmembers(lambda: None) if callable(member)
+)
+
+
+class SymbolTable:
+    def __init__(self, modules: Dict[str, Dict] = None, member_sets: List = None):
+
+        self.modules = modules or {}
+        # Distinct lists of class members, referred to by index from the modules
+        self.member_sets = member_sets or []
+        self._callables = {}
+        self._members = {}
+
+    @classmethod
+    def load(cls, path: Path = SYMBOL_TABLE_FILE) -> "SymbolTable":
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load the symbol table {path}: {e}")
+            return cls()
+
+        if data.get("version") != SYMBOL_TABLE_VERSION:
+            logging.warning(
+                f"Ignoring symbol table {path} of version {data.get('version')}, "
+                f"expected {SYMBOL_TABLE_VERSION}"
+            )
+            return cls()
+        return cls(data["modules"], data["member_sets"])
+
+    def has_module(self, module: str) -> bool:
+
+        return module in self.modules
+
+    def module_callables(self, module: str) -> Optional[FrozenSet[str]]:
+        """Callable members of a module, or None if the module is unknown."""
+
+        if module not in self._callables:
+            entry = self.modules.get(module)
+            self._callables[module] = (
+                None if entry is None else frozenset(entry["callables"])
+            )
+        return self._callables[module]
+
+    def member_callables(self, module: str, name: str) -> Optional[FrozenSet[str]]:
+        """Callable members of `from module import name`, or None if unknown."""
+
+        submodule = self.module_callables(f"{module}.{name}")
+        if submodule is not None:
+            return submodule
+
+        entry = self.modules.get(module)
+        if entry is None:
+            return None
+        if name in entry["classes"]:
+            index = entry["classes"][name]
+            if index not in self._members:
+                members = frozenset(self.member_sets[index]) | OBJECT_MEMBERS
+                self._members[index] = members
+            return self._members[index]
+        if name in entry["callables"]:
+            return FUNCTION_MEMBERS
+        return frozenset()
+
+
+@lru_cache(maxsize=None)
+def get_symbol_table() -> SymbolTable:
+
+    return SymbolTable.load()
@@ -0,0 +1,188 @@
+"""
+TagCache: a persistent per-file cache of the tags extracted by DevGraph, in the
+spirit of aider's repomap TAGS_CACHE, plus the graph built from those tags.
+
+Entries are keyed by relative path and validated against the file's mtime and
+size; on a mismatch the content hash decides whether the file really changed.
+The cache lives in a single SQLite file next to the judge artifacts.
+"""
+
+import gc
+import os
+import pickle
+import sqlite3
+import logging
+from pathlib import Path
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from agent_as_a_judge.module.fingerprint import file_digest
+
+
+TAG_CACHE_FILE = "tags_cache.db"
+
+# Bump whenever the tags extracted from a file change.
+TAG_CACHE_VERSION = "5"
+
+
+@contextmanager
+def gc_paused():
+    """Unpickling many small objects triggers the cyclic GC over and over."""
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@dataclass
+class CachedFile:
+    mtime_ns: int
+    size: int
+    digest: str
+    tags: List
+
+    def is_valid(self, filepath: str) -> bool:
+        """Check the file against the entry, hashing it only if its stat changed."""
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        if stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size:
+            return True
+        if stat.st_size != self.size or file_digest(filepath) != self.digest:
+            return False
+        self.mtime_ns = stat.st_mtime_ns
+        return True
+
+
+class TagCache:
+    def __init__(self, cache_file: Path, root: str, timeout: float = 60.0):
+
+        self.cache_file = Path(cache_file)
+        self.root = os.path.abspath(root)
+        self.timeout = timeout
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    @staticmethod
+    def make_entry(filepath: str, tags: List) -> Optional[CachedFile]:
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return CachedFile(stat.st_mtime_ns, stat.st_size, file_digest(filepath), tags)
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(
+            str(self.cache_file), timeout=self.timeout, isolation_level=None
+        )
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _create_schema(self):
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    rel_fname TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    tags BLOB NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB)"
+            )
+            # Tags hold absolute paths, so a cache built for another root or by
+            # another tag extractor version is dropped
+            version = f"{TAG_CACHE_VERSION}\0{self.root}"
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            if row is None or row[0] != version:
+                if row is not None:
+                    logging.info(f"Discarding outdated tag cache {self.cache_file}")
+                conn.execute("DELETE FROM files")
+                conn.execute("DELETE FROM meta")
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('version', ?)", (version,)
+                )
+
+    def load(self) -> Dict[str, CachedFile]:
+
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT rel_fname, mtime_ns, size, digest, tags FROM files"
+            ).fetchall()
+        with gc_paused():
+            return {
+                rel_fname: CachedFile(mtime_ns, size, digest, pickle.loads(tags))
+                for rel_fname, mtime_ns, size, digest, tags in rows
+            }
+
+    def load_graph(self):
+
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'graph'").fetchone()
+        if row is None:
+            return None
+        with gc_paused():
+            return pickle.loads(row[0])
+
+    def update(
+        self,
+        entries: Dict[str, CachedFile],
+        removed: Iterable[str] = (),
+        graph=None,
+        keep_graph: bool = True,
+    ):
+        """
+        Store new entries, drop removed files and replace the cached graph;
+        without `keep_graph`, drop the graph, which no longer matches the tags.
+        """
+
+        with self._transaction() as conn:
+            conn.executemany(
+                "DELETE FROM files WHERE rel_fname = ?",
+                [(rel_fname,) for rel_fname in removed],
+            )
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO files (rel_fname, mtime_ns, size, digest, tags)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        rel_fname,
+                        entry.mtime_ns,
+                        entry.size,
+                        entry.digest,
+                        pickle.dumps(entry.tags, protocol=pickle.HIGHEST_PROTOCOL),
+                    )
+                    for rel_fname, entry in entries.items()
+                ],
+            )
+            if graph is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('graph', ?)",
+                    (pickle.dumps(graph, protocol=pickle.HIGHEST_PROTOCOL),),
+                )
+            elif not keep_graph:
+                conn.execute("DELETE FROM meta WHERE key = 'graph'")
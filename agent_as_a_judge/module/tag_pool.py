@@ -0,0 +1,207 @@
+"""
+TagExtractionPool: extracts the tags of many files in worker processes, so that
+tree-sitter, AST and pygments work runs on all cores instead of under one GIL.
+
+Files are dispatched in chunks. Workers report each file they start, so the
+parent knows exactly which file a worker was on when it exceeded the per-file
+timeout or died (e.g. hitting its memory cap). That worker is replaced, the
+rest of its chunk is re-queued, and only the offending file is dropped.
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional, Tuple
+
+
+def _limit_memory(memory_limit_mb: Optional[int]):
+    """Cap the address space of this process to its current size plus the limit."""
+
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        limit = current + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, OSError, ValueError) as e:
+        logging.debug(f"Memory cap not applied: {e}")
+
+
+def _worker_main(conn, graph_kwargs: Dict, memory_limit_mb: Optional[int]):
+
+    from agent_as_a_judge.module.graph import DevGraph
+
+    _limit_memory(memory_limit_mb)
+    dev_graph = DevGraph(**graph_kwargs)
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        for filepath in chunk:
+            conn.send(("start", filepath))
+            try:
+                conn.send(("done", filepath, dev_graph._process_file(filepath), None))
+            except MemoryError:
+                conn.send(("done", filepath, None, "exceeded the memory cap"))
+            except Exception as e:
+                # RecursionError included: drop the file, not the whole graph
+                conn.send(("done", filepath, None, repr(e)))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, context, graph_kwargs: Dict, memory_limit_mb: Optional[int]):
+
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, graph_kwargs, memory_limit_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.remaining: List[str] = []
+        self.current: Optional[str] = None
+        self.started = 0.0
+
+    @property
+    def busy(self) -> bool:
+
+        return bool(self.remaining)
+
+    def assign(self, chunk: List[str]):
+
+        self.remaining = list(chunk)
+        self.current = None
+        self.conn.send(chunk)
+
+    def stop(self, kill: bool = False):
+
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class TagExtractionPool:
+    def __init__(
+        self,
+        graph_kwargs: Dict,
+        num_workers: int = None,
+        chunk_size: int = None,
+        file_timeout: float = 60.0,
+        memory_limit_mb: Optional[int] = 2048,
+    ):
+
+        self.graph_kwargs = graph_kwargs
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.file_timeout = file_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.context = multiprocessing.get_context()
+
+    def _chunks(self, filepaths: List[str]) -> deque:
+
+        # Small chunks near the end keep all workers busy until the last file
+        size = self.chunk_size or max(
+            1, min(32, len(filepaths) // (self.num_workers * 4))
+        )
+        return deque(filepaths[i : i + size] for i in range(0, len(filepaths), size))
+
+    def _start_worker(self) -> _Worker:
+
+        return _Worker(self.context, self.graph_kwargs, self.memory_limit_mb)
+
+    def extract(self, filepaths: List[str]) -> Tuple[Dict[str, List], Dict[str, str]]:
+        """
+        Extract the tags of every file. Returns the tags by file and the reason
+        every dropped file failed.
+        """
+
+        pending = self._chunks(filepaths)
+        results: Dict[str, List] = {}
+        failures: Dict[str, str] = {}
+        workers = [
+            self._start_worker() for _ in range(min(self.num_workers, len(pending)))
+        ]
+        try:
+            for worker in workers:
+                if pending:
+                    worker.assign(pending.popleft())
+
+            while any(worker.busy for worker in workers):
+                busy = [worker for worker in workers if worker.busy]
+                wait(
+                    [w.conn for w in busy] + [w.process.sentinel for w in busy],
+                    timeout=1.0,
+                )
+                for i, worker in enumerate(workers):
+                    if not worker.busy:
+                        continue
+                    self._receive(worker, results, failures)
+                    if not worker.busy:
+                        if pending:
+                            worker.assign(pending.popleft())
+                        continue
+
+                    reason = None
+                    if not worker.process.is_alive():
+                        reason = f"worker died (exit code {worker.process.exitcode})"
+                    elif worker.current and (
+                        time.time() - worker.started > self.file_timeout
+                    ):
+                        reason = f"timed out after {self.file_timeout}s"
+                    if reason is None:
+                        continue
+
+                    # Drop the offending file and hand the rest of its chunk on
+                    if worker.current:
+                        failures[worker.current] = reason
+                        rest = [f for f in worker.remaining if f != worker.current]
+                        if rest:
+                            pending.appendleft(rest)
+                    else:
+                        # The worker died before starting on any file
+                        failures.update((f, reason) for f in worker.remaining)
+                    worker.stop(kill=True)
+                    workers[i] = self._start_worker()
+                    if pending:
+                        workers[i].assign(pending.popleft())
+        finally:
+            for worker in workers:
+                worker.stop()
+
+        return results, failures
+
+    def _receive(self, worker: _Worker, results: Dict, failures: Dict):
+
+        try:
+            while worker.conn.poll():
+                message = worker.conn.recv()
+                if message[0] == "start":
+                    worker.current = message[1]
+                    worker.started = time.time()
+                elif message[0] == "done":
+                    _, filepath, tags, error = message
+                    if error is None:
+                        results[filepath] = tags
+                    else:
+                        failures[filepath] = error
+                    worker.remaining.remove(filepath)
+                    worker.current = None
+        except (EOFError, OSError):
+            # The worker died; whatever it did not report is handled by the caller
+            pass
@@ -0,0 +1,237 @@
+"""
+TagStore: the tags of a workspace in columnar form, replacing the indented
+`tags.json` that had to be parsed in full before any search.
+
+Every string field (paths, names, categories, identifiers, details) is interned
+into a string table and stored per tag as an int32 id; line spans are an int32
+column, next to the occurrence count of aggregated references and the rows they
+occur on. Each table has a lowercase twin, so the search routines evaluate a
+query once per distinct value instead of lowercasing every field of every tag
+on every query. The file is memory-mapped: loading takes milliseconds and the details of
+a tag are only decoded when it is read.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from agent_as_a_judge.module.array_file import StringTable, load_arrays, save_arrays
+
+
+TAGS_FILE = "tags.col"
+# Optional debug export, in the former format
+TAGS_JSON_FILE = "tags.json"
+
+MAGIC = b"AAJTAGS\0"
+
+# Bump whenever the layout of the tags file changes.
+TAG_FORMAT_VERSION = 2
+
+# Tag line numbers are [start, end]; a single line number is stored with this end
+NO_END = np.iinfo(np.int32).min
+
+STRING_FIELDS = ("fname", "rel_fname", "name", "identifier", "category", "details")
+
+# The fields searched when a query does not name any
+SEARCH_FIELDS = ("name", "category", "identifier", "details")
+
+
+def tag_record(tag) -> Dict[str, Any]:
+    """The dict form of a DevGraph tag, as found in `tags.json`."""
+
+    return {
+        "fname": tag.fname,
+        "rel_fname": tag.rel_fname,
+        "line_number": tag.line,
+        "name": tag.name,
+        "identifier": tag.identifier,
+        "category": tag.category,
+        "details": tag.details,
+        "count": tag.count,
+        "lines": list(tag.lines),
+    }
+
+
+class TagStore:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+
+        self.arrays = arrays
+        self.tables = {
+            field: StringTable(arrays[f"{field}_offsets"], arrays[f"{field}_data"])
+            for field in STRING_FIELDS
+        }
+        self.lower_tables = {
+            field: StringTable(
+                arrays[f"{field}_lower_offsets"], arrays[f"{field}_lower_data"]
+            )
+            for field in STRING_FIELDS
+        }
+        self._values: Dict[str, List[str]] = {}
+        self._lower_values: Dict[str, List[str]] = {}
+
+    # Building and storage
+
+    @classmethod
+    def from_tags(cls, tags) -> "TagStore":
+
+        return cls.from_records(tag_record(tag) for tag in tags or [])
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "TagStore":
+
+        records = list(records)
+        arrays = {}
+        for field in STRING_FIELDS:
+            values = {}
+            ids = np.fromiter(
+                (
+                    values.setdefault(record.get(field) or "", len(values))
+                    for record in records
+                ),
+                dtype=np.int32,
+                count=len(records),
+            )
+            arrays[f"{field}_ids"] = ids
+            offsets, data = StringTable.encode(list(values))
+            arrays[f"{field}_offsets"] = offsets
+            arrays[f"{field}_data"] = data
+            offsets, data = StringTable.encode([value.lower() for value in values])
+            arrays[f"{field}_lower_offsets"] = offsets
+            arrays[f"{field}_lower_data"] = data
+
+        line = np.full(2 * len(records), NO_END, dtype=np.int32)
+        for i, record in enumerate(records):
+            line_number = record.get("line_number")
+            if isinstance(line_number, (list, tuple)):
+                line[2 * i : 2 * i + 2] = line_number
+            elif line_number is not None:
+                line[2 * i] = line_number
+        arrays["line"] = line
+        arrays["count"] = np.array(
+            [record.get("count", 1) for record in records], dtype=np.int32
+        )
+        lines = [record.get("lines") or [] for record in records]
+        lines_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in lines], out=lines_offsets[1:])
+        arrays["lines_offsets"] = lines_offsets
+        arrays["lines"] = np.array(
+            [row for rows in lines for row in rows], dtype=np.int32
+        )
+        return cls(arrays)
+
+    def save(self, directory: Path):
+
+        save_arrays(Path(directory) / TAGS_FILE, MAGIC, TAG_FORMAT_VERSION, self.arrays)
+
+    @classmethod
+    def load(cls, directory: Path) -> "TagStore":
+        """Memory-map saved tags; nothing is read until they are searched."""
+
+        return cls(load_arrays(Path(directory) / TAGS_FILE, MAGIC, TAG_FORMAT_VERSION))
+
+    def export_json(self, path: Path):
+
+        with open(path, "w") as f:
+            json.dump(list(self), f, indent=4)
+
+    # Access
+
+    def __len__(self) -> int:
+
+        return len(self.arrays["name_ids"])
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("tag index out of range")
+        record = {field: self._value(field, i) for field in STRING_FIELDS}
+        return self._record(record, i)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+
+        columns = [self.column(field) for field in STRING_FIELDS]
+        for i, values in enumerate(zip(*columns)):
+            yield self._record(dict(zip(STRING_FIELDS, values)), i)
+
+    def ids(self, field: str) -> np.ndarray:
+        """The id of the value of a field for every tag."""
+
+        return self.arrays[f"{field}_ids"]
+
+    def values(self, field: str) -> List[str]:
+        """The distinct values of a field, indexed by id."""
+
+        if field not in self._values:
+            self._values[field] = self.tables[field].tolist()
+        return self._values[field]
+
+    def lower_values(self, field: str) -> List[str]:
+
+        if field not in self._lower_values:
+            self._lower_values[field] = self.lower_tables[field].tolist()
+        return self._lower_values[field]
+
+    def counts(self) -> np.ndarray:
+        """How many occurrences each tag stands for."""
+
+        return self.arrays["count"]
+
+    def column(self, field: str) -> List[str]:
+        """The value of a field for every tag."""
+
+        values = self.values(field)
+        return [values[i] for i in self.ids(field).tolist()]
+
+    # Search
+
+    def scores(
+        self, field: str, score: Callable[[str], Any], lower: bool = True
+    ) -> np.ndarray:
+        """
+        Score every tag on a field. The score is computed once per distinct
+        (lowercase by default) value and broadcast to the tags holding it.
+        """
+
+        values = self.lower_values(field) if lower else self.values(field)
+        distinct = np.array([score(value) for value in values])
+        if len(distinct) == 0:
+            return np.zeros(len(self), dtype=distinct.dtype)
+        return distinct[self.ids(field)]
+
+    def matches(
+        self, field: str, predicate: Callable[[str], bool], lower: bool = True
+    ) -> np.ndarray:
+
+        return self.scores(field, predicate, lower).astype(bool)
+
+    def select(self, mask: np.ndarray) -> List[Dict[str, Any]]:
+
+        return [self[i] for i in np.flatnonzero(mask)]
+
+    def _value(self, field: str, i: int) -> str:
+
+        tag_id = int(self.ids(field)[i])
+        if field in self._values:
+            return self._values[field][tag_id]
+        return self.tables[field][tag_id]
+
+    def _record(self, record: Dict[str, Any], i: int) -> Dict[str, Any]:
+
+        start, end = self.arrays["line"][2 * i : 2 * i + 2].tolist()
+        lines_start, lines_end = self.arrays["lines_offsets"][i : i + 2]
+        return {
+            "fname": record["fname"],
+            "rel_fname": record["rel_fname"],
+            "line_number": start if end == NO_END else [start, end],
+            "name": record["name"],
+            "identifier": record["identifier"],
+            "category": record["category"],
+            "details": record["details"],
+            "count": int(self.arrays["count"][i]),
+            "lines": self.arrays["lines"][lines_start:lines_end].tolist(),
+        }
@@ -13,8 +13,15 @@ from pathlib import Path
 from rapidfuzz import fuzz
 from rank_bm25 import BM25Okapi
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer, util
 from agent_as_a_judge.llm.provider import LLM
+from agent_as_a_judge.module.embedding_service import (
+    embedding_signature,
+    get_embedding_service,
+    load_signature,
+    save_signature,
+)
 from agent_as_a_judge.module.prompt.system_prompt_retrieve import (
     get_retrieve_system_prompt,
 )
@@ -36,14 +43,28 @@ logging.basicConfig(
 
 
 class DevTextRetrieve:
-    def __init__(self, trajectory_file: str):
+
+    EMBEDDINGS_FILE = "trajectory_embeddings.npy"
+    SIGNATURE_FILE = "trajectory_embeddings.json"
+    BM25_CORPUS_FILE = "trajectory_bm25_corpus.json"
+
+    def __init__(
+        self,
+        trajectory_file: str,
+        index_dir: str = None,
+        embedding_model: SentenceTransformer = None,
+        embedding_model_name: str = None,
+        embedding_backend: str = None,
+    ):
         self.trajectory_file = Path(trajectory_file)
+        self.index_dir = Path(index_dir) if index_dir else None
         self.raw_trajectory_data = self.load_trajectory_data()
         self.text_data = self.process_trajectory_data()
         self.spacy_nlp = None
         self.bm25 = None
-        #self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.embedding_model = SentenceTransformer("/media/sc/AI/self-llm/embed_model/sentence-transformers/all-MiniLM-L6-v2")
+        self._embedding_model = embedding_model
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
         self.text_embeddings = None
         self.llm = LLM(
             model=os.getenv("DEFAULT_LLM"), api_key=os.getenv("OPENAI_API_KEY")
@@ -55,6 +76,19 @@ class DevTextRetrieve:
             self.spacy_nlp = spacy.load("en_core_web_sm")
         return self.spacy_nlp
 
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        if self._embedding_model is None:
+            self._embedding_model = get_embedding_service(
+                self.embedding_model_name, backend=self.embedding_backend
+            ).get()
+        return self._embedding_model
+
+    def _index_file(self, name: str) -> Union[Path, None]:
+        if self.index_dir is None:
+            return None
+        return self.index_dir / name
+
     def load_trajectory_data(self) -> List[Dict[str, Any]]:
 
         try:
@@ -173,14 +207,7 @@ class DevTextRetrieve:
             return []
 
         if self.bm25 is None:
-            self.corpus = [
-                [
-                    token.text.lower()
-                    for token in self._spacy(entry.get("content", ""))
-                    if not token.is_stop and not token.is_punct
-                ]
-                for entry in self.text_data
-            ]
+            self.corpus = self.load_bm25_corpus() or self.build_bm25_corpus()
             self.bm25 = BM25Okapi(self.corpus)
 
         tokenized_query = [
@@ -192,12 +219,77 @@ class DevTextRetrieve:
         top_n_indices = np.argsort(scores)[::-1][:top_n]
         return [self.text_data[i] for i in top_n_indices]
 
+    def build_bm25_corpus(self) -> List[List[str]]:
+
+        return [
+            [
+                token.text.lower()
+                for token in self._spacy(entry.get("content", ""))
+                if not token.is_stop and not token.is_punct
+            ]
+            for entry in self.text_data
+        ]
+
+    def load_bm25_corpus(self) -> List[List[str]]:
+
+        corpus_file = self._index_file(self.BM25_CORPUS_FILE)
+        if corpus_file is None or not corpus_file.exists():
+            return []
+        try:
+            with open(corpus_file, "r") as f:
+                corpus = json.load(f)
+        except json.JSONDecodeError:
+            return []
+        return corpus if len(corpus) == len(self.text_data) else []
+
+    def save_bm25_corpus(self) -> int:
+
+        self.corpus = self.build_bm25_corpus()
+        with open(self._index_file(self.BM25_CORPUS_FILE), "w") as f:
+            json.dump(self.corpus, f)
+        return len(self.corpus)
+
+    def load_text_embeddings(self) -> Union[np.ndarray, None]:
+
+        embeddings_file = self._index_file(self.EMBEDDINGS_FILE)
+        if embeddings_file is None or not embeddings_file.exists():
+            return None
+        signature = embedding_signature(
+            self.embedding_model_name, self.embedding_backend
+        )
+        if load_signature(self._index_file(self.SIGNATURE_FILE)) != signature:
+            logging.warning(
+                "Prebuilt trajectory embeddings were built with another model, "
+                "rebuilding"
+            )
+            return None
+        embeddings = np.load(embeddings_file)
+        return embeddings if len(embeddings) == len(self.text_data) else None
+
+    def save_text_embeddings(self) -> int:
+
+        embeddings = self._generate_text_embeddings()
+        self.text_embeddings = embeddings.cpu().numpy().astype(np.float32)
+        np.save(self._index_file(self.EMBEDDINGS_FILE), self.text_embeddings)
+        save_signature(
+            self._index_file(self.SIGNATURE_FILE),
+            embedding_signature(self.embedding_model_name, self.embedding_backend),
+        )
+        return len(self.text_embeddings)
+
     def embedding_search(self, query: str, top_n: int = 5) -> List[Dict[str, Any]]:
 
+        if self.text_embeddings is None:
+            self.text_embeddings = self.load_text_embeddings()
         if self.text_embeddings is None:
             self.text_embeddings = self._generate_text_embeddings()
 
         query_embedding = self.embedding_model.encode(query, convert_to_tensor=True)
+        # Embeddings loaded or saved as numpy live on the CPU, the query on the
+        # device of the model
+        self.text_embeddings = torch.as_tensor(
+            self.text_embeddings, device=query_embedding.device
+        )
         similarities = util.pytorch_cos_sim(query_embedding, self.text_embeddings)[0]
         top_n_indices = similarities.topk(k=top_n)[1]
         return [self.text_data[i] for i in top_n_indices]
@@ -0,0 +1,240 @@
+"""
+Vector indexes for semantic search over the embeddings of many tags, replacing
+a cosine similarity against every embedding computed through torch per query.
+
+Embeddings are normalised once and stored as float32, float16, or int8 with a
+scale per row, so that a dot product is the cosine similarity. The narrower
+types halve or quarter the memory but are widened block by block to be scored,
+which numpy does slowly for float16. ExactIndex scores all
+rows in blocks; IVFIndex clusters the rows with spherical k-means and only
+scores the rows of the clusters nearest each query, for sets too large to scan.
+Both answer batches of queries with the top k rows of each.
+
+IVF search is approximate: its recall depends on how clustered the embeddings
+are, so it is only used on request until scripts/bench_vector_index.py shows
+it meets a recall target on real embeddings.
+"""
+
+import abc
+import math
+import logging
+from typing import Dict, Optional, Tuple, Type
+
+import numpy as np
+
+
+# Rows scored at once, to bound the float32 copies of the stored vectors
+BLOCK_ROWS = 32_768
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def normalise(matrix) -> np.ndarray:
+    """The rows of a matrix as float32 unit vectors (zero rows stay zero)."""
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k best scores of each row, best first, and their columns."""
+
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((len(scores), 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind="stable")
+    return (
+        np.take_along_axis(best, order, axis=1),
+        np.take_along_axis(columns, order, axis=1),
+    )
+
+
+class QuantizedVectors:
+    """Unit vectors stored as float32, float16, or int8 with a scale per row."""
+
+    def __init__(self, unit: np.ndarray, dtype: str = "float16"):
+
+        if dtype in ("float32", "float16"):
+            self.data = unit.astype(dtype)
+            self.scale = None
+        elif dtype == "int8":
+            scale = np.abs(unit).max(axis=1) / 127 if len(unit) else np.zeros(0)
+            scale = np.where(scale == 0, 1, scale).astype(np.float32)
+            self.data = np.round(unit / scale[:, None]).astype(np.int8)
+            self.scale = scale
+        else:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.dtype = dtype
+
+    def __len__(self) -> int:
+
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+
+        return self.data.nbytes + (0 if self.scale is None else self.scale.nbytes)
+
+    def scores(self, queries: np.ndarray, start: int = 0, end: int = None):
+        """The dot products of the queries with the rows start:end."""
+
+        block = self.data[start:end].astype(np.float32, copy=False)
+        scores = queries @ block.T
+        if self.scale is not None:
+            scores *= self.scale[start:end]
+        return scores
+
+
+class VectorIndex(abc.ABC):
+    """Top-k search by cosine similarity over a fixed set of vectors."""
+
+    def __len__(self) -> int:
+
+        return len(self.vectors)
+
+    @abc.abstractmethod
+    def search(self, queries, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The scores and row ids of the k rows most similar to each query, best
+        first. `queries` is one vector or a batch of them.
+        """
+
+
+class ExactIndex(VectorIndex):
+    def __init__(self, matrix, dtype: str = "float16"):
+
+        self.vectors = QuantizedVectors(normalise(matrix), dtype)
+
+    def search(self, queries, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+
+        queries = normalise(queries)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block_scores = self.vectors.scores(queries, start, start + BLOCK_ROWS)
+            scores, ids = top_k(block_scores, k)
+            scores, columns = top_k(np.hstack([best_scores, scores]), k)
+            ids = np.take_along_axis(np.hstack([best_ids, ids + start]), columns, 1)
+            best_scores, best_ids = scores, ids
+        return best_scores, best_ids
+
+
+class IVFIndex(VectorIndex):
+    def __init__(
+        self,
+        matrix,
+        dtype: str = "float16",
+        n_lists: Optional[int] = None,
+        n_probe: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ):
+        """
+        Cluster the rows into `n_lists` lists (sqrt of the rows by default) and
+        search the `n_probe` lists nearest each query (a quarter by default).
+        """
+
+        unit = normalise(matrix)
+        self.n_lists = max(1, min(n_lists or int(math.sqrt(len(unit))), len(unit)))
+        self.n_probe = max(1, min(n_probe or math.ceil(self.n_lists / 4), self.n_lists))
+        self.centroids = self._kmeans(unit, iterations, np.random.default_rng(seed))
+        assignments = self._assign(unit)
+        # The rows of each list are stored contiguously
+        self.order = np.argsort(assignments, kind="stable")
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(assignments, minlength=self.n_lists), out=self.offsets[1:]
+        )
+        self.vectors = QuantizedVectors(unit[self.order], dtype)
+
+    def _kmeans(self, unit: np.ndarray, iterations: int, rng) -> np.ndarray:
+        """Spherical k-means on a sample of the rows."""
+
+        if not len(unit):
+            return np.zeros((1, unit.shape[1]), dtype=np.float32)
+        sample_size = min(len(unit), 64 * self.n_lists)
+        sample = unit[rng.choice(len(unit), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            sizes = np.bincount(assignments, minlength=self.n_lists)
+            empty = np.flatnonzero(sizes == 0)
+            # Empty lists restart from random rows
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+            centroids = normalise(sums)
+        return centroids
+
+    def _assign(self, unit: np.ndarray) -> np.ndarray:
+
+        return np.concatenate(
+            [
+                np.argmax(unit[start : start + BLOCK_ROWS] @ self.centroids.T, axis=1)
+                for start in range(0, len(unit), BLOCK_ROWS)
+            ]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+
+    def search(self, queries, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+
+        queries = normalise(queries)
+        _, probes = top_k(queries @ self.centroids.T, self.n_probe)
+        # Each list is scored once against all the queries probing it
+        probing_queries = np.repeat(np.arange(len(queries)), probes.shape[1])
+        probed_lists = probes.ravel()
+        by_list = np.argsort(probed_lists, kind="stable")
+        lists, starts = np.unique(probed_lists[by_list], return_index=True)
+        found_scores = [[] for _ in queries]
+        found_positions = [[] for _ in queries]
+        for l, group in zip(lists, np.split(by_list, starts[1:])):
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if start == end:
+                continue
+            query_ids = probing_queries[group]
+            scores = self.vectors.scores(queries[query_ids], start, end)
+            best, columns = top_k(scores, k)
+            for q, row_scores, row_columns in zip(query_ids, best, columns):
+                found_scores[q].append(row_scores)
+                found_positions[q].append(row_columns + start)
+
+        found = min(k, len(self.vectors))
+        scores = np.full((len(queries), found), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), found), -1, dtype=np.int64)
+        for q in range(len(queries)):
+            if not found_scores[q]:
+                continue
+            best, columns = top_k(np.concatenate(found_scores[q])[None, :], found)
+            positions = np.concatenate(found_positions[q])[columns[0]]
+            scores[q, : len(positions)] = best[0]
+            # Fewer candidates than k leave -1 ids at the end
+            ids[q, : len(positions)] = self.order[positions]
+        return scores, ids
+
+
+INDEXES: Dict[str, Type[VectorIndex]] = {"exact": ExactIndex, "ivf": IVFIndex}
+
+
+def build_index(matrix, kind: str = "auto", dtype: str = "auto") -> VectorIndex:
+    """
+    Index the rows of a matrix: "exact", "ivf", or "auto", which is exact for
+    now as IVF recall falls on loosely clustered embeddings. The "auto" dtype
+    keeps the rows of an exact index as float32 and those of an IVF index as
+    float16.
+    """
+
+    if kind == "auto":
+        kind = "exact"
+    if kind not in INDEXES:
+        raise ValueError(f"Unsupported vector index: {kind}")
+    if dtype == "auto":
+        dtype = "float32" if kind == "exact" else "float16"
+    index = INDEXES[kind](matrix, dtype=dtype)
+    logging.info(f"Built {kind} vector index of {len(index)} {dtype} vectors")
+    return index
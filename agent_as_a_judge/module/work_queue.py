@@ -0,0 +1,304 @@
+"""
+JudgeWorkQueue: a SQLite-backed job queue that lets judge workers on several
+nodes share one run of (developer_agent, setting, instance) jobs.
+
+The database file is meant to live on the filesystem shared by all nodes. Every
+operation opens a short-lived connection and runs inside an IMMEDIATE
+transaction, so claiming a job is atomic across processes. WAL is deliberately
+not used because it does not work on network filesystems.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class JudgeJob:
+    job_id: str
+    developer_agent: str
+    setting: str
+    instance: str
+    attempts: int
+    lease_token: str
+
+
+class JudgeWorkQueue:
+    def __init__(
+        self,
+        db_path: Path,
+        lease_seconds: float = 600.0,
+        max_attempts: int = 3,
+        timeout: float = 60.0,
+    ):
+
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    @staticmethod
+    def make_job_id(developer_agent: str, setting: str, instance: str) -> str:
+        return f"{developer_agent}/{setting}/{instance}"
+
+    @staticmethod
+    def default_worker_id() -> str:
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=self.timeout, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            # BEGIN itself fails once the lock wait times out: nothing to roll
+            # back, and the original error is the one to raise
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _create_schema(self):
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    developer_agent TEXT NOT NULL,
+                    setting TEXT NOT NULL,
+                    instance TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_token TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    updated REAL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority)"
+            )
+
+    def enqueue(
+        self, jobs: Iterable[Tuple[str, str, str]], priority: float = 0.0
+    ) -> int:
+        """
+        Add jobs to the queue. Jobs that already exist are left untouched. A job may
+        carry its own priority as a fourth element; higher priorities are leased first.
+        """
+
+        added = 0
+        now = time.time()
+        with self._transaction() as conn:
+            for job in jobs:
+                developer_agent, setting, instance = job[:3]
+                job_priority = job[3] if len(job) > 3 else priority
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs "
+                    "(job_id, developer_agent, setting, instance, status, priority, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.make_job_id(developer_agent, setting, instance),
+                        developer_agent,
+                        setting,
+                        instance,
+                        PENDING,
+                        job_priority,
+                        now,
+                    ),
+                )
+                added += cursor.rowcount
+        return added
+
+    def requeue_expired(self) -> int:
+        """Return jobs whose lease has expired (dead or stalled worker) to the queue."""
+
+        with self._transaction() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> int:
+        expired = conn.execute(
+            "SELECT job_id, worker FROM jobs WHERE status = ? AND lease_expires < ?",
+            (LEASED, now),
+        ).fetchall()
+        for row in expired:
+            logging.warning(
+                f"Lease of job '{row['job_id']}' held by '{row['worker']}' expired, re-queueing"
+            )
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "error = 'lease expired', lease_token = NULL, updated = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (self.max_attempts, FAILED, PENDING, now, LEASED, now),
+        )
+        return len(expired)
+
+    def acquire(self, worker_id: str) -> Optional[JudgeJob]:
+        """Lease the highest-priority pending job, or return None if there is none."""
+
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? "
+                "ORDER BY priority DESC, job_id LIMIT 1",
+                (PENDING,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            lease_token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_token = ?, "
+                "lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE job_id = ?",
+                (
+                    LEASED,
+                    worker_id,
+                    lease_token,
+                    now + self.lease_seconds,
+                    now,
+                    row["job_id"],
+                ),
+            )
+            return JudgeJob(
+                job_id=row["job_id"],
+                developer_agent=row["developer_agent"],
+                setting=row["setting"],
+                instance=row["instance"],
+                attempts=row["attempts"] + 1,
+                lease_token=lease_token,
+            )
+
+    def heartbeat(self, job: JudgeJob) -> bool:
+        """Extend the lease of a job. Returns False if the lease was lost."""
+
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE job_id = ? AND lease_token = ? AND status = ?",
+                (now + self.lease_seconds, now, job.job_id, job.lease_token, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job: JudgeJob, result: Dict = None) -> bool:
+        """
+        Commit the result of a job. Committing is idempotent: the first commit of
+        a job wins, and later commits (e.g. from a worker whose lease expired while
+        another worker re-ran the job) are ignored and return False.
+        """
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, "
+                "lease_token = NULL, lease_expires = NULL, updated = ? "
+                "WHERE job_id = ? AND status != ?",
+                (DONE, json.dumps(result or {}), time.time(), job.job_id, DONE),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job: JudgeJob, error: str) -> bool:
+        """Release a job after an error. It is retried until max_attempts is reached."""
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_token = NULL, lease_expires = NULL, updated = ? "
+                "WHERE job_id = ? AND lease_token = ? AND status = ?",
+                (
+                    self.max_attempts,
+                    FAILED,
+                    PENDING,
+                    error,
+                    time.time(),
+                    job.job_id,
+                    job.lease_token,
+                    LEASED,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def timings(self) -> List[Dict]:
+        """Priority (predicted cost) and elapsed time of every finished job."""
+
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT job_id, priority, result FROM jobs WHERE status = ? "
+                "ORDER BY priority DESC",
+                (DONE,),
+            ).fetchall()
+        return [
+            {
+                "job_id": row["job_id"],
+                "priority": row["priority"],
+                "elapsed": json.loads(row["result"] or "{}").get("elapsed"),
+            }
+            for row in rows
+        ]
+
+    def is_drained(self) -> bool:
+
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    @contextmanager
+    def leased(self, job: JudgeJob, interval: float = None):
+        """Keep the lease of a job alive from a background thread while it is judged."""
+
+        interval = interval or max(self.lease_seconds / 3, 1.0)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    if not self.heartbeat(job):
+                        logging.warning(f"Lost the lease of job '{job.job_id}'")
+                        return
+                except sqlite3.Error as e:
+                    logging.warning(f"Heartbeat for job '{job.job_id}' failed: {e}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield job
+        finally:
+            stop.set()
+            thread.join()
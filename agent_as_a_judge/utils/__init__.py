@@ -1,5 +1,5 @@
-from agent_as_a_judge.utils.truncate import truncate_string
+from agent_as_a_judge.utils.truncate import count_tokens, truncate_string
 from agent_as_a_judge.utils.count_lines import count_lines_of_code
 
 
-__all__ = ["truncate_string", "count_lines_of_code"]
+__all__ = ["truncate_string", "count_tokens", "count_lines_of_code"]
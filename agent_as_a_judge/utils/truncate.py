@@ -1,5 +1,6 @@
 import os
 import logging
+from functools import lru_cache
 from typing import Union
 import tiktoken
 from dotenv import load_dotenv
@@ -7,6 +8,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+@lru_cache(maxsize=None)
+def get_encoding(model: Union[str, None]):
+
+    if not model:
+        # No model configured (e.g. DEFAULT_LLM unset): tiktoken cannot look it up
+        return tiktoken.get_encoding("cl100k_base")
+    try:
+        # 根据模型获取编码
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Fallback to cl100k_base (used by gpt-4) if model not found
+        logging.warning(f"Model {model} not found in tiktoken. Using cl100k_base encoding instead.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(info_string: str, model: str = os.getenv("DEFAULT_LLM")) -> int:
+
+    return len(get_encoding(model).encode(info_string, disallowed_special=()))
+
+
 def truncate_string(
     info_string: Union[str, None],
     model: str = os.getenv("DEFAULT_LLM"),
@@ -24,14 +45,7 @@ def truncate_string(
     # 将info_string转换为字符串类型
     info_string = str(info_string)
     
-    try:
-        # 根据模型获取编码
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        # Fallback to cl100k_base (used by gpt-4) if model not found
-        logging.warning(f"Model {model} not found in tiktoken. Using cl100k_base encoding instead.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
+    encoding = get_encoding(model)
     tokens = encoding.encode(info_string, disallowed_special=())
 
     # If tokens exceed the maximum length, we truncate based on the drop_mode
@@ -0,0 +1,140 @@
+import sys
+import time
+import logging
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from agent_as_a_judge.module.embedding_service import embedding_model_name
+from agent_as_a_judge.module.onnx_embedding import OnnxEmbedder, default_threads
+from agent_as_a_judge.module.vector_index import normalise, top_k
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def source_snippets(num_texts: int, lines: int = 12):
+    """Snippets of this package's source, standing in for the details of tags."""
+
+    root = Path(__file__).resolve().parent.parent / "agent_as_a_judge"
+    texts = []
+    for path in sorted(root.rglob("*.py")):
+        source = path.read_text(encoding="utf-8").splitlines()
+        for start in range(0, len(source), lines):
+            text = "\n".join(source[start : start + lines]).strip()
+            if text:
+                texts.append(text)
+            if len(texts) == num_texts:
+                return texts
+    return texts
+
+
+def throughput(model, texts, batch_size: int, repeats: int = 3) -> float:
+    """Sentences encoded per second, the best of a few runs."""
+
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    best = float("inf")
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        model.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - start_time)
+    return len(texts) / best
+
+
+def parity(expected: np.ndarray, found: np.ndarray, k: int = 10):
+    """
+    The cosine similarity of each pair of embeddings, and the share of the k
+    nearest neighbours of each text found by both.
+    """
+
+    expected, found = normalise(expected), normalise(found)
+    cosines = (expected * found).sum(axis=1)
+    k = min(k, len(expected))
+    _, expected_ids = top_k(expected @ expected.T, k)
+    _, found_ids = top_k(found @ found.T, k)
+    overlap = np.mean(
+        [len(set(a) & set(b)) / k for a, b in zip(expected_ids, found_ids)]
+    )
+    return cosines, overlap
+
+
+def main(
+    model_name: str, num_texts: int, batch_size: int, threads, min_cosine: float
+):
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    texts = source_snippets(num_texts)
+    logging.info(f"Encoding {len(texts)} snippets with {model_name}")
+    torch_model = SentenceTransformer(model_name, device="cpu")
+    onnx_models = {t: OnnxEmbedder(model_name, threads=t) for t in threads}
+
+    cosines, overlap = parity(
+        torch_model.encode(texts, batch_size=batch_size),
+        onnx_models[threads[0]].encode(texts, batch_size=batch_size),
+    )
+    logging.info(
+        f"Parity: cosine min {cosines.min():.4f} mean {cosines.mean():.4f}, "
+        f"top-10 neighbours shared {overlap:.3f}"
+    )
+
+    logging.info(
+        f"{'backend':>8} {'threads':>8} {'sent/s':>9} {'sent/s/core':>12} "
+        f"{'speedup':>8}"
+    )
+    for t in threads:
+        torch.set_num_threads(t)
+        torch_rate = throughput(torch_model, texts, batch_size)
+        onnx_rate = throughput(onnx_models[t], texts, batch_size)
+        logging.info(f"{'torch':>8} {t:>8} {torch_rate:>9.1f} {torch_rate / t:>12.1f}")
+        logging.info(
+            f"{'onnx':>8} {t:>8} {onnx_rate:>9.1f} {onnx_rate / t:>12.1f} "
+            f"{onnx_rate / torch_rate:>7.2f}x"
+        )
+
+    if cosines.min() < min_cosine:
+        logging.error(
+            f"ONNX embeddings diverge from torch: cosine {cosines.min():.4f} "
+            f"< {min_cosine}"
+        )
+        sys.exit(1)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Check the int8 ONNX embedding backend against torch and "
+        "compare their throughput on CPU."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=embedding_model_name(),
+        help="Sentence embedding model, a hub name or local path",
+    )
+    parser.add_argument(
+        "--texts", type=int, default=512, help="Number of source snippets to encode"
+    )
+    parser.add_argument("--batch_size", type=int, default=32, help="Encoding batch")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=sorted({1, default_threads()}),
+        help="Intra-op thread counts to measure",
+    )
+    parser.add_argument(
+        "--min_cosine",
+        type=float,
+        default=0.99,
+        help="Fail when any embedding is less similar to its torch counterpart",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.model, args.texts, args.batch_size, args.threads, args.min_cosine)
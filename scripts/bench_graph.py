@@ -0,0 +1,123 @@
+import gc
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+import networkx as nx
+
+from agent_as_a_judge.module.graph import DevGraph, Tag
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def synthetic_tags(num_tags: int, seed: int = 0):
+    """
+    Tags of a synthetic repo: files with a class, its methods and functions, and
+    references that mostly hit a small set of popular names, like the pygments
+    fallback tokens do.
+    """
+
+    rng = random.Random(seed)
+    num_files = max(1, num_tags // 40)
+    popular = [f"common_{i}" for i in range(50)]
+    defined = []
+    tags = []
+
+    for i in range(num_files):
+        rel_fname = f"pkg{i % 20}/mod{i}.py"
+        methods = [f"method_{i}_{j}" for j in range(3)]
+        tags.append(
+            Tag(
+                rel_fname,
+                rel_fname,
+                [1, 10],
+                f"Model{i}",
+                "def",
+                "class",
+                "\n".join(methods),
+            )
+        )
+        for name in methods + [f"helper_{i}_{j}" for j in range(3)]:
+            tags.append(
+                Tag(rel_fname, rel_fname, [1, 3], name, "def", "function", name)
+            )
+            defined.append(name)
+        # Popular names (__init__, forward, ...) are defined over and over
+        name = popular[i % len(popular)]
+        tags.append(Tag(rel_fname, rel_fname, [1, 3], name, "def", "function", name))
+
+    while len(tags) < num_tags:
+        i = rng.randrange(num_files)
+        rel_fname = f"pkg{i % 20}/mod{i}.py"
+        name = rng.choice(popular) if rng.random() < 0.5 else rng.choice(defined)
+        tags.append(Tag(rel_fname, rel_fname, -1, name, "ref", "function", "none"))
+    return tags[:num_tags]
+
+
+def legacy_reference_edges(G, tags):
+    """The former pairwise comparison, kept to measure the speedup."""
+
+    tags_ref = [tag for tag in tags if tag.identifier == "ref"]
+    tags_def = [tag for tag in tags if tag.identifier == "def"]
+    for tag_ref in tags_ref:
+        for tag_def in tags_def:
+            if tag_ref.name == tag_def.name:
+                G.add_edge(tag_ref.name, tag_def.name)
+
+
+def main(sizes, legacy_max: int):
+
+    dev_graph = DevGraph(root=tempfile.gettempdir())
+    logging.info(
+        f"{'tags':>8} {'graph s':>9} {'ns/tag':>8} {'edges':>7} "
+        f"{'pairs':>12} {'legacy s':>9}"
+    )
+    for size in sizes:
+        tags = synthetic_tags(size)
+        gc.collect()
+
+        start_time = time.perf_counter()
+        G = dev_graph._tags_to_graph(tags)
+        seconds = time.perf_counter() - start_time
+        pairs = sum(count for _, _, count in G.edges(data="count"))
+
+        legacy = "-"
+        if size <= legacy_max:
+            start_time = time.perf_counter()
+            legacy_reference_edges(nx.MultiDiGraph(), tags)
+            legacy = f"{time.perf_counter() - start_time:.3f}"
+
+        logging.info(
+            f"{size:>8} {seconds:>9.3f} {seconds / size * 1e9:>8.0f} "
+            f"{G.number_of_edges():>7} {pairs:>12} {legacy:>9}"
+        )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark code graph construction on synthetic tags."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 2000, 5000, 10000, 20000, 50000, 100000],
+        help="Numbers of tags to build graphs from",
+    )
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=5000,
+        help="Largest size to also time the former pairwise reference loop on",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.sizes, args.legacy_max)
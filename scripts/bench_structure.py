@@ -0,0 +1,210 @@
+import os
+import gc
+import ast
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from copy import deepcopy
+from pathlib import Path
+
+from agent_as_a_judge.module.graph import DevGraph
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def synthetic_workspace(directory: Path, num_files: int, classes_per_file: int = 4):
+    """Files of a few classes with documented methods, plus helper functions."""
+
+    for i in range(num_files):
+        lines = ["import os", ""]
+        for c in range(classes_per_file):
+            lines.append(f"class Model{i}_{c}:")
+            for m in range(5):
+                lines.append(f"    def method_{m}(self, x):")
+                lines.append(f'        """Compute step {m} of model {i}."""')
+                lines.extend(f"        x = x * {k} + os.getpid()" for k in range(6))
+                lines.append("        return x")
+                lines.append("")
+        for f in range(4):
+            lines.append(f"def helper_{i}_{f}(values):")
+            lines.extend(f"    values = [v + {k} for v in values]" for k in range(8))
+            lines.append("    return values")
+            lines.append("")
+        path = directory / f"pkg{i % 25}" / f"mod{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def legacy_parse_python_file(file_path):
+    """The former structure parser, copying the source of every node."""
+
+    with open(file_path, "r") as file:
+        file_content = file.read()
+    parsed_data = ast.parse(file_content)
+    class_info = []
+    function_names = []
+    class_methods = set()
+    for node in ast.walk(parsed_data):
+        if isinstance(node, ast.ClassDef):
+            methods = []
+            for n in node.body:
+                if isinstance(n, ast.FunctionDef):
+                    methods.append(
+                        {
+                            "name": n.name,
+                            "start_line": n.lineno,
+                            "end_line": n.end_lineno,
+                            "text": file_content.splitlines()[
+                                n.lineno - 1 : n.end_lineno
+                            ],
+                        }
+                    )
+                    class_methods.add(n.name)
+            class_info.append(
+                {
+                    "name": node.name,
+                    "start_line": node.lineno,
+                    "end_line": node.end_lineno,
+                    "text": file_content.splitlines()[
+                        node.lineno - 1 : node.end_lineno
+                    ],
+                    "methods": methods,
+                }
+            )
+        elif isinstance(node, ast.FunctionDef) and node.name not in class_methods:
+            function_names.append(
+                {
+                    "name": node.name,
+                    "start_line": node.lineno,
+                    "end_line": node.end_lineno,
+                    "text": file_content.splitlines()[
+                        node.lineno - 1 : node.end_lineno
+                    ],
+                }
+            )
+    return class_info, function_names, file_content.splitlines()
+
+
+def legacy_create_structure(dev_graph: DevGraph, directory_path: str):
+    """The former nested structure, kept to measure the savings."""
+
+    structure = {}
+    for filepath in dev_graph.list_all_files(directory_path):
+        parts = Path(os.path.relpath(filepath, directory_path)).parts
+        current_structure = structure
+        for part in parts[:-1]:
+            current_structure = current_structure.setdefault(part, {})
+        if filepath.endswith(".py"):
+            class_info, function_names, code_lines = legacy_parse_python_file(
+                filepath
+            )
+            current_structure[parts[-1]] = {
+                "classes": class_info,
+                "functions": function_names,
+                "code": code_lines,
+            }
+        else:
+            current_structure[parts[-1]] = {}
+    return structure
+
+
+def measure(build):
+    """Seconds to build, and the memory the result retains and peaks at."""
+
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start_time
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, retained, peak
+
+
+def main(workspace: str, num_files: int, legacy_max: int):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if workspace is None:
+            workspace = tmp_dir
+            synthetic_workspace(Path(tmp_dir), num_files)
+        dev_graph = DevGraph(root=workspace)
+        py_files = sorted(dev_graph.list_py_files([workspace]))
+        relative_paths = [
+            Path(os.path.relpath(f, workspace)).as_posix() for f in py_files
+        ]
+        source_mb = sum(os.path.getsize(f) for f in py_files) / 2**20
+        logging.info(f"{len(py_files)} Python files, {source_mb:.1f}MB of source")
+
+        store, seconds, retained, peak = measure(
+            lambda: dev_graph.create_structure(workspace)
+        )
+        logging.info(
+            f"store:  built in {seconds:.2f}s, retains {retained / 2**20:.1f}MB, "
+            f"peak {peak / 2**20:.1f}MB"
+        )
+        legacy, seconds, retained, peak = measure(
+            lambda: legacy_create_structure(dev_graph, workspace)
+        )
+        logging.info(
+            f"legacy: built in {seconds:.2f}s, retains {retained / 2**20:.1f}MB, "
+            f"peak {peak / 2**20:.1f}MB"
+        )
+
+        # Every processed file used to deep-copy the whole nested structure
+        dev_graph._structure = store
+        start_time = time.perf_counter()
+        for relative_path in relative_paths:
+            file_structure = dev_graph._navigate_structure(relative_path.split("/"))
+            for span in file_structure.functions[:1]:
+                store.text(relative_path, span)
+        seconds = time.perf_counter() - start_time
+        logging.info(
+            f"store:  navigated {len(relative_paths)} files in {seconds:.3f}s"
+        )
+
+        sample = relative_paths[:legacy_max]
+        start_time = time.perf_counter()
+        for relative_path in sample:
+            s = deepcopy(legacy)
+            for part in relative_path.split("/"):
+                s = s.get(part)
+        seconds = time.perf_counter() - start_time
+        logging.info(
+            f"legacy: navigated {len(sample)} files in {seconds:.3f}s "
+            f"(~{seconds / max(1, len(sample)) * len(relative_paths):.1f}s "
+            f"for all {len(relative_paths)})"
+        )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memory and time of the workspace structure."
+    )
+    parser.add_argument(
+        "--workspace",
+        type=str,
+        help="Workspace to measure (default: a synthetic workspace)",
+    )
+    parser.add_argument(
+        "--num_files",
+        type=int,
+        default=2000,
+        help="Number of files of the synthetic workspace",
+    )
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=50,
+        help="Number of files to time the former deep-copying navigation on",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.workspace, args.num_files, args.legacy_max)
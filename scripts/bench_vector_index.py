@@ -0,0 +1,201 @@
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from agent_as_a_judge.module.vector_index import (
+    IVFIndex,
+    build_index,
+    normalise,
+    top_k,
+)
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def synthetic_embeddings(num_rows: int, dim: int, seed: int = 0):
+    """
+    Embeddings gathered around topics, as those of the tags of a repo are, with
+    queries drawn near the same topics.
+    """
+
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(1, num_rows // 200), dim)).astype(np.float32)
+    rows = topics[rng.integers(len(topics), size=num_rows)]
+    rows += 0.6 * rng.standard_normal((num_rows, dim)).astype(np.float32)
+    return rows, topics
+
+
+def synthetic_queries(topics: np.ndarray, num_queries: int, seed: int = 1):
+
+    rng = np.random.default_rng(seed)
+    queries = topics[rng.integers(len(topics), size=num_queries)]
+    return queries + 0.6 * rng.standard_normal(queries.shape).astype(np.float32)
+
+
+def saved_embeddings(path: str, num_queries: int, seed: int = 1):
+    """
+    Real embeddings, such as the code_embeddings.npy of a judged workspace,
+    with some of their rows held out as queries.
+    """
+
+    rows = np.load(path).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(rows), min(num_queries, len(rows) // 2), replace=False)
+    kept = np.ones(len(rows), dtype=bool)
+    kept[held_out] = False
+    return rows[kept], rows[held_out]
+
+
+def legacy_search(matrix, queries, k: int) -> float:
+    """The former torch cosine similarity against all rows, one query at a time."""
+
+    import torch
+    from sentence_transformers import util
+
+    embeddings = torch.from_numpy(matrix)
+    start_time = time.perf_counter()
+    for query in queries:
+        scores = util.pytorch_cos_sim(torch.from_numpy(query), embeddings)[0]
+        torch.topk(scores, k)
+    return time.perf_counter() - start_time
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+
+    hits = sum(len(set(a) & set(b)) for a, b in zip(found.tolist(), expected))
+    return hits / expected.size
+
+
+def datasets(sizes, dim: int, num_queries: int, embeddings=None):
+
+    if embeddings:
+        yield saved_embeddings(embeddings, num_queries)
+        return
+    for size in sizes:
+        matrix, topics = synthetic_embeddings(size, dim)
+        yield matrix, synthetic_queries(topics, num_queries)
+
+
+def main(
+    sizes,
+    dim: int,
+    num_queries: int,
+    k: int,
+    legacy_max: int,
+    embeddings=None,
+    n_probe=None,
+    min_recall: float = 0.95,
+):
+
+    logging.info(
+        f"{'rows':>8} {'index':>6} {'dtype':>8} {'build s':>8} {'MB':>7} "
+        f"{'batch ms':>9} {'query ms':>9} {'recall':>7} {'legacy ms':>10}"
+    )
+    below = []
+    for matrix, queries in datasets(sizes, dim, num_queries, embeddings):
+        size = len(matrix)
+        _, expected = top_k(normalise(queries) @ normalise(matrix).T, k)
+
+        legacy = "-"
+        if size <= legacy_max:
+            try:
+                seconds = legacy_search(matrix, queries, k)
+                legacy = f"{seconds / num_queries * 1e3:.2f}"
+            except ImportError:
+                pass
+
+        for kind in ("exact", "ivf"):
+            for dtype in ("float32", "float16", "int8"):
+                start_time = time.perf_counter()
+                index = (
+                    IVFIndex(matrix, dtype=dtype, n_probe=n_probe)
+                    if kind == "ivf"
+                    else build_index(matrix, kind=kind, dtype=dtype)
+                )
+                build = time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                _, ids = index.search(queries, k)
+                batch = time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                for query in queries:
+                    index.search(query, k)
+                single = (time.perf_counter() - start_time) / num_queries
+
+                found = recall(ids, expected)
+                logging.info(
+                    f"{size:>8} {kind:>6} {dtype:>8} {build:>8.2f} "
+                    f"{index.vectors.nbytes / 2**20:>7.1f} {batch * 1e3:>9.1f} "
+                    f"{single * 1e3:>9.2f} {found:>7.3f} "
+                    f"{legacy:>10}"
+                )
+                if found < min_recall:
+                    below.append(f"{size} {kind} {dtype}: {found:.3f}")
+
+    if below:
+        logging.warning(f"Recall@{k} below {min_recall}: " + ", ".join(below))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the vector indexes of semantic search on synthetic "
+        "embeddings."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="Numbers of embeddings to index",
+    )
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument(
+        "--queries", type=int, default=100, help="Number of queries to search"
+    )
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=100000,
+        help="Largest size to also time the former torch cosine similarity on",
+    )
+    parser.add_argument(
+        "--embeddings",
+        type=str,
+        default=None,
+        help="Saved embeddings (.npy) to index instead of synthetic ones, some rows "
+        "held out as queries",
+    )
+    parser.add_argument(
+        "--n_probe",
+        type=int,
+        default=None,
+        help="IVF lists searched per query (default: a quarter of the lists)",
+    )
+    parser.add_argument(
+        "--min_recall",
+        type=float,
+        default=0.95,
+        help="Warn about indexes whose recall@k falls below this",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(
+        args.sizes,
+        args.dim,
+        args.queries,
+        args.k,
+        args.legacy_max,
+        args.embeddings,
+        args.n_probe,
+        args.min_recall,
+    )
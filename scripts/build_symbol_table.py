@@ -0,0 +1,319 @@
+"""
+Regenerate agent_as_a_judge/module/data/symbol_table.json, the static table of
+library symbols DevGraph uses instead of importing workspace dependencies.
+
+Every module is imported in its own subprocess, so crashing or noisy imports
+cannot affect the others. Run it in an environment with every THIRD_PARTY
+package installed: the table is not written when one of them cannot be imported,
+unless --allow_missing is given.
+"""
+
+import sys
+import json
+import inspect
+import logging
+import pkgutil
+import argparse
+import platform
+import importlib
+import importlib.util
+import subprocess
+from importlib import metadata
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Standard-library modules with side effects on import, or of no use to judge code
+STDLIB_SKIP = {
+    "antigravity",
+    "this",
+    "idlelib",
+    "turtledemo",
+    "test",
+    "lib2to3",
+    "ensurepip",
+    "pydoc_data",
+}
+
+# Common third-party modules of developer-agent workspaces; submodules are listed
+# explicitly because walking them would import far too much.
+THIRD_PARTY = [
+    "numpy",
+    "numpy.linalg",
+    "numpy.random",
+    "pandas",
+    "scipy",
+    "scipy.stats",
+    "scipy.optimize",
+    "scipy.signal",
+    "scipy.sparse",
+    "sklearn",
+    "sklearn.model_selection",
+    "sklearn.metrics",
+    "sklearn.preprocessing",
+    "sklearn.linear_model",
+    "sklearn.ensemble",
+    "sklearn.svm",
+    "sklearn.tree",
+    "sklearn.neighbors",
+    "sklearn.cluster",
+    "sklearn.decomposition",
+    "sklearn.feature_extraction.text",
+    "sklearn.feature_selection",
+    "sklearn.pipeline",
+    "sklearn.impute",
+    "sklearn.naive_bayes",
+    "sklearn.datasets",
+    "torch",
+    "torch.nn",
+    "torch.nn.functional",
+    "torch.optim",
+    "torch.optim.lr_scheduler",
+    "torch.utils.data",
+    "torchvision",
+    "torchvision.transforms",
+    "torchvision.models",
+    "torchvision.datasets",
+    "torchaudio",
+    "tensorflow",
+    "tensorflow.keras",
+    "keras",
+    "transformers",
+    "datasets",
+    "sentence_transformers",
+    "xgboost",
+    "lightgbm",
+    "catboost",
+    "statsmodels.api",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "seaborn",
+    "plotly.express",
+    "PIL",
+    "PIL.Image",
+    "cv2",
+    "skimage",
+    "librosa",
+    "soundfile",
+    "nltk",
+    "spacy",
+    "gensim",
+    "networkx",
+    "requests",
+    "bs4",
+    "flask",
+    "fastapi",
+    "yaml",
+    "tqdm",
+    "joblib",
+    "gym",
+    "gymnasium",
+    "optuna",
+    "wandb",
+    "imblearn",
+    "shap",
+]
+
+
+def describe(module_name: str) -> dict:
+    """Callable members of a module, and the callable members of its classes."""
+
+    # Members of every class, added back by SymbolTable when loading
+    object_members = {n for n, m in inspect.getmembers(object) if callable(m)}
+    module = importlib.import_module(module_name)
+    callables = []
+    classes = {}
+    for name in dir(module):
+        try:
+            member = getattr(module, name)
+        except Exception:
+            continue
+        if not callable(member):
+            continue
+        callables.append(name)
+        if inspect.isclass(member):
+            try:
+                members = inspect.getmembers(member)
+            except Exception:
+                members = []
+            classes[name] = sorted(
+                n for n, m in members if callable(m) and n not in object_members
+            )
+    return {"callables": sorted(callables), "classes": classes}
+
+
+def stdlib_modules(max_depth: int = 2) -> list:
+
+    modules = []
+
+    def walk(name: str, depth: int):
+        modules.append(name)
+        if depth >= max_depth:
+            return
+        spec = importlib.util.find_spec(name)
+        if spec is None or not spec.submodule_search_locations:
+            return
+        for info in pkgutil.iter_modules(spec.submodule_search_locations):
+            if not info.name.startswith("_") and "test" not in info.name:
+                walk(f"{name}.{info.name}", depth + 1)
+
+    for name in sorted(sys.stdlib_module_names):
+        if name.startswith("_") or name in STDLIB_SKIP:
+            continue
+        try:
+            walk(name, 0)
+        except (ImportError, ValueError):
+            continue
+    return modules
+
+
+def dump_module(module_name: str, timeout: float):
+
+    try:
+        result = subprocess.run(
+            [sys.executable, __file__, "--dump", module_name],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Timed out importing {module_name}")
+        return module_name, None
+    if result.returncode != 0:
+        return module_name, None
+    return module_name, json.loads(result.stdout.splitlines()[-1])
+
+
+def pool_member_sets(modules: dict) -> list:
+    """
+    Store each distinct list of class members once (thousands of transformers
+    model classes share a few hundred) and refer to it by index.
+    """
+
+    pool = {}
+    member_sets = []
+    for entry in modules.values():
+        for name, members in entry["classes"].items():
+            key = tuple(members)
+            if key not in pool:
+                pool[key] = len(member_sets)
+                member_sets.append(members)
+            entry["classes"][name] = pool[key]
+    return member_sets
+
+
+def package_version(module_name: str):
+
+    top_level = module_name.split(".")[0]
+    for distribution in metadata.packages_distributions().get(top_level, []):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+    return None
+
+
+def main(
+    output_file: Path,
+    version: int,
+    num_workers: int,
+    timeout: float,
+    allow_missing: bool = False,
+):
+
+    stdlib = stdlib_modules()
+    module_names = stdlib + THIRD_PARTY
+    logging.info(
+        f"Describing {len(stdlib)} standard-library and "
+        f"{len(THIRD_PARTY)} third-party modules"
+    )
+
+    modules = {}
+    missing = []
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for module_name, entry in executor.map(
+            lambda name: dump_module(name, timeout), module_names
+        ):
+            if entry is not None:
+                modules[module_name] = entry
+            elif module_name in THIRD_PARTY:
+                missing.append(module_name)
+
+    if missing:
+        # Their symbols would leak into the code graph as project definitions
+        message = f"Cannot import {len(missing)} third-party modules: {missing}"
+        if not allow_missing:
+            logging.error(f"{message}; install them or pass --allow_missing")
+            sys.exit(1)
+        logging.warning(f"{message}; leaving them out of the table")
+
+    packages = {
+        name: package_version(name)
+        for name in sorted({m.split(".")[0] for m in THIRD_PARTY if m in modules})
+    }
+    modules = dict(sorted(modules.items()))
+    member_sets = pool_member_sets(modules)
+    table = {
+        "version": version,
+        "python": platform.python_version(),
+        "packages": packages,
+        "member_sets": member_sets,
+        "modules": modules,
+    }
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(table, f, separators=(",", ":"))
+        f.write("\n")
+    logging.info(f"Wrote {len(modules)} modules to {output_file}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Regenerate the static symbol table used by DevGraph."
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        help="Where to write the symbol table (default: the packaged table)",
+    )
+    parser.add_argument(
+        "--num_workers", type=int, default=4, help="Number of concurrent imports"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120.0,
+        help="Seconds allowed to import a single module",
+    )
+    parser.add_argument(
+        "--allow_missing",
+        action="store_true",
+        help="Write the table even if some third-party modules cannot be imported",
+    )
+    parser.add_argument("--dump", type=str, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.dump:
+        # Child process: print the description of a single module. The package is
+        # not imported here, so that only the described module gets loaded.
+        print(json.dumps(describe(args.dump)))
+    else:
+        from agent_as_a_judge.module.symbols import (
+            SYMBOL_TABLE_FILE,
+            SYMBOL_TABLE_VERSION,
+        )
+
+        main(
+            Path(args.output_file or SYMBOL_TABLE_FILE),
+            SYMBOL_TABLE_VERSION,
+            args.num_workers,
+            args.timeout,
+            args.allow_missing,
+        )
@@ -1,79 +1,265 @@
 import re
+import time
 import argparse
 import logging
+import multiprocessing
 from pathlib import Path
 from dotenv import load_dotenv
 
 from agent_as_a_judge.agent import JudgeAgent
 from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.work_queue import JudgeWorkQueue
+from agent_as_a_judge.module.schedule import InstanceCostModel
 
 
-def main(agent_config: AgentConfig, logger: logging.Logger):
+def extract_number_from_filename(filename: str) -> int:
+    match = re.search(r"(\d+)", filename)
+    return int(match.group(1)) if match else float("inf")
 
-    def extract_number_from_filename(filename: str) -> int:
-        match = re.search(r"(\d+)", filename)
-        return int(match.group(1)) if match else float("inf")
 
-    instance_files = sorted(
+def list_instance_files(agent_config: AgentConfig):
+    return sorted(
         list(agent_config.instance_dir.glob("*.json")),
         key=lambda f: extract_number_from_filename(f.stem),
     )
 
-    logger.info(f"Total instances found: {len(instance_files)}")
 
-    for instance_file in instance_files:
-        instance_name = instance_file.stem
+def judge_instance(
+    agent_config: AgentConfig, instance_file: Path, logger: logging.Logger
+):
+
+    instance_name = instance_file.stem
 
+    trajectory_file = None
+    if agent_config.trajectory_file:
+        trajectory_file = agent_config.trajectory_file / f"{instance_name}.json"
+
+    if trajectory_file and trajectory_file.exists():
+        logger.info(
+            f"Processing instance: {instance_file} with trajectory: {trajectory_file}"
+        )
+    else:
+        logger.warning(
+            f"Trajectory file not found for instance: {instance_file}, processing without it"
+        )
         trajectory_file = None
-        if agent_config.trajectory_file:
-            trajectory_file = agent_config.trajectory_file / f"{instance_name}.json"
 
-        judgment_file = agent_config.judge_dir / instance_file.name
+    workspace = agent_config.workspace_dir / instance_name
 
-        if judgment_file.exists():
-            logger.info(
-                f"Judgment for instance '{instance_name}' already exists. Skipping..."
-            )
+    judge_agent = JudgeAgent(
+        workspace=workspace,
+        instance=instance_file,
+        judge_dir=agent_config.judge_dir,
+        trajectory_file=trajectory_file,
+        config=agent_config,
+    )
+    judge_agent.judge_anything()
+
+
+def make_cost_model(agent_config: AgentConfig) -> InstanceCostModel:
+
+    cost_model = InstanceCostModel(agent_config)
+    # Judgments of every setting of this developer agent share the same workspaces
+    history_dirs = [d for d in agent_config.judge_dir.parent.glob("*") if d.is_dir()]
+    cost_model.fit(history_dirs)
+    return cost_model
+
+
+def main(agent_config: AgentConfig, logger: logging.Logger, schedule: str = "cost"):
+
+    instance_files = list_instance_files(agent_config)
+
+    logger.info(f"Total instances found: {len(instance_files)}")
+
+    cost_model = None
+    predicted, actual = {}, {}
+    if schedule == "cost":
+        cost_model = make_cost_model(agent_config)
+        scheduled = cost_model.schedule(instance_files)
+        instance_files = [instance_file for instance_file, _ in scheduled]
+        predicted = {instance_file.stem: cost for instance_file, cost in scheduled}
+
+    # The report covers the instances judged so far, even if the run fails
+    try:
+        for instance_file in instance_files:
+            instance_name = instance_file.stem
+            judgment_file = agent_config.judge_dir / instance_file.name
+
+            if judgment_file.exists():
+                logger.info(
+                    f"Judgment for instance '{instance_name}' already exists. "
+                    "Skipping..."
+                )
+                predicted.pop(instance_name, None)
+                continue
+
+            start_time = time.time()
+            judge_instance(agent_config, instance_file, logger)
+            actual[instance_name] = time.time() - start_time
+            if instance_name in predicted:
+                logger.info(
+                    f"{instance_name}: predicted {predicted[instance_name]:.2f}s, "
+                    f"actual {actual[instance_name]:.2f}s"
+                )
+    finally:
+        if cost_model:
+            # Runs after a failed judgment too: never replace its exception
+            try:
+                agent_config.judge_dir.mkdir(parents=True, exist_ok=True)
+                cost_model.report(
+                    predicted, actual, agent_config.judge_dir / "schedule_report.json"
+                )
+            except Exception as e:
+                logger.warning(f"Failed to write the schedule report: {e}")
+
+
+def build_agent_config(args, developer_agent: str, setting: str) -> AgentConfig:
+
+    benchmark_dir = Path(args.benchmark_dir)
+    return AgentConfig(
+        include_dirs=args.include_dirs,
+        exclude_dirs=args.exclude_dirs,
+        exclude_files=args.exclude_files,
+        setting=setting,
+        planning=args.planning,
+        judge_dir=benchmark_dir
+        / f"judgment/{developer_agent}/agent_as_a_judge/{setting}",
+        workspace_dir=benchmark_dir / f"workspaces/{developer_agent}",
+        instance_dir=benchmark_dir / "devai/instances",
+        trajectory_file=benchmark_dir / f"trajectories/{developer_agent}",
+        artifact_store=(
+            None
+            if args.no_artifact_store
+            else Path(args.artifact_store or benchmark_dir / "judgment/.artifact_store")
+        ),
+        export_tags_json=args.export_tags_json,
+        respect_gitignore=args.respect_gitignore,
+        max_file_size=args.max_file_size,
+        max_dir_entries=args.max_dir_entries,
+        embedding_model=args.embedding_model,
+        embedding_backend=args.embedding_backend,
+        vector_index=args.vector_index,
+        vector_dtype=args.vector_dtype,
+        shard_graph=args.shard_graph,
+        shard_cache_mb=args.shard_cache_mb,
+    )
+
+
+def make_queue(args) -> JudgeWorkQueue:
+
+    queue_db = args.queue_db or Path(args.benchmark_dir) / "judgment/queue.sqlite"
+    return JudgeWorkQueue(
+        queue_db, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts
+    )
+
+
+def enqueue(args, logger: logging.Logger):
+
+    queue = make_queue(args)
+    agent_config = build_agent_config(args, args.developer_agent, args.setting)
+    instance_files = [
+        instance_file
+        for instance_file in list_instance_files(agent_config)
+        if not (agent_config.judge_dir / instance_file.name).exists()
+    ]
+    # The predicted cost is the job priority, so workers pull the heaviest jobs first
+    cost_model = make_cost_model(agent_config) if args.schedule == "cost" else None
+    jobs = [
+        (
+            args.developer_agent,
+            args.setting,
+            instance_file.stem,
+            cost_model.predict(instance_file) if cost_model else 0.0,
+        )
+        for instance_file in instance_files
+    ]
+    added = queue.enqueue(jobs)
+    logger.info(f"Enqueued {added} new jobs ({len(jobs) - added} already queued)")
+    logger.info(f"Queue status: {queue.counts()}")
+
+
+def worker(args, worker_id: str):
+
+    load_dotenv()
+    logger = logging.getLogger(worker_id)
+    queue = make_queue(args)
+
+    while True:
+        job = queue.acquire(worker_id)
+        if job is None:
+            if queue.is_drained():
+                logger.info(f"[{worker_id}] Queue drained, exiting")
+                return
+            # Other workers still hold leases; wait in case one of them dies.
+            time.sleep(args.poll_seconds)
             continue
 
-        if trajectory_file and trajectory_file.exists():
-            logger.info(
-                f"Processing instance: {instance_file} with trajectory: {trajectory_file}"
-            )
-        else:
+        logger.info(f"[{worker_id}] Judging {job.job_id} (attempt {job.attempts})")
+        agent_config = build_agent_config(args, job.developer_agent, job.setting)
+        instance_file = agent_config.instance_dir / f"{job.instance}.json"
+        start_time = time.time()
+        try:
+            with queue.leased(job):
+                judge_instance(agent_config, instance_file, logger)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Job {job.job_id} failed: {e!r}")
+            queue.fail(job, repr(e))
+            continue
+
+        committed = queue.complete(
+            job,
+            {
+                "worker": worker_id,
+                "judgment_file": str(agent_config.judge_dir / instance_file.name),
+                "elapsed": time.time() - start_time,
+            },
+        )
+        if not committed:
             logger.warning(
-                f"Trajectory file not found for instance: {instance_file}, processing without it"
+                f"[{worker_id}] Job {job.job_id} was already committed by another worker"
             )
-            trajectory_file = None
 
-        workspace = agent_config.workspace_dir / instance_name
 
-        judge_agent = JudgeAgent(
-            workspace=workspace,
-            instance=instance_file,
-            judge_dir=agent_config.judge_dir,
-            trajectory_file=trajectory_file,
-            config=agent_config,
-        )
-        judge_agent.judge_anything()
+def run_workers(args, logger: logging.Logger):
+
+    base_id = args.worker_id or JudgeWorkQueue.default_worker_id()
+    if args.num_workers <= 1:
+        worker(args, base_id)
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker, args=(args, f"{base_id}-{i}"))
+        for i in range(args.num_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    logger.info(f"Queue status: {make_queue(args).counts()}")
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
-        "--developer_agent", type=str, required=True, help="Name of the developer agent"
+        "--mode",
+        type=str,
+        default="local",
+        choices=["local", "enqueue", "worker", "status"],
+        help="local: judge sequentially in this process; enqueue: add jobs to the "
+        "shared queue; worker: pull jobs from the shared queue; status: print queue counts",
+    )
+    parser.add_argument(
+        "--developer_agent", type=str, help="Name of the developer agent"
     )
     parser.add_argument(
         "--setting",
         type=str,
-        required=True,
         help="Setting for the JudgeAgent (e.g., gray_box, black_box)",
     )
     parser.add_argument(
         "--planning",
         type=str,
-        required=True,
         choices=["planning", "comprehensive (no planning)", "efficient (no planning)"],
         help="Module to run",
     )
@@ -117,8 +303,134 @@ def parse_arguments():
         type=str,
         help="Path to the trajectory directory, if available",
     )
+    parser.add_argument(
+        "--artifact_store",
+        type=str,
+        help="Content-addressed artifact store shared by all settings and runs "
+        "(default: <benchmark_dir>/judgment/.artifact_store)",
+    )
+    parser.add_argument(
+        "--no_artifact_store",
+        action="store_true",
+        help="Do not share artifacts through the artifact store",
+    )
+    # Indexing options, as given to run_index.py: artifacts are only reused
+    # under the same ones
+    parser.add_argument(
+        "--respect_gitignore",
+        action="store_true",
+        help="Skip the paths matched by the workspaces' .gitignore files, which "
+        "may hold the outputs the judge checks",
+    )
+    parser.add_argument(
+        "--max_file_size",
+        type=int,
+        default=None,
+        help="Files above this many bytes are listed but not parsed (default: 5MB)",
+    )
+    parser.add_argument(
+        "--max_dir_entries",
+        type=int,
+        default=100,
+        help="Summarise directories with more entries in the tree structure (0: never)",
+    )
+    parser.add_argument(
+        "--shard_graph",
+        action="store_true",
+        help="Split the graph and tags by top-level package, for very large workspaces",
+    )
+    parser.add_argument(
+        "--shard_cache_mb",
+        type=int,
+        default=512,
+        help="Memory for the packages of a sharded graph loaded at once",
+    )
+    parser.add_argument(
+        "--export_tags_json",
+        action="store_true",
+        help="Also write the tags as indented tags.json, for debugging",
+    )
+    parser.add_argument(
+        "--embedding_model",
+        type=str,
+        default=None,
+        help="Sentence embedding model, a hub name or local path "
+        "(default: $AAAJ_EMBEDDING_MODEL or all-MiniLM-L6-v2)",
+    )
+    parser.add_argument(
+        "--embedding_backend",
+        type=str,
+        default=None,
+        choices=["torch", "onnx"],
+        help="Run the embedding model with torch, or quantised to int8 with "
+        "onnxruntime (default: $AAAJ_EMBEDDING_BACKEND or torch)",
+    )
+    parser.add_argument(
+        "--vector_index",
+        type=str,
+        default="auto",
+        choices=["auto", "exact", "ivf"],
+        help="Vector index of semantic code search (auto: exact; ivf is faster "
+        "on many tags but approximate)",
+    )
+    parser.add_argument(
+        "--vector_dtype",
+        type=str,
+        default="auto",
+        choices=["auto", "float32", "float16", "int8"],
+        help="Precision of the indexed code embeddings",
+    )
+    parser.add_argument(
+        "--schedule",
+        type=str,
+        default="cost",
+        choices=["cost", "alphabetical"],
+        help="cost: judge the instances with the highest predicted cost first; "
+        "alphabetical: judge in instance order",
+    )
+    parser.add_argument(
+        "--queue_db",
+        type=str,
+        help="Path to the shared SQLite queue (default: <benchmark_dir>/judgment/queue.sqlite)",
+    )
+    parser.add_argument(
+        "--worker_id",
+        type=str,
+        help="Worker name recorded in leases (default: <hostname>-<pid>)",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to start on this node",
+    )
+    parser.add_argument(
+        "--lease_seconds",
+        type=float,
+        default=600.0,
+        help="Lease duration; a job whose lease is not renewed in time is re-queued",
+    )
+    parser.add_argument(
+        "--max_attempts",
+        type=int,
+        default=3,
+        help="Number of times a job is tried before it is marked as failed",
+    )
+    parser.add_argument(
+        "--poll_seconds",
+        type=float,
+        default=10.0,
+        help="How long an idle worker waits before polling the queue again",
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.mode in ("local", "enqueue") and not (
+        args.developer_agent and args.setting
+    ):
+        parser.error(f"--developer_agent and --setting are required in {args.mode} mode")
+    if args.mode in ("local", "worker") and not args.planning:
+        parser.error(f"--planning is required in {args.mode} mode")
+    return args
 
 
 if __name__ == "__main__":
@@ -128,28 +440,21 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     args = parse_arguments()
 
-    benchmark_dir = Path(args.benchmark_dir)
-    instance_dir = benchmark_dir / "devai/instances"
-    workspace_dir = benchmark_dir / f"workspaces/{args.developer_agent}"
-    judge_dir = (
-        benchmark_dir
-        / f"judgment/{args.developer_agent}/agent_as_a_judge/{args.setting}"
-    )
-    trajectory_file = benchmark_dir / f"trajectories/{args.developer_agent}"
-
-    agent_config = AgentConfig(
-        include_dirs=args.include_dirs,
-        exclude_dirs=args.exclude_dirs,
-        exclude_files=args.exclude_files,
-        setting=args.setting,
-        planning=args.planning,
-        judge_dir=judge_dir,
-        workspace_dir=workspace_dir,
-        instance_dir=instance_dir,
-        trajectory_file=trajectory_file,
-    )
-
-    main(
-        agent_config=agent_config,
-        logger=logger,
-    )
+    if args.mode == "enqueue":
+        enqueue(args, logger)
+    elif args.mode == "worker":
+        run_workers(args, logger)
+    elif args.mode == "status":
+        queue = make_queue(args)
+        for timing in queue.timings():
+            logger.info(
+                f"{timing['job_id']}: predicted {timing['priority']:.1f}s, "
+                f"actual {timing['elapsed'] or 0.0:.1f}s"
+            )
+        logger.info(f"Queue status: {queue.counts()}")
+    else:
+        main(
+            agent_config=build_agent_config(args, args.developer_agent, args.setting),
+            logger=logger,
+            schedule=args.schedule,
+        )
@@ -0,0 +1,314 @@
+import re
+import time
+import argparse
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from dotenv import load_dotenv
+
+from agent_as_a_judge.config import AgentConfig
+from agent_as_a_judge.module.embedding_service import get_embedding_service
+from agent_as_a_judge.module.index import (
+    DevIndexer,
+    SEARCH_ARTIFACTS,
+    SEARCH_EMBEDDING_ARTIFACTS,
+    TRAJECTORY_ARTIFACTS,
+    TRAJECTORY_EMBEDDING_ARTIFACTS,
+)
+
+
+def extract_number_from_filename(filename: str) -> int:
+    match = re.search(r"(\d+)", filename)
+    return int(match.group(1)) if match else float("inf")
+
+
+def make_indexer(
+    agent_config: AgentConfig, workspace: Path, graph_workers: int = None
+) -> DevIndexer:
+
+    trajectory_file = None
+    if agent_config.setting != "black_box" and agent_config.trajectory_file:
+        trajectory_file = agent_config.trajectory_file / f"{workspace.name}.json"
+    return DevIndexer(
+        workspace=workspace,
+        judge_dir=agent_config.judge_dir,
+        config=agent_config,
+        trajectory_file=trajectory_file,
+        graph_workers=graph_workers,
+    )
+
+
+def index_workspace(agent_config: AgentConfig, workspace: Path, force: bool):
+    """CPU-bound stages, run in a worker process per workspace."""
+
+    load_dotenv()
+    # Workspaces already run in parallel; one extraction process per workspace
+    # still isolates files that hang or blow up
+    indexer = make_indexer(agent_config, workspace, graph_workers=1)
+    stages = []
+    graph_stage = indexer.index_graph() if force else indexer.ensure_graph()
+    if graph_stage:
+        stages.append(graph_stage)
+    # Up-to-date artifacts are kept, identical workspaces in the store are linked
+    if force or not indexer.has_artifacts("search", SEARCH_ARTIFACTS):
+        stages += indexer.index_search(embeddings=False)
+    if force or not indexer.has_artifacts("trajectory", TRAJECTORY_ARTIFACTS):
+        stages += indexer.index_trajectory(embeddings=False)
+    return stages
+
+
+def embed_workspace(agent_config: AgentConfig, workspace: Path, embedding_model):
+    """Embedding stages, run in the main process so the model is loaded once."""
+
+    indexer = make_indexer(agent_config, workspace)
+    stages = []
+    # Embeddings built with another model are rebuilt
+    if not indexer.has_current(SEARCH_EMBEDDING_ARTIFACTS):
+        stages += indexer.index_search(embedding_model=embedding_model, bm25=False)
+    if not indexer.has_current(TRAJECTORY_EMBEDDING_ARTIFACTS):
+        stages += indexer.index_trajectory(embedding_model=embedding_model, bm25=False)
+    return stages
+
+
+def report(stages, wall_times, logger: logging.Logger):
+
+    totals = defaultdict(lambda: {"workspaces": 0, "items": 0, "seconds": 0.0})
+    for stage in stages:
+        total = totals[stage["stage"]]
+        total["workspaces"] += 1
+        total["items"] += stage["items"]
+        total["seconds"] += stage["seconds"]
+
+    logger.info("Per-stage throughput:")
+    for name, total in totals.items():
+        rate = total["items"] / total["seconds"] if total["seconds"] else float("inf")
+        logger.info(
+            f"  {name:<22} {total['workspaces']:>4} workspaces {total['items']:>8} items "
+            f"{total['seconds']:>9.2f}s cpu {rate:>10.1f} items/s"
+        )
+    for phase, seconds in wall_times.items():
+        logger.info(f"  {phase} phase wall time: {seconds:.2f}s")
+
+
+def main(
+    agent_config: AgentConfig,
+    logger: logging.Logger,
+    num_workers: int = None,
+    embeddings: bool = True,
+    force: bool = False,
+):
+
+    instance_names = {f.stem for f in agent_config.instance_dir.glob("*.json")}
+    workspaces = sorted(
+        [
+            d
+            for d in agent_config.workspace_dir.iterdir()
+            if d.is_dir() and d.name in instance_names
+        ],
+        key=lambda d: extract_number_from_filename(d.name),
+    )
+    logger.info(f"Indexing {len(workspaces)} workspaces into {agent_config.judge_dir}")
+
+    stages, wall_times = [], {}
+    embedding_service = get_embedding_service(
+        agent_config.embedding_model, backend=agent_config.embedding_backend
+    )
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(index_workspace, agent_config, workspace, force): workspace
+            for workspace in workspaces
+        }
+        # The workers are forked by now: load the model while they index
+        if embeddings:
+            embedding_service.warm_up()
+        for future in as_completed(futures):
+            try:
+                stages += future.result()
+            except Exception as e:
+                logger.error(f"Failed to index {futures[future].name}: {e!r}")
+    wall_times["index"] = time.time() - start_time
+
+    if embeddings:
+        start_time = time.time()
+        embedding_model = embedding_service.get()
+        for workspace in workspaces:
+            try:
+                stages += embed_workspace(agent_config, workspace, embedding_model)
+            except Exception as e:
+                logger.error(f"Failed to embed {workspace.name}: {e!r}")
+        wall_times["embedding"] = time.time() - start_time
+
+    report(stages, wall_times, logger)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Prebuild the judge artifacts of all workspaces of a developer agent."
+    )
+
+    parser.add_argument(
+        "--developer_agent", type=str, required=True, help="Name of the developer agent"
+    )
+    parser.add_argument(
+        "--setting",
+        type=str,
+        required=True,
+        help="Setting for the JudgeAgent (e.g., gray_box, black_box)",
+    )
+    parser.add_argument(
+        "--benchmark_dir",
+        type=str,
+        required=True,
+        help="Base directory for the DevAI benchmark",
+    )
+    parser.add_argument(
+        "--include_dirs",
+        nargs="+",
+        default=["src", "results", "models", "data"],
+        help="Directories to include in search",
+    )
+    parser.add_argument(
+        "--exclude_dirs",
+        nargs="+",
+        default=[
+            "__pycache__",
+            "env",
+            ".git",
+            "venv",
+            "logs",
+            "output",
+            "tmp",
+            "temp",
+            "cache",
+            "data",
+        ],
+        help="Directories to exclude in search",
+    )
+    parser.add_argument(
+        "--exclude_files",
+        nargs="+",
+        default=[".DS_Store"],
+        help="Files to exclude in search",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--no_embeddings",
+        action="store_true",
+        help="Skip the embedding stages",
+    )
+    parser.add_argument(
+        "--artifact_store",
+        type=str,
+        help="Content-addressed artifact store shared by all settings and runs "
+        "(default: <benchmark_dir>/judgment/.artifact_store)",
+    )
+    parser.add_argument(
+        "--no_artifact_store",
+        action="store_true",
+        help="Do not share artifacts through the artifact store",
+    )
+    parser.add_argument(
+        "--respect_gitignore",
+        action="store_true",
+        help="Skip the paths matched by the workspaces' .gitignore files, which "
+        "may hold the outputs the judge checks",
+    )
+    parser.add_argument(
+        "--max_file_size",
+        type=int,
+        default=None,
+        help="Files above this many bytes are listed but not parsed (default: 5MB)",
+    )
+    parser.add_argument(
+        "--max_dir_entries",
+        type=int,
+        default=100,
+        help="Summarise directories with more entries in the tree structure (0: never)",
+    )
+    parser.add_argument(
+        "--embedding_model",
+        type=str,
+        default=None,
+        help="Sentence embedding model, a hub name or local path "
+        "(default: $AAAJ_EMBEDDING_MODEL or all-MiniLM-L6-v2)",
+    )
+    parser.add_argument(
+        "--embedding_backend",
+        type=str,
+        default=None,
+        choices=["torch", "onnx"],
+        help="Run the embedding model with torch, or quantised to int8 with "
+        "onnxruntime (default: $AAAJ_EMBEDDING_BACKEND or torch)",
+    )
+    parser.add_argument(
+        "--shard_graph",
+        action="store_true",
+        help="Split the graph and tags by top-level package, for very large workspaces",
+    )
+    parser.add_argument(
+        "--shard_cache_mb",
+        type=int,
+        default=512,
+        help="Memory for the packages of a sharded graph loaded at once",
+    )
+    parser.add_argument(
+        "--export_tags_json",
+        action="store_true",
+        help="Also write the tags as indented tags.json, for debugging",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild the graph, tags and structure even if they already exist",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+
+    benchmark_dir = Path(args.benchmark_dir)
+    agent_config = AgentConfig(
+        include_dirs=args.include_dirs,
+        exclude_dirs=args.exclude_dirs,
+        exclude_files=args.exclude_files,
+        setting=args.setting,
+        judge_dir=benchmark_dir
+        / f"judgment/{args.developer_agent}/agent_as_a_judge/{args.setting}",
+        workspace_dir=benchmark_dir / f"workspaces/{args.developer_agent}",
+        instance_dir=benchmark_dir / "devai/instances",
+        trajectory_file=benchmark_dir / f"trajectories/{args.developer_agent}",
+        artifact_store=(
+            None
+            if args.no_artifact_store
+            else Path(args.artifact_store or benchmark_dir / "judgment/.artifact_store")
+        ),
+        export_tags_json=args.export_tags_json,
+        respect_gitignore=args.respect_gitignore,
+        max_file_size=args.max_file_size,
+        max_dir_entries=args.max_dir_entries,
+        embedding_model=args.embedding_model,
+        embedding_backend=args.embedding_backend,
+        shard_graph=args.shard_graph,
+        shard_cache_mb=args.shard_cache_mb,
+    )
+
+    main(
+        agent_config=agent_config,
+        logger=logger,
+        num_workers=args.num_workers,
+        embeddings=not args.no_embeddings,
+        force=args.force,
+    )
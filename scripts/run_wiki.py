@@ -1327,6 +1327,17 @@ def parse_arguments():
         choices=["planning", "comprehensive (no planning)", "efficient (no planning)"],
         help="Planning strategy"
     )
+    parser.add_argument(
+        "--shard_graph",
+        action="store_true",
+        help="Split the graph and tags by top-level package, for very large repositories"
+    )
+    parser.add_argument(
+        "--shard_cache_mb",
+        type=int,
+        default=512,
+        help="Memory for the packages of a sharded graph loaded at once"
+    )
     
     return parser.parse_args()
 
@@ -1387,6 +1398,8 @@ def main():
             judge_dir=judge_dir,
             workspace_dir=repo_dir.parent,
             instance_dir=judge_dir,
+            shard_graph=args.shard_graph,
+            shard_cache_mb=args.shard_cache_mb,
         )
         
         logger.info(f"Agent configuration: include={agent_config.include_dirs}, exclude={agent_config.exclude_dirs}, "
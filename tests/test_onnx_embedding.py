@@ -0,0 +1,54 @@
+import pytest
+
+from agent_as_a_judge.module.embedding_service import embedding_model_name
+
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from agent_as_a_judge.module.onnx_embedding import OnnxEmbedder  # noqa: E402
+
+
+# The int8 graph must stay this close to the torch model for every text
+MIN_COSINE = 0.99
+
+TEXTS = [
+    "def load_text_embeddings(self, embedding_file): return np.load(embedding_file)",
+    "class JudgeWorkQueue: a SQLite-backed job queue shared by judge workers",
+    "The dataset is split into training and test sets before preprocessing.",
+    "Save the trained model weights to models/saved_models/ after training.",
+    "import torch\nfrom sentence_transformers import SentenceTransformer",
+    "Plot the confusion matrix and save it as results/figures/confusion.png",
+    "for start in range(0, len(order), batch_size):\n    batch = order[start:]",
+    "x",
+]
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+
+    from sentence_transformers import SentenceTransformer
+
+    name = embedding_model_name()
+    try:
+        reference = SentenceTransformer(name, device="cpu")
+    except OSError as e:
+        pytest.skip(f"Embedding model {name} is unavailable: {e}")
+    onnx_model = OnnxEmbedder(name, cache_dir=tmp_path_factory.mktemp("onnx"))
+    return reference, onnx_model
+
+
+def test_int8_onnx_embeddings_match_the_reference(models):
+
+    reference, onnx_model = models
+    expected = reference.encode(TEXTS, normalize_embeddings=True)
+    found = onnx_model.encode(TEXTS, normalize_embeddings=True)
+
+    assert found.shape == expected.shape
+    cosines = (expected * found).sum(axis=1)
+    assert cosines.min() >= MIN_COSINE, (
+        f"ONNX embeddings diverge from {embedding_model_name()}: cosine "
+        f"{cosines.min():.4f} < {MIN_COSINE} for {TEXTS[int(cosines.argmin())]!r}"
+    )
+
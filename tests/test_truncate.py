@@ -0,0 +1,20 @@
+import tiktoken
+import pytest
+
+from agent_as_a_judge.utils.truncate import count_tokens, get_encoding, truncate_string
+
+
+@pytest.mark.parametrize("model", [None, "", "openai/not-a-tiktoken-model"])
+def test_unknown_models_fall_back_to_cl100k_base(model):
+
+    assert get_encoding(model).name == "cl100k_base"
+    assert count_tokens("def main(): pass", model=model) > 0
+
+
+def test_truncate_without_a_model():
+
+    text = "token " * 100
+    truncated = truncate_string(text, model=None, max_tokens=10)
+
+    assert len(tiktoken.get_encoding("cl100k_base").encode(truncated)) <= 12
+    assert "..." in truncated
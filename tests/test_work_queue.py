@@ -0,0 +1,122 @@
+import time
+import multiprocessing
+
+from agent_as_a_judge.module.work_queue import (
+    DONE,
+    LEASED,
+    PENDING,
+    JudgeWorkQueue,
+)
+
+
+JOBS = [("OpenHands", "black_box", f"{i:02d}_task") for i in range(20)]
+
+
+def drain(db_path, worker_id, results):
+
+    queue = JudgeWorkQueue(db_path)
+    while True:
+        job = queue.acquire(worker_id)
+        if job is None:
+            return
+        results.put((worker_id, job.job_id))
+        queue.complete(job, {"worker": worker_id})
+
+
+def test_workers_competing_for_acquire_never_share_a_job(tmp_path):
+
+    db_path = tmp_path / "queue.db"
+    JudgeWorkQueue(db_path).enqueue(JOBS)
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=drain, args=(db_path, f"worker-{i}", results))
+        for i in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    leased = [results.get(timeout=30) for _ in JOBS]
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+
+    job_ids = [job_id for _, job_id in leased]
+    assert sorted(job_ids) == sorted(JudgeWorkQueue.make_job_id(*job) for job in JOBS)
+    assert len(set(job_ids)) == len(job_ids)
+    assert JudgeWorkQueue(db_path).counts()[DONE] == len(JOBS)
+
+
+def test_two_queues_on_one_file_lease_distinct_jobs(tmp_path):
+
+    db_path = tmp_path / "queue.db"
+    first, second = JudgeWorkQueue(db_path), JudgeWorkQueue(db_path)
+    first.enqueue(JOBS[:2])
+
+    a = first.acquire("a")
+    b = second.acquire("b")
+    assert a.job_id != b.job_id
+    assert first.acquire("a") is None
+    assert second.counts()[LEASED] == 2
+
+
+def test_expired_lease_is_requeued(tmp_path):
+
+    queue = JudgeWorkQueue(tmp_path / "queue.db", lease_seconds=0.05)
+    queue.enqueue(JOBS[:1])
+
+    job = queue.acquire("stalled")
+    assert queue.counts()[LEASED] == 1
+    time.sleep(0.1)
+
+    assert queue.requeue_expired() == 1
+    assert queue.counts()[PENDING] == 1
+    assert not queue.heartbeat(job)
+
+    retry = queue.acquire("healthy")
+    assert retry.job_id == job.job_id
+    assert retry.attempts == 2
+    assert retry.lease_token != job.lease_token
+
+
+def test_expired_lease_fails_after_max_attempts(tmp_path):
+
+    queue = JudgeWorkQueue(tmp_path / "queue.db", lease_seconds=0.05, max_attempts=1)
+    queue.enqueue(JOBS[:1])
+
+    queue.acquire("stalled")
+    time.sleep(0.1)
+    assert queue.acquire("healthy") is None
+    assert queue.is_drained()
+
+
+def test_complete_is_first_wins_after_a_lost_lease(tmp_path):
+
+    queue = JudgeWorkQueue(tmp_path / "queue.db", lease_seconds=0.05)
+    queue.enqueue(JOBS[:1])
+
+    stale = queue.acquire("stalled")
+    time.sleep(0.1)
+    queue.lease_seconds = 600.0
+    fresh = queue.acquire("healthy")
+    assert fresh.job_id == stale.job_id
+
+    assert queue.complete(fresh, {"worker": "healthy"})
+    assert not queue.complete(stale, {"worker": "stalled"})
+    assert not queue.fail(stale, "late error")
+    assert queue.counts()[DONE] == 1
+
+
+def test_complete_from_a_lost_lease_wins_when_first(tmp_path):
+
+    queue = JudgeWorkQueue(tmp_path / "queue.db", lease_seconds=0.05)
+    queue.enqueue(JOBS[:1])
+
+    stale = queue.acquire("stalled")
+    time.sleep(0.1)
+    queue.lease_seconds = 600.0
+    fresh = queue.acquire("healthy")
+
+    assert queue.complete(stale, {"worker": "stalled"})
+    assert not queue.complete(fresh, {"worker": "healthy"})
+    assert not queue.heartbeat(fresh)
+    assert queue.is_drained()